@@ -1,14 +1,26 @@
 # 文件: src/app.py
 
+import asyncio
+import hmac
 import os
+import sqlite3
 import sys
-import json
-import re
+import threading
 import time
+import uuid
 from datetime import datetime
-import requests
-import certifi
-from flask import Flask, render_template, request, jsonify, session
+from functools import wraps
+from flask import Flask, render_template, request, jsonify, session, g
+
+# 将当前目录添加到 sys.path，以便 gunicorn (src.app:app) 与 PyInstaller 都能找到同目录下的模块
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.insert(0, current_dir)
+
+# 日志与指标模块只依赖标准库 (config 缺失时有默认值)，不参与下面的降级处理
+from observability import get_logger, span, observe, render_metrics
+
+logger = get_logger(__name__)
 
 
 # --- 1. 路径智能检测与设置 (这是唯一需要定义路径的地方) ---
@@ -22,8 +34,10 @@ def get_resource_path(relative_path):
 
 
 def get_writable_path(relative_path):
-    """ 获取一个可写入的路径，始终以可执行文件或主脚本的位置为基准 """
-    if getattr(sys, 'frozen', False):
+    """ 获取一个可写入的路径，始终以可执行文件或主脚本的位置为基准 (可用环境变量 Q_ITS_DATA_DIR 覆盖) """
+    if os.getenv("Q_ITS_DATA_DIR"):
+        base_path = os.getenv("Q_ITS_DATA_DIR")
+    elif getattr(sys, 'frozen', False):
         base_path = os.path.dirname(sys.executable)
     else:
         base_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
@@ -37,28 +51,27 @@ LOGS_DIR = get_writable_path('logs')
 # 确保日志目录存在
 try:
     os.makedirs(LOGS_DIR, exist_ok=True)
-    print(f"日志目录已确认/创建于: {LOGS_DIR}")
+    logger.info("日志目录已确认/创建于: %s", LOGS_DIR)
 except OSError as e:
-    print(f"错误：无法创建日志目录 {LOGS_DIR}。错误信息: {e}")
+    logger.error("无法创建日志目录 %s。错误信息: %s", LOGS_DIR, e)
 
 # --- 2. 模块导入与容错处理 (您的优秀设计) ---
 try:
-    # 将当前目录添加到 sys.path 以帮助 PyInstaller 找到模块
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    if current_dir not in sys.path:
-        sys.path.insert(0, current_dir)
-
     import config
     from quantum import calculate_mastery_from_log
+    from quantum_jobs import get_job_manager, JOB_DONE, JOB_FAILED
+    from mastery_cache import get_mastery_cache
+    from question_prefetch import QuestionPrefetcher
+    from session_store import create_session_interface
 
-    print("成功导入 config 和 quantum 模块")
+    logger.info("成功导入 config 和 quantum 模块")
 
 except ImportError as e:
-    print(f"致命错误：无法导入核心模块: {e}")
+    logger.critical("无法导入核心模块: %s", e)
 
 
     # 创建降级函数和配置
-    def calculate_mastery_from_log(data):
+    def calculate_mastery_from_log(data, backend=None):
         return {"score": 0.0,
                 "feedback": {"level": "错误", "comment": "量子模块加载失败", "suggestion": f"请检查后台服务日志: {e}"}}
 
@@ -66,49 +79,201 @@ except ImportError as e:
     class MockConfig:
         DIFY_API_KEY = ""
         DIFY_API_URL = ""
+        DIFY_RESPONSE_MODE = "blocking"
+        QUESTION_PREFETCH_ENABLED = False
+        QUESTION_PARSE_RETRIES = 1
+        QUANTUM_BACKEND_CHOICES = ()
+        QUANTUM_JOB_DB_FILE = None
+        SESSION_BACKEND = "cookie"
+        SESSION_DB_FILE = ""
+        ANALYTICS_DB_FILE = os.path.join("logs", "analytics.sqlite3")
+        ADMIN_TOKEN = None
 
 
     config = MockConfig()
 
+
+    class FailedJobManager:
+        def submit(self, session_data, backend=None, owner=None, session_key=None):
+            return {"job_id": None, "status": "failed", "result": calculate_mastery_from_log(session_data)}
+
+        def get(self, job_id):
+            return None
+
+
+    def get_job_manager(db_path=None):
+        return FailedJobManager()
+
+
+    JOB_DONE, JOB_FAILED = "done", "failed"
+
+
+    def get_mastery_cache():
+        return None
+
+
+    QuestionPrefetcher = None
+
+
+    def create_session_interface(backend, db_path=None):
+        return None
+
+# 日志写入、题目解析与限流模块只依赖标准库，不参与上面的降级处理
+# (Dify 客户端、统计索引、cqlib 与 numpy 都在首次使用时才导入，以缩短启动与 worker 创建时间)
+from session_log import SessionLogWriter
+from question_parser import parse_question_package, QuestionParseError
+from rate_limit import UpstreamBusyError, get_rate_limiter, get_upstream_limiter
+
 # --- 3. Flask 应用初始化 ---
 app = Flask(__name__, template_folder=template_dir)
 app.secret_key = os.urandom(24)
+# 会话数据保存在服务端，cookie 中只有会话 id (见 config.SESSION_BACKEND)
+session_interface = create_session_interface(config.SESSION_BACKEND, get_writable_path(config.SESSION_DB_FILE))
+if session_interface is not None:
+    app.session_interface = session_interface
+    logger.info("使用服务端会话存储: %s", config.SESSION_BACKEND)
+# 量子任务快照写入多个 worker 共享的 SQLite 文件 (见 config.QUANTUM_JOB_DB_FILE)
+JOB_DB_PATH = get_writable_path(config.QUANTUM_JOB_DB_FILE) if config.QUANTUM_JOB_DB_FILE else None
+
+
+def get_dify_response(topic, user_id, conversation_id=None, response_mode=None, limiter="dify"):
+    response_mode = response_mode or config.DIFY_RESPONSE_MODE
+    logger.info("准备向 Dify 发送请求 - 主题: %s, 用户: %s, 会话: %s, 模式: %s",
+                topic, user_id, conversation_id, response_mode)
+    try:
+        # requests/urllib3 较重，第一次出题时才导入 Dify 客户端
+        import dify_api
+    except ImportError as e:
+        logger.error("Dify 客户端加载失败: %s", e)
+        return None
+    try:
+        # 共享连接池的客户端，streaming 模式下题目 JSON 一完整就返回；
+        # 并发名额与排队都满时抛出 UpstreamBusyError，由调用方回 429；预取池使用独立的 "dify_prefetch" 名额
+        with get_upstream_limiter(limiter).slot(), span("dify_call", mode=response_mode):
+            return dify_api.get_dify_client().generate_question(topic, user_id, conversation_id,
+                                                                response_mode=response_mode)
+    except dify_api.DIFY_ERRORS as e:
+        logger.error("Dify API 调用失败: %s", e)
+        if hasattr(e, 'response') and e.response is not None:
+            logger.error("响应状态码: %s, 响应内容: %s", e.response.status_code, e.response.text)
+        return None
+
 
+# ASGI 部署 (src/asgi_app.py) 时由 install_async_dify 注册绑定在 uvicorn 事件循环上的异步 Dify 客户端与并发上限，
+# 出题视图中的 Dify 调用直接在该事件循环上等待，不占用线程
+_async_dify = None
 
-def get_dify_response(topic, user_id, conversation_id=None):
-    headers = {"Authorization": f"Bearer {config.DIFY_API_KEY}", "Content-Type": "application/json"}
-    payload = {"inputs": {"topic": topic}, "query": f"请围绕 {topic} 这个主题，生成一道相关的单项选择题。",
-               "user": user_id, "response_mode": "blocking", "conversation_id": conversation_id}
-    print(f"\n--- 准备向 Dify 发送请求 ---\nPayload: {json.dumps(payload, ensure_ascii=False, indent=2)}")
+
+def install_async_dify(client, limiter):
+    """ 在事件循环中调用；之后在同一个事件循环上运行的出题视图都改用 client 调用 Dify """
+    global _async_dify
+    _async_dify = (asyncio.get_running_loop(), client, limiter)
+
+
+async def request_dify_response(topic, user_id, conversation_id=None, response_mode=None):
+    """ 出题视图调用 Dify: 已注册异步客户端时在事件循环上等待，否则 (gunicorn 同步部署) 在线程中调用 get_dify_response """
+    if _async_dify is None or _async_dify[0] is not asyncio.get_running_loop():
+        return await asyncio.to_thread(get_dify_response, topic, user_id, conversation_id, response_mode)
+    _, client, limiter = _async_dify
+    response_mode = response_mode or config.DIFY_RESPONSE_MODE
+    logger.info("准备向 Dify 发送请求 - 主题: %s, 用户: %s, 会话: %s, 模式: %s",
+                topic, user_id, conversation_id, response_mode)
+    # httpx 较重，只有 ASGI 部署会用到
+    from dify_async import ASYNC_DIFY_ERRORS
     try:
-        # --- CRITICAL FIX: 添加 verify=certifi.where() ---
-        # 2. 在 post 请求中，明确指定使用 certifi 提供的证书进行验证
-        response = requests.post(config.DIFY_API_URL, headers=headers, json=payload, timeout=120, verify=certifi.where())
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"!!! Dify API 调用失败: {e}")
-        if hasattr(e, 'response') and e.response is not None:
-             print(f"    响应状态码: {e.response.status_code}\n    响应内容: {e.response.text}")
+        # 并发名额与排队都满时抛出 UpstreamBusyError，由 errorhandler 回 429
+        async with limiter.slot():
+            with span("dify_call", mode=response_mode):
+                return await client.generate_question(topic, user_id, conversation_id, response_mode=response_mode)
+    except ASYNC_DIFY_ERRORS as e:
+        logger.error("Dify API 调用失败: %s", e)
         return None
 
 
-def clean_and_parse_json(raw_string):
-    if not isinstance(raw_string, str): return None
-    match = re.search(r'\{.*\}', raw_string, re.DOTALL)
-    if not match: return None
+def parse_dify_answer(raw_answer):
+    """ 提取并校验题目 JSON (见 question_parser)，失败时返回 None """
+    with span("json_extract") as labels:
+        try:
+            question_package, labels["repair"] = parse_question_package(raw_answer)
+        except QuestionParseError as e:
+            labels["repair"] = "failed"
+            logger.warning("题目解析失败: %s, 原始回复: %.500s", e, raw_answer)
+            return None
+    if labels["repair"] != "none":
+        logger.info("题目 JSON 经本地修复后可用: %s", labels["repair"])
+    return question_package
+
+
+PREFETCH_USER_ID = "q-its-prefetch"
+
+
+def fetch_question_for_pool(topic):
+    """ 供预取池在后台调用: 使用独立的用户与新会话生成一道题，并做与在线出题相同的校验 """
     try:
-        return json.loads(match.group(0))
-    except json.JSONDecodeError as e:
-        print(f"JSON 解析失败: {e}\n原始字符串: {match.group(0)}")
+        dify_response = get_dify_response(topic, PREFETCH_USER_ID, limiter="dify_prefetch")
+    except UpstreamBusyError:
+        return None
+    if not dify_response: return None
+    return parse_dify_answer(dify_response.get('answer', ''))
+
+
+# 下面几个后台组件都在首次使用时创建 (gunicorn fork 之后)；多线程 worker 中首个请求可能并发到达，
+# 与 get_job_manager / get_device_manager 一样在锁内创建，保证每个进程只有一个实例
+_singleton_lock = threading.Lock()
+_prefetcher = None
+
+
+def get_prefetcher():
+    """ 题目预取池，首次使用时创建；未启用时返回 None """
+    global _prefetcher
+    if QuestionPrefetcher is None or not config.QUESTION_PREFETCH_ENABLED:
         return None
+    with _singleton_lock:
+        if _prefetcher is None:
+            _prefetcher = QuestionPrefetcher(fetch_question_for_pool)
+        return _prefetcher
+
+
+_log_writer = None
 
 
-def write_log(filename, data):
-    # 此函数现在会使用在文件顶部定义的、正确的 LOGS_DIR
-    filepath = os.path.join(LOGS_DIR, filename)
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+def get_log_writer():
+    """ 后台日志写线程，首次使用时创建 """
+    global _log_writer
+    with _singleton_lock:
+        if _log_writer is None:
+            # 此处会使用在文件顶部定义的、正确的 LOGS_DIR
+            _log_writer = SessionLogWriter(LOGS_DIR)
+        return _log_writer
+
+
+def log_event(event_type, **fields):
+    """ 向当前会话的 .jsonl 日志追加一条事件，不阻塞请求 """
+    get_log_writer().append(session['log_filename'], event_type, **fields)
+
+
+_analytics = None
+
+
+def get_analytics():
+    """ 日志统计索引，首次使用时创建并启动后台增量导入 (查询接口不再在请求中导入) """
+    global _analytics
+    with _singleton_lock:
+        if _analytics is None:
+            from log_analytics import LogAnalytics
+            _analytics = LogAnalytics(get_writable_path(config.ANALYTICS_DB_FILE), LOGS_DIR)
+            _analytics.start_background_ingest()
+        return _analytics
+
+
+def record_quantum_analysis(quantum_result):
+    session['session_data']['quantum_analysis'] = quantum_result
+    session.modified = True
+    logger.info("正在将量子分析结果写入日志文件: %s", session['log_filename'])
+    log_event("quantum_analysis", result=quantum_result)
+    # 会话结束时在后台生成一次完整的 session_{timestamp}.json 视图
+    get_log_writer().materialize(session['log_filename'])
+    logger.debug("量子计算和日志记录完成，会话将保留用于后续操作。")
 
 
 def calculate_3d_feature(difficulty, is_correct, time_taken):
@@ -125,41 +290,113 @@ def calculate_3d_feature(difficulty, is_correct, time_taken):
     return {"difficulty": difficulty, "correctness": 1 if is_correct else 0, "performance_code": performance_code}
 
 
+def current_user_id():
+    """ 每个浏览器会话一个匿名用户 id，作为 Dify 的 user 与限流的键 """
+    if 'user_id' not in session:
+        session['user_id'] = f"q-its-{uuid.uuid4().hex[:16]}"
+    return session['user_id']
+
+
+def clear_session():
+    """ 清空会话数据，保留用户 id (刷新页面或换主题不应重置限流) """
+    user_id = session.get('user_id')
+    session.clear()
+    if user_id:
+        session['user_id'] = user_id
+
+
+def too_many_requests(message, retry_after):
+    response = jsonify({"error": message, "retry_after": retry_after})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, round(retry_after)))
+    return response
+
+
+def check_rate_limit(kind):
+    """ 按当前用户扣减 kind ("question" / "analysis") 的令牌；超出时返回 429 响应，否则返回 None """
+    limiter = get_rate_limiter(kind)
+    wait = limiter.acquire(current_user_id()) if limiter else 0.0
+    if wait:
+        logger.info("用户 %s 的 %s 请求过于频繁，需等待 %.1f 秒", current_user_id(), kind, wait)
+        return too_many_requests(f"请求过于频繁，请 {max(1, round(wait))} 秒后再试", wait)
+    return None
+
+
 # --- 5. Flask 路由 ---
+@app.errorhandler(UpstreamBusyError)
+def upstream_busy(e):
+    return too_many_requests(f"服务繁忙 ({e.upstream})，请 {e.retry_after} 秒后再试", e.retry_after)
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_duration(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        observe("http_request", time.perf_counter() - started, endpoint=request.endpoint or "(unmatched)",
+                status=response.status_code)
+    return response
+
+
 @app.route('/')
 def index():
-    print("访问主页 /，清理旧会话。")
-    session.clear()
+    logger.debug("访问主页 /，清理旧会话。")
+    clear_session()
     return render_template('index.html')
 
 
-@app.route('/generate-question', methods=['POST'])
-def generate_question():
-    print("收到请求 /generate-question")
-    data = request.get_json()
-    topic = data.get('topic')
-    is_strengthening = data.get('is_strengthening', False)
+def prepare_question_session(topic, is_strengthening):
     if is_strengthening and 'session_data' in session:
-        print(f"识别为“继续强化”请求，主题: {session.get('topic')}")
+        logger.info("识别为“继续强化”请求，主题: %s", session.get('topic'))
         session['session_data']['session_log'] = []
         session['session_data']['quantum_analysis'] = None
         session['start_time'] = time.time()
+        log_event("session_reset")
     elif 'log_filename' not in session or session.get('topic') != topic:
-        print(f"识别为新主题测试: {topic}。正在创建全新会话。")
-        session.clear()
+        logger.info("识别为新主题测试: %s。正在创建全新会话。", topic)
+        clear_session()
         now = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        session['log_filename'] = f"session_{now}.json"
+        # 时间戳只精确到秒，同一秒开始的两个会话靠随机后缀区分，否则两人的事件会追加进同一个 .jsonl
+        session['log_filename'] = f"session_{now}_{uuid.uuid4().hex[:8]}.json"
         session['session_data'] = {"topic": topic, "session_log": [], "quantum_analysis": None}
         session['topic'] = topic
         session['conversation_id'] = None
-    user_id = "q-its-user-01"
-    dify_response = get_dify_response(session['topic'], user_id, session.get('conversation_id'))
-    if not dify_response: return jsonify({"error": "从 Dify 服务获取数据失败, 请检查后端日志"}), 500
-    raw_answer = dify_response.get('answer', '')
-    session['conversation_id'] = dify_response.get('conversation_id')
-    question_package = clean_and_parse_json(raw_answer)
-    if not question_package or 'difficulty' not in question_package: return jsonify(
-        {"error": "解析 Dify 返回的数据失败，可能格式不正确"}), 500
+        log_event("session_started", topic=topic)
+
+
+@app.route('/generate-question', methods=['POST'])
+async def generate_question():
+    logger.debug("收到请求 /generate-question")
+    limited = check_rate_limit("question")
+    if limited: return limited
+    data = request.get_json()
+    prepare_question_session(data.get('topic'), data.get('is_strengthening', False))
+    user_id = current_user_id()
+    prefetcher = get_prefetcher()
+    # 预取的题目不在学生自己的 Dify 会话中生成，跳过本次会话已经出过的题目
+    served = {entry.get('question_text') for entry in session['session_data']['session_log']}
+    question_package = prefetcher.take(session['topic'], exclude=served) if prefetcher else None
+    if question_package:
+        logger.info("命中主题 '%s' 的预取题目池。", session['topic'])
+    else:
+        # 回复无法解析时最多重新生成 config.QUESTION_PARSE_RETRIES 次
+        for attempt in range(config.QUESTION_PARSE_RETRIES + 1):
+            # ?mode=blocking|streaming 可按请求覆盖 config.DIFY_RESPONSE_MODE
+            dify_response = await request_dify_response(session['topic'], user_id, session.get('conversation_id'),
+                                                        response_mode=request.args.get('mode'))
+            if not dify_response: return jsonify({"error": "从 Dify 服务获取数据失败, 请检查后端日志"}), 500
+            session['conversation_id'] = dify_response.get('conversation_id')
+            question_package = parse_dify_answer(dify_response.get('answer', ''))
+            if question_package:
+                break
+            if attempt < config.QUESTION_PARSE_RETRIES:
+                logger.info("Dify 返回的题目无法解析，重新生成 (第 %d 次重试)。", attempt + 1)
+        else:
+            return jsonify({"error": "解析 Dify 返回的数据失败，可能格式不正确"}), 500
     question_num = len(session['session_data']['session_log']) + 1
     session_entry = {"question_num": question_num, "question_text": question_package.get('question'),
                      "options": question_package.get('options'),
@@ -170,52 +407,127 @@ def generate_question():
     session['session_data']['session_log'].append(session_entry)
     session['start_time'] = time.time()
     session.modified = True
-    write_log(session['log_filename'], session['session_data'])
+    log_event("question", entry=session_entry)
     return jsonify({"question_text": session_entry["question_text"], "options": session_entry["options"]})
 
 
 @app.route('/submit-answer', methods=['POST'])
 def submit_answer():
-    print("收到请求 /submit-answer")
+    logger.debug("收到请求 /submit-answer")
     if 'session_data' not in session: return jsonify({"error": "会话已过期，请刷新页面重试"}), 400
     data = request.get_json()
     user_answer_key = data.get('answer')
     time_taken = time.time() - session.get('start_time', time.time())
     current_question = session['session_data']['session_log'][-1]
     is_correct = (user_answer_key == current_question['correct_answer'])
-    current_question.update(
-        {'user_answer': user_answer_key, 'is_correct': is_correct, 'time_taken': round(time_taken, 2),
-         'feature_3d': calculate_3d_feature(current_question['difficulty'], is_correct, time_taken)})
+    answer_update = {'user_answer': user_answer_key, 'is_correct': is_correct, 'time_taken': round(time_taken, 2),
+                     'feature_3d': calculate_3d_feature(current_question['difficulty'], is_correct, time_taken)}
+    current_question.update(answer_update)
     session.modified = True
-    write_log(session['log_filename'], session['session_data'])
+    log_event("answer", question_num=current_question['question_num'], update=answer_update)
     return jsonify({"status": "ok"})
 
 
 @app.route('/end-session', methods=['POST'])
 def end_session():
-    print("收到请求 /end-session")
+    logger.debug("收到请求 /end-session")
     if 'session_data' not in session: return jsonify({"error": "会话已过期或无数据"}), 400
     return jsonify(session.get('session_data', {}).get('session_log', []))
 
 
 @app.route('/get-quantum-analysis', methods=['POST'])
 def get_quantum_analysis():
-    print("收到请求 /get-quantum-analysis")
+    logger.debug("收到请求 /get-quantum-analysis")
     if 'session_data' not in session or 'log_filename' not in session: return jsonify(
         {"error": "无法找到会话信息以记录量子分析结果"}), 400
     session_log_from_frontend = request.get_json()
     if not session_log_from_frontend: return jsonify({"error": "未提供用于分析的数据"}), 400
-    quantum_result = calculate_mastery_from_log(session_log_from_frontend)
-    session['session_data']['quantum_analysis'] = quantum_result
-    print(f"正在将量子分析结果写入日志文件: {session['log_filename']}")
-    write_log(session['log_filename'], session['session_data'])
-    print("量子计算和日志记录完成，会话将保留用于后续操作。")
-    return jsonify(quantum_result)
+    limited = check_rate_limit("analysis")
+    if limited: return limited
+    # 可通过 ?backend=... 在 config.QUANTUM_BACKEND_CHOICES 允许的范围内按请求选择量子后端，默认使用 config.QUANTUM_BACKEND
+    # 云端任务在后台线程中提交和轮询，这里立即返回 job_id (HTTP 202)，前端轮询 /quantum-jobs/<job_id>
+    backend = request.args.get('backend')
+    if backend and backend not in config.QUANTUM_BACKEND_CHOICES:
+        return jsonify({"error": f"不允许的量子后端: '{backend}'"}), 400
+    try:
+        job = get_job_manager(JOB_DB_PATH).submit(session_log_from_frontend, backend=backend,
+                                                  owner=current_user_id(), session_key=session['log_filename'])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if job['status'] in (JOB_DONE, JOB_FAILED):
+        record_quantum_analysis(job['result'])
+        return jsonify(dict(job['result'], job_id=job['job_id'], status=job['status']))
+    logger.info("量子分析任务已入队: %s", job['job_id'])
+    return jsonify({"job_id": job['job_id'], "status": job['status']}), 202
+
+
+@app.route('/quantum-jobs/<job_id>', methods=['GET'])
+def get_quantum_job(job_id):
+    job = get_job_manager(JOB_DB_PATH).get(job_id)
+    if not job or job['owner'] != current_user_id():
+        return jsonify({"error": "找不到该量子分析任务"}), 404
+    if job['status'] not in (JOB_DONE, JOB_FAILED):
+        return jsonify({"job_id": job_id, "status": job['status']}), 202
+    # 只记入发起任务的那个会话 (同一个日志文件): 任务执行期间学生可能已经开始了新的主题
+    if ('session_data' in session and session.get('log_filename') == job.get('session_key')
+            and session['session_data'].get('quantum_analysis') != job['result']):
+        record_quantum_analysis(job['result'])
+    return jsonify(dict(job['result'], job_id=job_id, status=job['status']))
+
+
+@app.route('/quantum-cache/stats', methods=['GET'])
+def quantum_cache_stats():
+    cache = get_mastery_cache()
+    if cache is None: return jsonify({"error": "量子模块加载失败，缓存不可用"}), 503
+    return jsonify(cache.stats())
+
+
+def require_admin(view):
+    """ 管理接口: 校验 Authorization: Bearer <config.ADMIN_TOKEN>；未配置令牌时一律拒绝 """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not config.ADMIN_TOKEN:
+            return jsonify({"error": "管理接口未启用 (未配置 Q_ITS_ADMIN_TOKEN)"}), 403
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() != 'bearer' or not hmac.compare_digest(token.strip().encode(), config.ADMIN_TOKEN.encode()):
+            return jsonify({"error": "需要管理员令牌"}), 401, {"WWW-Authenticate": "Bearer"}
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@app.route('/analytics/topics', methods=['GET'])
+@require_admin
+def analytics_topics():
+    # 索引由后台线程增量导入，"ingest" 为最近一次导入的结果 (刚启动时可能为 null)
+    analytics = get_analytics()
+    try:
+        return jsonify({"ingest": analytics.last_ingest, "topics": analytics.topic_summary()})
+    except sqlite3.OperationalError as e:
+        logger.warning("查询统计索引失败: %s", e)
+        return jsonify({"error": "统计索引暂时不可用，请稍后重试"}), 503
+
+
+@app.route('/analytics/difficulty', methods=['GET'])
+@require_admin
+def analytics_difficulty():
+    analytics = get_analytics()
+    try:
+        return jsonify({"ingest": analytics.last_ingest,
+                        "difficulty": analytics.difficulty_summary(request.args.get('topic'))})
+    except sqlite3.OperationalError as e:
+        logger.warning("查询统计索引失败: %s", e)
+        return jsonify({"error": "统计索引暂时不可用，请稍后重试"}), 503
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """ Prometheus 文本格式的耗时直方图 (本 worker 进程) """
+    return render_metrics(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
 
 
 # --- 6. 应用启动入口 ---
 if __name__ == '__main__':
-    print("Flask 应用直接启动 (用于Web开发调试)...")
+    logger.info("Flask 应用直接启动 (用于Web开发调试)...")
     if not config.DIFY_API_KEY in config.DIFY_API_KEY:
-        print("!!! 警告: Dify API Key 未在 config.py 中正确配置! !!!")
+        logger.warning("Dify API Key 未在 config.py 中正确配置!")
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
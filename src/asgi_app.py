@@ -0,0 +1,80 @@
+# 文件: src/asgi_app.py
+#
+# ASGI 部署入口，与 src.app:app (gunicorn 同步 worker) 并存:
+#   uvicorn src.asgi_app:app --workers 2
+#   - Flask 应用由 asgiref.wsgi.WsgiToAsgi 包装，每个请求在自己的线程中执行 (ThreadSensitiveContext)，
+#     不会排在同一个共享线程后面;
+#   - 启动时把 dify_async.AsyncDifyClient 注册给 app.install_async_dify: 异步出题视图 (app.generate_question)
+#     中的 Dify 调用 (含回复无法解析时的重新生成) 由 uvicorn 的事件循环执行，所有请求共享同一个连接池;
+#   - 同时进行的 Dify 请求最多 config.ASGI_DIFY_CONCURRENCY 个，另有最多 config.ASGI_DIFY_MAX_QUEUE 个
+#     在事件循环上排队，排队已满或超时时视图抛出 UpstreamBusyError，由 Flask 的 errorhandler 回 429;
+#   - 天衍任务本来就由 quantum_jobs 的后台线程池提交和轮询 (并发上限 config.QUANTUM_JOB_WORKERS)，
+#     /get-quantum-analysis 立即返回，不需要改动。
+# 注意这仍然是“每个请求一个线程”: 视图线程在 Dify 调用期间阻塞等待事件循环上的结果，并没有释放。
+# 因此同时执行的请求最多 config.ASGI_MAX_THREADS 个 (与 gunicorn --threads 相当)，超出的请求在事件循环上
+# 排队等待线程，不会无限制地创建线程；与 gunicorn gthread 部署的差别只在共享的异步 Dify 连接池与并发上限。
+
+import asyncio
+import contextvars
+import os
+import sys
+
+from asgiref.sync import ThreadSensitiveContext
+from asgiref.wsgi import WsgiToAsgi
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.insert(0, current_dir)
+
+import config
+from app import app as flask_app, install_async_dify
+from dify_async import AsyncDifyClient
+from rate_limit import AsyncConcurrencyLimiter
+
+
+class AsgiApp(object):
+
+    def __init__(self, dify_concurrency=None, dify_max_queue=None, max_threads=None):
+        self.dify_concurrency = dify_concurrency or config.ASGI_DIFY_CONCURRENCY
+        self.dify_max_queue = config.ASGI_DIFY_MAX_QUEUE if dify_max_queue is None else dify_max_queue
+        self.max_threads = max_threads or config.ASGI_MAX_THREADS
+        self._flask = WsgiToAsgi(flask_app)
+        self._threads = asyncio.Semaphore(self.max_threads)
+        self._dify = None
+
+    def _start(self):
+        # 在事件循环中首次使用时创建 (uvicorn 的每个 worker 进程各自一份；未发送 lifespan 时在第一个请求中创建)
+        if self._dify is None:
+            self._dify = AsyncDifyClient(pool_size=self.dify_concurrency)
+            install_async_dify(self._dify, AsyncConcurrencyLimiter("dify", self.dify_concurrency,
+                                                                   self.dify_max_queue, config.DIFY_QUEUE_TIMEOUT))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+        if scope["type"] != "http":
+            return
+        self._start()
+        async with self._threads:
+            # 每个请求在全新的 contextvars 上下文中执行: WsgiToAsgi 从 Flask 线程回调 send 时带着该线程的 asgiref 上下文，
+            # uvicorn 在 send 中恢复读取 keep-alive 连接，同一连接上的下一个请求会继承已经退出的线程执行器
+            await asyncio.create_task(self._handle(scope, receive, send), context=contextvars.Context())
+
+    async def _handle(self, scope, receive, send):
+        async with ThreadSensitiveContext():
+            await self._flask(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self._start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self._dify is not None:
+                    await self._dify.aclose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+app = AsgiApp()
@@ -1,11 +1,61 @@
 # C:\Files\Workbench\PythonProjects\Q_ITS\src\config.py
 
+import os
+
 # ==============================================================================
 # Dify AI 服务配置
 # ==============================================================================
 # 请将这里的 key 替换为您自己的 Dify 应用 API 密钥
 DIFY_API_KEY = "app-cPl9oy5CZJ4s4umWlA7SdjpT"
-DIFY_API_URL = "https://api.dify.ai/v1/chat-messages"
+# 可用环境变量 DIFY_API_URL 覆盖，例如压测时指向本地假 Dify 服务 (src/fake_dify.py)
+DIFY_API_URL = os.getenv("DIFY_API_URL", "https://api.dify.ai/v1/chat-messages")
+
+# "streaming" 模式消费 SSE 分块，题目 JSON 一完整就返回；"blocking" 等待完整回复
+DIFY_RESPONSE_MODE = "streaming"
+# 连接超时与读超时(秒)；streaming 模式下读超时是相邻两个分块之间的最长间隔
+DIFY_CONNECT_TIMEOUT = 5
+DIFY_READ_TIMEOUT = 120
+# 连接失败或 429/5xx 时的重试次数，以及连接池大小 (建议不小于每个 worker 的线程数)
+DIFY_MAX_RETRIES = 2
+DIFY_POOL_SIZE = 10
+# 每个进程同时进行的 Dify 请求数上限、最多排队的请求数与排队最长等待(秒)；排队已满或超时时立即返回 429
+DIFY_MAX_CONCURRENT = DIFY_POOL_SIZE
+DIFY_MAX_QUEUE = 32
+DIFY_QUEUE_TIMEOUT = 10
+# 题目预取池的后台生成另有独立的并发上限，不占用在线出题的名额；名额与排队都满时放弃这次预取
+DIFY_PREFETCH_MAX_CONCURRENT = 2
+DIFY_PREFETCH_MAX_QUEUE = 2
+DIFY_PREFETCH_QUEUE_TIMEOUT = 5
+
+# 按用户限流 (src/rate_limit.py): 每个浏览器会话有一个匿名 user_id (同时作为 Dify 的 user)，
+# 出题与量子分析各有一个令牌桶 (每秒补充的请求数, 可连续发出的请求数)，超出时返回 429 与 Retry-After；
+# 出题按快速作答 (平均每题几秒) 留足余量，只拦截脚本式的连续刷新；
+# 进程内最多跟踪 RATE_LIMIT_MAX_USERS 个用户。可用环境变量 RATE_LIMIT_ENABLED=0 关闭 (例如压测时)
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+RATE_LIMIT_QUESTION_RATE = 0.5
+RATE_LIMIT_QUESTION_BURST = 20
+RATE_LIMIT_ANALYSIS_RATE = 0.1
+RATE_LIMIT_ANALYSIS_BURST = 3
+RATE_LIMIT_MAX_USERS = 10000
+
+# Dify 回复中的题目 JSON 经本地修复 (见 src/question_parser.py) 仍无法通过校验时，自动重新生成的次数
+QUESTION_PARSE_RETRIES = 1
+
+# ASGI 部署 (uvicorn src.asgi_app:app，见 src/asgi_app.py): 出题时的 Dify 调用在事件循环上等待，
+# 每个进程同时进行的 Dify 请求数上限 (超出的请求在事件循环上排队)
+ASGI_DIFY_CONCURRENCY = int(os.getenv("ASGI_DIFY_CONCURRENCY", "200"))
+ASGI_DIFY_MAX_QUEUE = int(os.getenv("ASGI_DIFY_MAX_QUEUE", "1000"))
+# 每个请求仍占用一个线程 (等待 Dify 时阻塞在事件循环上的结果)，每个进程最多同时执行的请求数，超出的在事件循环上排队
+ASGI_MAX_THREADS = int(os.getenv("ASGI_MAX_THREADS", "64"))
+
+# 题目预取池: 每个主题最多预先生成并校验好的题目数量、最多保留的主题数、题目有效期(秒)与后台生成线程数
+# 每个主题的池容量随未命中次数按需增长到 QUESTION_PREFETCH_PER_TOPIC；预取会额外消耗 Dify 调用次数，
+# 关闭后每道题都实时生成 (题目在学生自己的 Dify 会话中生成，能看到之前的题目)
+QUESTION_PREFETCH_ENABLED = os.getenv("QUESTION_PREFETCH_ENABLED", "1") == "1"
+QUESTION_PREFETCH_PER_TOPIC = 3
+QUESTION_PREFETCH_MAX_TOPICS = 50
+QUESTION_PREFETCH_TTL = 1800
+QUESTION_PREFETCH_WORKERS = 4
 
 
 # ==============================================================================
@@ -20,11 +70,115 @@ MACHINE_QUBITS_MAP = {
 }
 TIANYAN_MACHINE_QUBITS = MACHINE_QUBITS_MAP.get(TIANYAN_MACHINE_NAME, 16)
 
+# 天衍平台实现: "cqlib" (真实云平台) 或 "fake" (src/fake_tianyan.py 本地假平台，用于压测与离线演示)
+# 假平台的结果延迟(秒)与提交失败概率；三者均可用同名环境变量覆盖
+TIANYAN_PLATFORM = os.getenv("TIANYAN_PLATFORM", "cqlib")
+FAKE_TIANYAN_LATENCY = float(os.getenv("FAKE_TIANYAN_LATENCY", "2.0"))
+FAKE_TIANYAN_FAILURE_RATE = float(os.getenv("FAKE_TIANYAN_FAILURE_RATE", "0.0"))
+
+# 设备路由 (src/device_manager.py): 云端任务在 MACHINE_QUBITS_MAP 中登记过比特数、状态为 running 的设备间
+# 选负载最低且比特数足够的一台，提交或查询失败时换下一台
+# 策略: "simulator_first" / "hardware_first" / "simulator_only" / "hardware_only"，
+#       "pinned" 只使用 TIANYAN_MACHINE_NAME (原来的行为)
+TIANYAN_DEVICE_POLICY = os.getenv("TIANYAN_DEVICE_POLICY", "simulator_first")
+# 属于模拟器的设备名 (请按平台实际设备列表调整)，其余设备视为真机
+TIANYAN_SIMULATORS = ("tianyan_sw", "tianyan_swn")
+# 设备状态缓存时间(秒)、出错设备暂停使用的时间(秒)、单个任务最多尝试的设备数
+TIANYAN_DEVICE_REFRESH = 60
+TIANYAN_DEVICE_COOLDOWN = 120
+TIANYAN_DEVICE_MAX_ATTEMPTS = 3
+# 每个进程同时进行的天衍平台调用 (提交、查询结果) 数上限、最多排队的调用数与排队最长等待(秒)；
+# 等待实验结果的轮询间隔中不占用名额
+TIANYAN_MAX_CONCURRENT = 4
+TIANYAN_MAX_QUEUE = 64
+TIANYAN_QUEUE_TIMEOUT = 30
+
 # 量子任务的测量次数 (shots)
 TIANYAN_NUM_SHOTS = 2048
 
+# 自适应 shots (src/shot_allocation.py，默认关闭): 每轮提交 TIANYAN_SHOT_INCREMENT 次测量，按置信度
+# TIANYAN_SHOT_CONFIDENCE 估计全 1 概率的区间，区间落在 get_mastery_feedback 的同一档内即停止；
+# 每个窗口最多 TIANYAN_MAX_SHOTS 次、最多 TIANYAN_MAX_SHOT_ROUNDS 轮 (每轮都是一次云端往返)。
+# 结论明显的会话可能只用一轮，精度低于固定 shots；关闭时每次固定提交 TIANYAN_NUM_SHOTS 次
+TIANYAN_ADAPTIVE_SHOTS = os.getenv("TIANYAN_ADAPTIVE_SHOTS", "0") == "1"
+TIANYAN_SHOT_INCREMENT = 1024
+TIANYAN_MAX_SHOTS = 8192
+TIANYAN_MAX_SHOT_ROUNDS = 4
+TIANYAN_SHOT_CONFIDENCE = 0.95
+
 # RY 门角度参数的浮点数精度，以避免超出平台字符限制
 TIANYAN_ANGLE_PRECISION = 12
+# 单次提交的 QCIS 文本字符上限 (请按平台实际限制调整)；超限时角度精度逐位降低，最低到 TIANYAN_MIN_ANGLE_PRECISION
+TIANYAN_QCIS_MAX_CHARS = 8000
+TIANYAN_MIN_ANGLE_PRECISION = 6
+
+# 量子计算后端: "cloud" (天衍云平台), "statevector" (本地 NumPy 态矢量模拟), "analytic" (闭式解析解)
+# 本地后端不占用云端配额，结果为精确概率
+QUANTUM_BACKEND = os.getenv("QUANTUM_BACKEND", "cloud")
+# 客户端可通过 /get-quantum-analysis?backend=... 选择的后端 (逗号分隔)；不在列表中的返回 400。
+# 默认只开放不占配额、开销可忽略的 analytic；cloud 消耗天衍配额，statevector 的内存随比特数指数增长
+QUANTUM_BACKEND_CHOICES = tuple(name for name in os.getenv("QUANTUM_BACKEND_CHOICES", "analytic").split(",") if name)
+
+# 本地态矢量模拟允许的最大比特数 (内存占用为 2^n 个复数)
+STATEVECTOR_MAX_QUBITS = 24
+
+# 长会话分窗: 答题数超过窗口大小时切成相互重叠的窗口分别计算，掌握度取各窗口全 1 概率的平均
+# (见 quantum.aggregate_window_scores)。窗口大小默认且最多为单次云端提交的容量，步长默认为窗口大小的一半；
+# 所有后端使用同一窗口大小，保证同一会话在不同后端上的分数可比。云端同一会话的多个窗口最多并发提交的数目
+QUANTUM_CHUNK_SIZE = None
+QUANTUM_CHUNK_STRIDE = None
+QUANTUM_CHUNK_WORKERS = 4
+
+# 后台量子任务: 工作线程数、轮询初始间隔/最大间隔(秒)与退避倍数、单个任务超时、完成任务保留时长(秒)
+QUANTUM_JOB_WORKERS = 8
+QUANTUM_JOB_POLL_INITIAL = 1.0
+QUANTUM_JOB_POLL_MAX = 15.0
+QUANTUM_JOB_POLL_BACKOFF = 2.0
+QUANTUM_JOB_TIMEOUT = 600
+QUANTUM_JOB_TTL = 3600
+# 未完成的云端任务数上限，超出时 /get-quantum-analysis 立即返回 429；
+# 结果相同的任务 (同一电路、同一后端) 在执行中时，新请求直接跟随已有任务而不重复提交
+QUANTUM_JOB_MAX_PENDING = 200
+# 任务快照的共享 SQLite 文件 (相对于可执行文件/项目根目录)，gunicorn / uvicorn 多 worker 部署时
+# 轮询 /quantum-jobs/<job_id> 落到任何一个 worker 都能读到结果；None 表示只保存在进程内存中 (仅限单进程)
+QUANTUM_JOB_DB_FILE = os.path.join("logs", "quantum_jobs.sqlite3")
+
+# 云端任务攒批: 第一个任务到达后最多等待的窗口(秒) 与单次提交最多合并的会话数
+# 多个会话的电路放在同一电路互不相交的比特区间上，提交一次后按区间求边缘概率
+QUANTUM_BATCH_WINDOW = 0.5
+QUANTUM_BATCH_MAX_SESSIONS = 8
+
+# 掌握度结果缓存: 进程内 LRU 的条目上限与有效期(秒)
+# MASTERY_CACHE_DB 设为 SQLite 文件路径时启用磁盘层 (重启后仍可命中)，None 表示只用内存
+MASTERY_CACHE_SIZE = 4096
+MASTERY_CACHE_TTL = 7 * 24 * 3600
+MASTERY_CACHE_DB = None
+
+# 会话存储: "sqlite" (服务端 SQLite 文件，多个 gunicorn worker 共享)、"memory" (进程内，单进程部署)
+# 或 "cookie" (Flask 默认的签名 cookie，会话过长时会超过浏览器 4 KB 限制)
+# SESSION_DB_FILE 相对于可执行文件/项目根目录；会话闲置 SESSION_LIFETIME 秒后过期
+SESSION_BACKEND = "sqlite"
+SESSION_DB_FILE = os.path.join("logs", "sessions.sqlite3")
+SESSION_MAX_ENTRIES = 10000
+SESSION_LIFETIME = 24 * 3600
+
+# 会话日志: 以 JSON Lines 追加写入 logs/session_{timestamp}.jsonl，由后台线程攒批落盘
+# 攒批的最长等待(秒)与最大事件数；fsync 策略 "never" / "batch" (每批一次) / "always" (每个事件一次)
+LOG_FLUSH_INTERVAL = 0.5
+LOG_BATCH_SIZE = 256
+LOG_FSYNC = "batch"
+
+# 运行日志: 级别 ("DEBUG" / "INFO" / "WARNING" / "ERROR"，可用环境变量 LOG_LEVEL 覆盖)，
+# 由后台线程按上面的 LOG_FLUSH_INTERVAL / LOG_BATCH_SIZE 攒批写到标准输出；LOG_FILE 设为路径时同时写入该文件
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FILE = None
+
+# logs/ 目录的增量统计索引 (SQLite)，相对于可执行文件/项目根目录；在线服务由后台线程每隔
+# ANALYTICS_INGEST_INTERVAL 秒增量导入一次，/analytics/* 只查询索引库
+ANALYTICS_DB_FILE = os.path.join("logs", "analytics.sqlite3")
+ANALYTICS_INGEST_INTERVAL = 60
+# 管理接口 (/analytics/*) 的访问令牌，请求须带 "Authorization: Bearer <令牌>"；未设置时这些接口返回 403
+ADMIN_TOKEN = os.getenv("Q_ITS_ADMIN_TOKEN")
 
 TIME_THRESHOLDS = {
     1: 8,    # 难度1的题目，标准用时8秒
@@ -0,0 +1,212 @@
+# 文件: src/device_manager.py
+#
+# 天衍设备路由与故障转移。
+# 以前所有任务都提交到固定的 config.TIANYAN_MACHINE_NAME，设备下线或排队过长时只能返回 0 分的"计算错误"。
+# DeviceManager:
+#   - 定期 (config.TIANYAN_DEVICE_REFRESH 秒) 调用 query_quantum_computer_list 刷新并缓存设备状态，
+#     刷新失败时沿用上一次的列表，从未成功 (或列表中没有一台可用设备) 时退回到 config.TIANYAN_MACHINE_NAME;
+#   - 比特数取自 config.MACHINE_QUBITS_MAP (设备列表中没有比特数)，未登记比特数的设备不参与路由;
+#   - 按策略 (模拟器/真机优先或只用其一) 筛选状态为 running、比特数足够、不在冷却期的设备，
+#     再按本进程在该设备上未完成的任务数 (设备列表中没有排队长度) 选负载最低的一台;
+#   - run_with_failover 在提交或查询出错时把设备放入冷却期，换下一台重试，全部失败才抛出最后一个异常;
+#     天衍并发名额 (rate_limit.get_upstream_limiter("tianyan")) 只在每次调用平台接口时占用 (见 quantum_backends.CloudBackend)，
+#     名额与排队都满 (UpstreamBusyError) 不是设备故障，不放入冷却期，直接抛给调用方。
+
+import threading
+import time
+
+try:
+    import config
+except ImportError:
+    class MockConfig:
+        TIANYAN_LOGIN_KEY = ""
+        TIANYAN_MACHINE_NAME = "tianyan_swn"
+        MACHINE_QUBITS_MAP = {"tianyan_swn": 16, "tianyan_sw": 36}
+        TIANYAN_DEVICE_POLICY = "pinned"
+        TIANYAN_SIMULATORS = ("tianyan_sw", "tianyan_swn")
+        TIANYAN_DEVICE_REFRESH = 60
+        TIANYAN_DEVICE_COOLDOWN = 120
+        TIANYAN_DEVICE_MAX_ATTEMPTS = 3
+
+
+    config = MockConfig()
+
+from observability import get_logger
+from rate_limit import UpstreamBusyError
+
+logger = get_logger(__name__)
+
+DEVICE_POLICIES = ("simulator_first", "hardware_first", "simulator_only", "hardware_only", "pinned")
+DEVICE_RUNNING = "running"
+
+
+class NoDeviceAvailableError(RuntimeError):
+    pass
+
+
+def parse_device_list(rows):
+    """
+    query_quantum_computer_list 的返回值是按列排列的行: [id, 是否收费, 状态, 设备名, ...]
+    (cqlib 已把状态码转换为 running / calibration / under maintenance / off-line)
+    """
+    devices = {}
+    for row in rows or []:
+        if len(row) < 4:
+            continue
+        name = str(row[3])
+        devices[name] = {"name": name, "status": str(row[2]), "toll": row[1],
+                         "qubits": config.MACHINE_QUBITS_MAP.get(name),
+                         "simulator": name in config.TIANYAN_SIMULATORS}
+    return devices
+
+
+class DeviceManager(object):
+
+    def __init__(self, platform_factory=None, policy=None, refresh_interval=None, cooldown=None, max_attempts=None):
+        self.platform_factory = platform_factory
+        self.policy = policy or config.TIANYAN_DEVICE_POLICY
+        if self.policy not in DEVICE_POLICIES:
+            raise ValueError(f"未知的设备策略: '{self.policy}'，可选: {', '.join(DEVICE_POLICIES)}")
+        self.refresh_interval = config.TIANYAN_DEVICE_REFRESH if refresh_interval is None else refresh_interval
+        self.cooldown = config.TIANYAN_DEVICE_COOLDOWN if cooldown is None else cooldown
+        self.max_attempts = max_attempts or config.TIANYAN_DEVICE_MAX_ATTEMPTS
+        self._devices = {}
+        self._refreshed_at = None
+        self._inflight = {}
+        self._cooldown_until = {}
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    # ------------------------------------------------------------------ 设备状态
+
+    def refresh(self, force=False):
+        """ 缓存过期时重新查询设备列表；同一时间只有一个线程查询，其余线程使用旧缓存 """
+        if not force and self._refreshed_at and time.time() - self._refreshed_at < self.refresh_interval:
+            return
+        if not self._refresh_lock.acquire(blocking=self._refreshed_at is None):
+            return
+        try:
+            if not force and self._refreshed_at and time.time() - self._refreshed_at < self.refresh_interval:
+                return
+            platform = self._make_platform(None)
+            devices = parse_device_list(platform.query_quantum_computer_list())
+            with self._lock:
+                self._devices = devices
+            logger.info("设备列表已刷新: %s", ", ".join(f"{d['name']}({d['status']})" for d in devices.values()))
+        except Exception as e:
+            logger.warning("刷新设备列表失败，沿用缓存: %s", e)
+        finally:
+            # 失败时同样等到下一个周期再查，避免每个任务都去请求一次出错的接口
+            self._refreshed_at = time.time()
+            self._refresh_lock.release()
+
+    def _make_platform(self, machine_name):
+        if self.platform_factory:
+            return self.platform_factory(machine_name)
+        from quantum_backends import default_platform_factory
+        return default_platform_factory(machine_name)
+
+    def snapshot(self):
+        """ 设备状态 + 本进程的负载与冷却信息，供展示与调试 """
+        self.refresh()
+        now = time.time()
+        with self._lock:
+            return [dict(device, inflight=self._inflight.get(name, 0),
+                         cooling_down=max(0.0, round(self._cooldown_until.get(name, 0) - now, 1)))
+                    for name, device in sorted(self._devices.items())]
+
+    # ------------------------------------------------------------------ 路由
+
+    def choose(self, num_qubits, exclude=()):
+        """ 返回最合适的设备名；列表中没有符合条件的设备时退回到 config.TIANYAN_MACHINE_NAME，它也不可用时返回 None """
+        if self.policy == "pinned":
+            return None if config.TIANYAN_MACHINE_NAME in exclude else config.TIANYAN_MACHINE_NAME
+        self.refresh()
+        now = time.time()
+        with self._lock:
+            candidates = []
+            for name, device in self._devices.items():
+                if (name in exclude or device["status"] != DEVICE_RUNNING or not device["qubits"]
+                        or device["qubits"] < num_qubits or self._cooldown_until.get(name, 0) > now):
+                    continue
+                if not self._policy_allows(device["simulator"]):
+                    continue
+                preferred = device["simulator"] == (self.policy == "simulator_first")
+                candidates.append((not preferred, self._inflight.get(name, 0), name))
+            if candidates:
+                return min(candidates)[2]
+            # 从未拿到设备列表，或列表中的设备都未登记比特数、不在运行或不符合策略: 退回到原来的固定设备，
+            # 除非它已经试过、在冷却期、列表显示它不在运行、已知比特数不够或不符合策略
+            name = config.TIANYAN_MACHINE_NAME
+            qubits = config.MACHINE_QUBITS_MAP.get(name)
+            listed = self._devices.get(name)
+            if (name in exclude or self._cooldown_until.get(name, 0) > now
+                    or (listed and listed["status"] != DEVICE_RUNNING) or (qubits and qubits < num_qubits)
+                    or not self._policy_allows(name in config.TIANYAN_SIMULATORS)):
+                return None
+        if self._devices:
+            logger.warning("设备列表中没有符合条件的设备 (策略: %s, 比特数: %s)，退回到 %s",
+                           self.policy, num_qubits, name)
+        return name
+
+    def _policy_allows(self, simulator):
+        if self.policy == "simulator_only":
+            return simulator
+        if self.policy == "hardware_only":
+            return not simulator
+        return True
+
+    def run_with_failover(self, num_qubits, attempt):
+        """
+        attempt(machine_name) 负责在指定设备上提交并取回结果，出错时抛出异常。
+        依次尝试最多 max_attempts 台设备，返回第一个成功的结果。
+        """
+        tried, last_error = [], None
+        while len(tried) < self.max_attempts:
+            name = self.choose(num_qubits, exclude=tried)
+            if name is None:
+                break
+            tried.append(name)
+            with self._lock:
+                self._inflight[name] = self._inflight.get(name, 0) + 1
+            try:
+                return attempt(name)
+            except UpstreamBusyError:
+                raise
+            except Exception as e:
+                last_error = e
+                self.report_failure(name, e)
+            finally:
+                with self._lock:
+                    self._inflight[name] -= 1
+        if last_error is not None:
+            raise last_error
+        raise NoDeviceAvailableError(f"没有状态正常且至少有 {num_qubits} 个比特的可用设备 (策略: {self.policy})。")
+
+    def report_failure(self, name, error):
+        logger.warning("设备 %s 出错，暂停使用 %s 秒: %s", name, self.cooldown, error)
+        with self._lock:
+            self._cooldown_until[name] = time.time() + self.cooldown
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_device_manager():
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = DeviceManager()
+        return _manager
+
+
+
+if __name__ == '__main__':
+    from fake_tianyan import FakeTianYanPlatform
+
+    # 用本地假平台的设备列表展示路由结果与设备状态 (路由、冷却与故障转移的检查见 tests/test_device_manager.py)
+    manager = DeviceManager(lambda machine_name: FakeTianYanPlatform(machine_name=machine_name, latency=0))
+    print(f"策略 {manager.policy}: 4 比特 -> {manager.choose(4)}，30 比特 -> {manager.choose(30)}")
+    for device in manager.snapshot():
+        print(device)
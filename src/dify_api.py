@@ -0,0 +1,134 @@
+# 文件: src/dify_api.py
+#
+# 可复用的 Dify 客户端。
+# - 进程内共享一个 requests.Session，连接池 + keep-alive，省去每道题的 TCP/TLS 握手；
+# - 连接失败与 429/5xx 按 urllib3 Retry 配置自动重试；
+# - "streaming" 模式消费 Dify 的 SSE 分块，用 question_parser.JsonObjectScanner 增量扫描，
+#   一旦出现能通过题目校验的完整 JSON 对象就提前返回，不必等 LLM 把结尾的多余文字也生成完。
+# 注意: 模块名不能叫 dify_client，否则会和 requirements 中的 dify-client 包冲突。
+
+import json
+import threading
+
+import certifi
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from question_parser import JsonObjectScanner, is_question_package, parse_question_package
+
+try:
+    import config
+except ImportError:
+    class MockConfig:
+        DIFY_API_KEY = ""
+        DIFY_API_URL = ""
+        DIFY_RESPONSE_MODE = "blocking"
+        DIFY_CONNECT_TIMEOUT = 5
+        DIFY_READ_TIMEOUT = 120
+        DIFY_MAX_RETRIES = 2
+        DIFY_POOL_SIZE = 10
+
+
+    config = MockConfig()
+
+
+class DifyError(Exception):
+    pass
+
+
+# 调用方需要处理的全部异常: 网络/HTTP 错误、Dify 流中的 error 事件、无法解析的响应
+DIFY_ERRORS = (requests.exceptions.RequestException, DifyError, ValueError)
+
+
+class DifyClient(object):
+
+    def __init__(self, api_url=None, api_key=None, connect_timeout=None, read_timeout=None,
+                 max_retries=None, pool_size=None):
+        self.api_url = api_url or config.DIFY_API_URL
+        self.api_key = api_key or config.DIFY_API_KEY
+        self.timeout = (connect_timeout or config.DIFY_CONNECT_TIMEOUT, read_timeout or config.DIFY_READ_TIMEOUT)
+        max_retries = config.DIFY_MAX_RETRIES if max_retries is None else max_retries
+        pool_size = pool_size or config.DIFY_POOL_SIZE
+
+        retry = Retry(total=max_retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=frozenset(["POST"]), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        # --- CRITICAL FIX: 明确指定使用 certifi 提供的证书进行验证 ---
+        self.session.verify = certifi.where()
+        self.session.headers.update({"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"})
+
+    @staticmethod
+    def build_payload(topic, user_id, conversation_id, response_mode):
+        return {"inputs": {"topic": topic}, "query": f"请围绕 {topic} 这个主题，生成一道相关的单项选择题。",
+                "user": user_id, "response_mode": response_mode, "conversation_id": conversation_id}
+
+    def generate_question(self, topic, user_id, conversation_id=None, response_mode=None):
+        """ 返回 {"answer": ..., "conversation_id": ...}；两种模式的返回格式一致 """
+        response_mode = response_mode or config.DIFY_RESPONSE_MODE
+        if response_mode == "streaming":
+            return self.stream_question(topic, user_id, conversation_id)
+        payload = self.build_payload(topic, user_id, conversation_id, "blocking")
+        response = self.session.post(self.api_url, json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def iter_events(self, topic, user_id, conversation_id=None):
+        """ 逐个产出 Dify SSE 事件 (已解析的 dict) """
+        payload = self.build_payload(topic, user_id, conversation_id, "streaming")
+        with self.session.post(self.api_url, json=payload, timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+            response.encoding = 'utf-8'
+            for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                event = json.loads(line[len("data:"):].strip())
+                if event.get("event") == "error":
+                    raise DifyError(f"{event.get('status')} {event.get('code')}: {event.get('message')}")
+                yield event
+
+    def stream_question(self, topic, user_id, conversation_id=None):
+        """ 流式获取题目，answer 中出现合格的题目 JSON 就关闭连接并返回；否则读到 message_end """
+        scanner, new_conversation_id = JsonObjectScanner(), conversation_id
+        for event in self.iter_events(topic, user_id, conversation_id):
+            new_conversation_id = event.get("conversation_id") or new_conversation_id
+            if event.get("event") in ("message", "agent_message"):
+                if any(is_question_package(obj) for obj in scanner.feed(event.get("answer", ""))):
+                    break
+            elif event.get("event") == "message_end":
+                break
+        return {"answer": scanner.text, "conversation_id": new_conversation_id}
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_dify_client():
+    """ 进程内共享的客户端 (共享连接池) """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = DifyClient()
+        return _client
+
+
+if __name__ == '__main__':
+    # 用本地假 Dify 服务 (src/fake_dify.py) 对比 blocking 与 streaming 两种模式的等待时间
+    import time
+    from fake_dify import start_fake_dify
+
+    server, api_url = start_fake_dify(first_token_latency=0.0, chunk_delay=0.02, seed=1)
+    client = DifyClient(api_url=api_url, api_key="stub")
+
+    for mode in ("blocking", "streaming"):
+        started = time.perf_counter()
+        result = client.generate_question("自由落体", "q-its-user-01", response_mode=mode)
+        elapsed = time.perf_counter() - started
+        parsed, _ = parse_question_package(result["answer"])
+        assert parsed["correct_answer"] in parsed["options"] and result["conversation_id"]
+        print(f"{mode:<10} 用时 {elapsed * 1000:.0f} ms")
+    server.shutdown()
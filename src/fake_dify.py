@@ -0,0 +1,173 @@
+# 文件: src/fake_dify.py
+#
+# 本地假 Dify 服务，兼容 /v1/chat-messages 的 blocking 与 streaming (SSE) 两种响应模式，
+# 用于压测与离线演示，不消耗真实的 Dify 调用次数。
+# - first_token_latency: 收到请求到第一个分块的延迟(秒)，模拟 LLM 首字延迟
+# - chunk_delay:         相邻分块之间的延迟(秒)；blocking 模式等待全部分块生成完再返回
+# - failure_rate:        返回 HTTP 500 的概率
+# - malformed_rate:      answer 中不含合法题目 JSON 的概率
+# - sloppy_rate:         题目 JSON 写法不规范 (代码块与尾逗号、选项为列表、答案写成 "A."、单引号等) 的概率，
+#                        这些回复可以由 question_parser 在本地修复
+# - stream_error_rate:   streaming 模式下发出第一个分块后改发 SSE error 事件并结束的概率
+# 题目 JSON 之后会追加一段多余的说明文字，与真实 LLM 的输出习惯一致。
+#
+# 用法:
+#   python src/fake_dify.py [--port 8901] [--first-token-latency 0.5] [--chunk-delay 0.02] [--failure-rate 0.05]
+#   DIFY_API_URL=http://127.0.0.1:8901/v1/chat-messages gunicorn src.app:app
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TRAILING_TEXT = "\n\n以上题目考查了该主题的基本概念，希望对你有帮助。如需更多练习，请告诉我。"
+
+
+def make_question(topic, rng):
+    correct = rng.choice("ABCD")
+    return {"question": f"关于{topic}，下列说法正确的是? (#{rng.randrange(10 ** 6)})",
+            "options": {key: f"选项 {key}{' {正确}' if key == correct else ''}" for key in "ABCD"},
+            "correct_answer": correct, "explanation": f"{correct} 是关于{topic}的正确描述。",
+            "difficulty": rng.randint(1, 5)}
+
+
+def sloppy_answer(question, rng):
+    """ 真实 LLM 常见的几种不规范写法 """
+    style = rng.randrange(3)
+    if style == 0:
+        return "```json\n" + json.dumps(question, ensure_ascii=False, indent=2)[:-1] + ",\n}\n```"
+    if style == 1:
+        options = [f"{key}. {value}" for key, value in question["options"].items()]
+        return json.dumps(dict(question, options=options, correct_answer=question["correct_answer"] + ".",
+                               difficulty=str(question["difficulty"])), ensure_ascii=False)
+    return "好的，题目如下: " + repr(question)
+
+
+def make_handler(first_token_latency=0.5, chunk_delay=0.02, chunk_size=8, failure_rate=0.0, malformed_rate=0.0,
+                 sloppy_rate=0.0, stream_error_rate=0.0, seed=None):
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+
+    class FakeDifyHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            topic = (payload.get("inputs") or {}).get("topic") or "未知主题"
+            conversation_id = payload.get("conversation_id") or uuid.uuid4().hex
+            with rng_lock:
+                failed = rng.random() < failure_rate
+                stream_error = rng.random() < stream_error_rate
+                malformed = rng.random() < malformed_rate
+                question = make_question(topic, rng)
+                if malformed:
+                    answer = "抱歉，我暂时无法生成题目。"
+                elif rng.random() < sloppy_rate:
+                    answer = sloppy_answer(question, rng)
+                else:
+                    answer = json.dumps(question, ensure_ascii=False)
+            if failed:
+                time.sleep(first_token_latency)
+                return self._send_json(500, {"code": "internal_error", "message": "假 Dify: 注入的失败"})
+
+            chunks = [answer[i:i + chunk_size] for i in range(0, len(answer), chunk_size)]
+            chunks.extend(TRAILING_TEXT[i:i + chunk_size] for i in range(0, len(TRAILING_TEXT), chunk_size))
+
+            time.sleep(first_token_latency)
+            if payload.get("response_mode") != "streaming":
+                time.sleep(chunk_delay * len(chunks))
+                return self._send_json(200, {"answer": "".join(chunks), "conversation_id": conversation_id})
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                for index, chunk in enumerate(chunks):
+                    if index:
+                        time.sleep(chunk_delay)
+                    self._write_chunk({"event": "message", "answer": chunk, "conversation_id": conversation_id})
+                    if stream_error:
+                        self._write_chunk({"event": "error", "status": 400, "code": "completion_request_error",
+                                           "message": "假 Dify: 注入的流中错误", "conversation_id": conversation_id})
+                        break
+                else:
+                    self._write_chunk({"event": "message_end", "conversation_id": conversation_id})
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # 客户端拿到完整 JSON 后提前断开
+
+        def _send_json(self, status, body):
+            data = json.dumps(body, ensure_ascii=False).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _write_chunk(self, event):
+            data = f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode()
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+    return FakeDifyHandler
+
+
+class FakeDifyServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # 默认的 listen 队列只有 5，压测时数百个并发连接会被拒绝
+    request_queue_size = 1024
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # 已接受的连接数，用于检查客户端是否复用 keep-alive 连接 (只在 serve_forever 的线程中更新)
+        self.connections = 0
+
+    def process_request(self, request, client_address):
+        self.connections += 1
+        super().process_request(request, client_address)
+
+
+def start_fake_dify(host="127.0.0.1", port=0, **options):
+    """ 在后台线程中启动假 Dify，返回 (server, api_url)；用 server.shutdown() 停止 """
+    server = FakeDifyServer((host, port), make_handler(**options))
+    threading.Thread(target=server.serve_forever, name="fake-dify", daemon=True).start()
+    return server, f"http://{host}:{server.server_port}/v1/chat-messages"
+
+
+def add_arguments(parser):
+    parser.add_argument("--first-token-latency", type=float, default=0.5)
+    parser.add_argument("--chunk-delay", type=float, default=0.02)
+    parser.add_argument("--chunk-size", type=int, default=8)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--sloppy-rate", type=float, default=0.0)
+    parser.add_argument("--stream-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def options_from_args(args):
+    return {"first_token_latency": args.first_token_latency, "chunk_delay": args.chunk_delay,
+            "chunk_size": args.chunk_size, "failure_rate": args.failure_rate,
+            "malformed_rate": args.malformed_rate, "sloppy_rate": args.sloppy_rate,
+            "stream_error_rate": args.stream_error_rate, "seed": args.seed}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="本地假 Dify 服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8901)
+    add_arguments(parser)
+    args = parser.parse_args()
+    server = FakeDifyServer((args.host, args.port), make_handler(**options_from_args(args)))
+    print(f"假 Dify 服务已启动: http://{args.host}:{server.server_port}/v1/chat-messages")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,111 @@
+# 文件: src/fake_tianyan.py
+#
+# 本地假天衍平台，接口与 cqlib.TianYanPlatform 中我们用到的部分一致
+# (submit_experiment / query_experiment / query_quantum_computer_list)，用于基准测试与离线演示。
+# - latency:      提交后经过多少秒才能查询到结果 (模拟云端排队)
+# - failure_rate: 提交时随机抛出异常的概率；也可以是 {设备名: 概率}，只让指定设备出错
+# - devices:      query_quantum_computer_list 返回的设备行 [id, 是否收费, 状态, 设备名]，
+#   默认把 config.MACHINE_QUBITS_MAP 中的设备都列为 running，用于脚本化演示设备路由与故障转移
+# - exact=True:   用本地态矢量模拟返回精确的完整分布 (仅适合少量比特)；
+#   否则按 shots 采样: 每条 RY + CX 链先按 sin^2(theta/2) 独立采样输入比特，再沿链取前缀异或，
+#   因此 36 比特的整机电路也能在毫秒级给出带采样噪声的结果。
+# 通过 config.TIANYAN_PLATFORM = "fake" (或环境变量 TIANYAN_PLATFORM=fake) 让应用使用它。
+
+import json
+import math
+import random
+import threading
+import time
+import uuid
+
+try:
+    import config
+except ImportError:
+    class MockConfig:
+        FAKE_TIANYAN_LATENCY = 2.0
+        FAKE_TIANYAN_FAILURE_RATE = 0.0
+        MACHINE_QUBITS_MAP = {"tianyan_swn": 16, "tianyan_sw": 36}
+
+
+    config = MockConfig()
+
+
+def parse_qcis(qcis):
+    """ 返回 (RY 角度 {比特: 角度}, CX 目标比特集合, 测量比特列表) """
+    angles, cz_pairs, measured = {}, [], []
+    for line in qcis.strip().splitlines():
+        parts = line.split()
+        if not parts:
+            continue
+        if parts[0] == "RY":
+            angles[int(parts[1][1:])] = float(parts[2])
+        elif parts[0] == "CZ":
+            cz_pairs.append((int(parts[1][1:]), int(parts[2][1:])))
+        elif parts[0] == "M":
+            measured.append(int(parts[1][1:]))
+    return angles, {target for _, target in cz_pairs}, measured
+
+
+class FakeTianYanPlatform(object):
+
+    def __init__(self, login_key=None, machine_name=None, latency=None, failure_rate=None, exact=False,
+                 seed=None, devices=None):
+        self.machine_name = machine_name
+        self.latency = config.FAKE_TIANYAN_LATENCY if latency is None else latency
+        self.failure_rate = config.FAKE_TIANYAN_FAILURE_RATE if failure_rate is None else failure_rate
+        self.devices = devices
+        self.exact = exact
+        self._random = random.Random(seed)
+        self._experiments = {}
+        self._lock = threading.Lock()
+
+    def submit_experiment(self, circuit, num_shots=2048, **kwargs):
+        failure_rate = self.failure_rate
+        if isinstance(failure_rate, dict):
+            failure_rate = failure_rate.get(self.machine_name, 0.0)
+        if self._random.random() < failure_rate:
+            raise RuntimeError(f"假天衍平台: 注入的提交失败 ({self.machine_name})")
+        probabilities = self._simulate(circuit, num_shots)
+        query_id = uuid.uuid4().hex
+        with self._lock:
+            self._experiments[query_id] = (time.time() + self.latency, json.dumps(probabilities))
+        return query_id
+
+    def query_experiment(self, query_id, max_wait_time=120, sleep_time=5, **kwargs):
+        """ 与 cqlib 一样: 在 max_wait_time 内等待结果，超时则抛出异常 """
+        ids = [query_id] if isinstance(query_id, str) else list(query_id)
+        deadline = time.time() + max_wait_time
+        while True:
+            with self._lock:
+                entries = [self._experiments[i] for i in ids]
+            ready_at = max(entry[0] for entry in entries)
+            if time.time() >= ready_at:
+                return [{"probability": entry[1]} for entry in entries]
+            if time.time() + 0.001 >= deadline:
+                raise RuntimeError("Failed to query the experimental result.")
+            time.sleep(max(0.0, min(sleep_time, ready_at - time.time(), deadline - time.time())))
+
+    def query_quantum_computer_list(self):
+        """ 与 cqlib 一致的行格式: [id, 是否收费, 状态, 设备名] """
+        if self.devices is not None:
+            return [list(row) for row in self.devices]
+        return [[index, "free", "running", name] for index, name in enumerate(sorted(config.MACHINE_QUBITS_MAP), 1)]
+
+    def _simulate(self, qcis, num_shots):
+        angles, cx_targets, measured = parse_qcis(qcis)
+        if self.exact:
+            from quantum_backends import StatevectorBackend
+            amplitudes = StatevectorBackend().run_qcis(qcis, len(measured))
+            return {format(index, f'0{len(measured)}b'): float(abs(amplitude) ** 2)
+                    for index, amplitude in enumerate(amplitudes) if abs(amplitude) > 1e-12}
+
+        import numpy as np
+        rng = np.random.default_rng(self._random.getrandbits(32))
+        ones = np.array([math.sin(angles.get(q, 0.0) / 2) ** 2 for q in measured])
+        bits = rng.random((num_shots, len(measured))) < ones
+        # 每个 CX 目标比特等于自身输入与前一个比特输出的异或 (链上的前缀异或)
+        for column, qubit in enumerate(measured):
+            if qubit in cx_targets and column > 0:
+                bits[:, column] ^= bits[:, column - 1]
+        keys, counts = np.unique(bits.astype(np.uint8), axis=0, return_counts=True)
+        return {"".join(map(str, key)): int(count) / num_shots for key, count in zip(keys, counts)}
@@ -0,0 +1,275 @@
+# 文件: src/load_benchmark.py
+#
+# Flask 接口的压测与基准。
+# 多个并发客户端各自模拟完整的学生会话:
+#   GET / -> (POST /generate-question -> 思考 -> POST /submit-answer) x N -> POST /end-session
+#   -> POST /get-quantum-analysis -> 轮询 GET /quantum-jobs/<job_id> (云端后端)
+# 并按接口统计请求数、错误数、p50/p95/p99 延迟与吞吐 (req/s)。
+#
+# 默认会为每个配置启动一个应用进程: "WxT" 为 gunicorn gthread 部署 (src.app:app，W 个 worker、每个 T 个线程)，
+# "asgi:WxT" 为 uvicorn ASGI 部署 (src.asgi_app:app，W 个 worker，每个最多 T 个请求线程，见 ASGI_MAX_THREADS)，
+# 两种部署的线程数相同时才可比 (例如 1x8 与 asgi:1x8)，
+# Dify 指向进程内的假 Dify 服务 (src/fake_dify.py)，天衍指向假平台 (src/fake_tianyan.py)，
+# 两者的延迟与失败率都可配置；应用的会话库与日志写到临时目录，不会污染 logs/。
+# 也可以用 --url 对一个已经启动的服务压测 (此时假服务的参数无效)。
+#
+# 用法:
+#   python src/load_benchmark.py --configs 1x1,1x8,4x4 --clients 16 --sessions 2 --questions 5
+#   python src/load_benchmark.py --configs 1x8,asgi:1x8 --clients 200 --sessions 1 --first-token-latency 3
+#   python src/load_benchmark.py --backend cloud --tianyan-latency 3 --tianyan-failure-rate 0.1
+#   python src/load_benchmark.py --url http://127.0.0.1:5000 --clients 8
+
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import requests
+
+import fake_dify
+
+TOPICS = ("自由落体", "牛顿第二定律", "光的折射", "欧姆定律", "化学平衡", "细胞分裂", "勾股定理", "函数极限")
+
+
+class LatencyRecorder(object):
+    """ 线程安全地记录 (接口, 耗时秒, 是否成功) """
+
+    def __init__(self):
+        self._samples = {}
+        self._errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, seconds, ok):
+        with self._lock:
+            self._samples.setdefault(endpoint, []).append(seconds)
+            if not ok:
+                self._errors[endpoint] = self._errors.get(endpoint, 0) + 1
+
+    def summary(self, wall_seconds):
+        rows = []
+        with self._lock:
+            for endpoint, samples in self._samples.items():
+                p50, p95, p99 = np.percentile(np.asarray(samples) * 1000, [50, 95, 99])
+                rows.append({"endpoint": endpoint, "requests": len(samples), "errors": self._errors.get(endpoint, 0),
+                             "p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99),
+                             "rps": len(samples) / wall_seconds if wall_seconds else 0.0})
+        return sorted(rows, key=lambda row: row["endpoint"])
+
+
+def endpoint_name(method, path):
+    """ /quantum-jobs/<job_id> 等带参数的路径归并为同一个接口 """
+    return f"{method} {re.sub(r'/quantum-jobs/[^/?]+', '/quantum-jobs/<id>', path.split('?')[0])}"
+
+
+class StudentClient(object):
+    """ 一个模拟学生: 独立的 cookie 会话，顺序完成若干轮答题 """
+
+    def __init__(self, base_url, recorder, rng, questions=5, think_time=0.2, backend=None, dify_mode=None,
+                 poll_interval=0.5, analysis_timeout=120):
+        self.base_url = base_url.rstrip("/")
+        self.recorder = recorder
+        self.rng = rng
+        self.questions = questions
+        self.think_time = think_time
+        self.backend = backend
+        self.dify_mode = dify_mode
+        self.poll_interval = poll_interval
+        self.analysis_timeout = analysis_timeout
+        self.http = requests.Session()
+
+    def request(self, method, path, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self.http.request(method, self.base_url + path, timeout=(5, 300), **kwargs)
+        except requests.exceptions.RequestException:
+            self.recorder.record(endpoint_name(method, path), time.perf_counter() - started, False)
+            return None
+        ok = response.status_code in (200, 202)
+        self.recorder.record(endpoint_name(method, path), time.perf_counter() - started, ok)
+        return response if ok else None
+
+    def run_session(self):
+        """ 返回会话是否完整走完 (含拿到量子分析结果) """
+        started = time.perf_counter()
+        ok = self._run_session()
+        self.recorder.record("session (端到端)", time.perf_counter() - started, ok)
+        return ok
+
+    def _run_session(self):
+        if self.request("GET", "/") is None:
+            return False
+        topic = self.rng.choice(TOPICS)
+        generate_path = f"/generate-question?mode={self.dify_mode}" if self.dify_mode else "/generate-question"
+        for _ in range(self.questions):
+            response = self.request("POST", generate_path, json={"topic": topic})
+            if response is None:
+                return False
+            options = list((response.json().get("options") or {"A": None}).keys())
+            time.sleep(self.rng.uniform(0, 2 * self.think_time))
+            if self.request("POST", "/submit-answer", json={"answer": self.rng.choice(options)}) is None:
+                return False
+        response = self.request("POST", "/end-session")
+        if response is None:
+            return False
+        analysis_path = f"/get-quantum-analysis?backend={self.backend}" if self.backend else "/get-quantum-analysis"
+        response = self.request("POST", analysis_path, json=response.json())
+        deadline = time.time() + self.analysis_timeout
+        while response is not None and response.status_code == 202 and time.time() < deadline:
+            time.sleep(self.poll_interval)
+            response = self.request("GET", f"/quantum-jobs/{response.json()['job_id']}")
+        return response is not None and response.status_code == 200 and response.json().get("status") == "done"
+
+
+def run_load(base_url, clients, sessions, seed=None, **client_options):
+    """ clients 个并发学生各完成 sessions 轮会话，返回 (按接口的统计, 墙钟秒数, 完整会话数) """
+    recorder = LatencyRecorder()
+    completed = []
+    seeds = random.Random(seed)
+
+    def worker(client_seed):
+        client = StudentClient(base_url, recorder, random.Random(client_seed), **client_options)
+        completed.extend(client.run_session() for _ in range(sessions))
+
+    threads = [threading.Thread(target=worker, args=(seeds.getrandbits(32),)) for _ in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_seconds = time.perf_counter() - started
+    return recorder.summary(wall_seconds), wall_seconds, sum(completed)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_ready(base_url, process, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"应用进程已退出，退出码 {process.returncode}")
+        try:
+            if requests.get(base_url + "/", timeout=1).status_code == 200:
+                return
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"应用在 {timeout} 秒内没有就绪: {base_url}")
+
+
+def launch_app(workers, threads, env, server="gunicorn"):
+    """ 以 gunicorn 启动 src.app:app，或以 uvicorn 启动 src.asgi_app:app，返回 (进程, base_url) """
+    project_dir = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    port = free_port()
+    if server == "asgi":
+        env = dict(env, ASGI_MAX_THREADS=str(threads))
+        command = [sys.executable, "-m", "uvicorn", "--workers", str(workers), "--host", "127.0.0.1",
+                   "--port", str(port), "--log-level", "warning", "--backlog", "4096", "src.asgi_app:app"]
+    else:
+        command = [sys.executable, "-m", "gunicorn", "--worker-class", "gthread", "--workers", str(workers),
+                   "--threads", str(threads), "--bind", f"127.0.0.1:{port}", "--timeout", "300", "--log-level", "warning", "src.app:app"]
+    process = subprocess.Popen(command, cwd=project_dir, env=env, stdout=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_until_ready(base_url, process)
+    except RuntimeError:
+        process.kill()
+        raise
+    return process, base_url
+
+
+def parse_configs(text):
+    """ "1x1,asgi:2x4" -> [("gunicorn", 1, 1), ("asgi", 2, 4)] (workers x threads) """
+    configs = []
+    for item in text.split(","):
+        server, _, size = item.strip().rpartition(":")
+        workers, _, threads = size.partition("x")
+        configs.append((server or "gunicorn", int(workers), int(threads or 1)))
+    return configs
+
+
+def print_report(label, rows, wall_seconds, completed, total):
+    print(f"\n=== {label}: {completed}/{total} 个会话完整完成，用时 {wall_seconds:.1f} 秒 ===")
+    print(f"{'接口':<32}{'请求数':>8}{'错误':>6}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'req/s':>9}")
+    for row in rows:
+        print(f"{row['endpoint']:<32}{row['requests']:>8}{row['errors']:>6}{row['p50_ms']:>10.1f}"
+              f"{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}{row['rps']:>9.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Q-ITS 接口压测 (假 Dify + 假天衍)")
+    parser.add_argument("--url", help="对已启动的服务压测，而不是自行启动 gunicorn")
+    parser.add_argument("--configs", default="1x1,1x8,4x4",
+                        help="部署配置列表，workers x threads；加 asgi: 前缀表示 uvicorn ASGI 部署 (threads 为 ASGI_MAX_THREADS)")
+    parser.add_argument("--clients", type=int, default=16, help="并发学生数")
+    parser.add_argument("--sessions", type=int, default=2, help="每个学生完成的会话轮数")
+    parser.add_argument("--questions", type=int, default=5, help="每轮会话的题目数")
+    parser.add_argument("--think-time", type=float, default=0.2, help="平均思考时间(秒)")
+    parser.add_argument("--backend", choices=("analytic", "statevector", "cloud"),
+                        help="量子后端，默认用应用配置 (--url 时以 ?backend= 传递，须在服务端 QUANTUM_BACKEND_CHOICES 中)")
+    parser.add_argument("--dify-mode", choices=("blocking", "streaming"), help="Dify 响应模式，默认用应用配置")
+    parser.add_argument("--prefetch", action="store_true", help="启用题目预取池 (默认关闭以测量实时出题路径)")
+    parser.add_argument("--rate-limit", action="store_true",
+                        help="保留按用户限流 (默认关闭: 压测学生的答题节奏远快于真人，会被限流)")
+    parser.add_argument("--tianyan-latency", type=float, default=2.0, help="假天衍平台的结果延迟(秒)")
+    parser.add_argument("--tianyan-failure-rate", type=float, default=0.0, help="假天衍平台的提交失败概率")
+    parser.add_argument("--json", dest="json_path", help="把全部结果另存为 JSON")
+    dify_group = parser.add_argument_group("假 Dify 服务")
+    fake_dify.add_arguments(dify_group)
+    args = parser.parse_args(argv)
+
+    load_options = {"clients": args.clients, "sessions": args.sessions, "seed": args.seed,
+                    "questions": args.questions, "think_time": args.think_time,
+                    "dify_mode": args.dify_mode}
+    total = args.clients * args.sessions
+    report = []
+    if args.url:
+        rows, wall_seconds, completed = run_load(args.url, backend=args.backend, **load_options)
+        print_report(args.url, rows, wall_seconds, completed, total)
+        report.append({"target": args.url, "wall_seconds": wall_seconds, "completed": completed, "endpoints": rows})
+    else:
+        server, api_url = fake_dify.start_fake_dify(**fake_dify.options_from_args(args))
+        for server_kind, workers, threads in parse_configs(args.configs):
+            data_dir = tempfile.mkdtemp(prefix="q-its-bench-")
+            env = dict(os.environ, Q_ITS_DATA_DIR=data_dir, DIFY_API_URL=api_url, TIANYAN_PLATFORM="fake",
+                       FAKE_TIANYAN_LATENCY=str(args.tianyan_latency),
+                       FAKE_TIANYAN_FAILURE_RATE=str(args.tianyan_failure_rate),
+                       QUESTION_PREFETCH_ENABLED="1" if args.prefetch else "0",
+                       RATE_LIMIT_ENABLED="1" if args.rate_limit else "0")
+            if args.backend:
+                env["QUANTUM_BACKEND"] = args.backend
+            if server_kind == "asgi":
+                label = f"uvicorn asgi -w {workers} (请求线程 {threads})"
+            else:
+                label = f"gunicorn gthread -w {workers} --threads {threads}"
+            process, base_url = launch_app(workers, threads, env, server=server_kind)
+            try:
+                rows, wall_seconds, completed = run_load(base_url, **load_options)
+            finally:
+                process.terminate()
+                process.wait(30)
+                shutil.rmtree(data_dir, ignore_errors=True)
+            print_report(label, rows, wall_seconds, completed, total)
+            report.append({"target": label, "server": server_kind, "workers": workers, "threads": threads, "wall_seconds": wall_seconds,
+                           "completed": completed, "endpoints": rows})
+        server.shutdown()
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump({"options": vars(args), "results": report}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,305 @@
+# 文件: src/log_analytics.py
+#
+# logs/ 目录的增量索引与统计。
+# 把 session_*.json (整体视图) 与 session_*.jsonl (追加事件) 导入一个带索引的 SQLite 库，
+# 之后"各主题平均掌握度"、"各难度正确率"等统计只查库，不再逐个打开日志文件。
+# 增量导入: .json 按 (mtime, size) 判断是否变化，变化时整体重建该会话；
+#          .jsonl 记录已读到的字节偏移，只解析新追加的完整行。
+# 同名的 .jsonl 存在时以它为准，忽略对应的 .json 视图。
+# 在线服务中由后台线程每 config.ANALYTICS_INGEST_INTERVAL 秒导入一次 (start_background_ingest)，
+# 查询接口只读库；用时分位数在 SQL 中按 (分组, time_taken) 索引定位，不把整列读进内存。
+#
+# 用法:
+#   python src/log_analytics.py ingest
+#   python src/log_analytics.py topics
+#   python src/log_analytics.py difficulty [--topic 主题]
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+try:
+    import config
+except ImportError:
+    class MockConfig:
+        ANALYTICS_DB_FILE = os.path.join("logs", "analytics.sqlite3")
+        ANALYTICS_INGEST_INTERVAL = 60
+
+
+    config = MockConfig()
+
+from observability import get_logger
+
+logger = get_logger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ingest_state (
+    path TEXT PRIMARY KEY, mtime REAL NOT NULL, size INTEGER NOT NULL,
+    offset INTEGER NOT NULL DEFAULT 0, round INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY, topic TEXT, started_at REAL
+);
+CREATE TABLE IF NOT EXISTS answers (
+    session_id TEXT NOT NULL, round INTEGER NOT NULL, question_num INTEGER NOT NULL,
+    topic TEXT, difficulty INTEGER, is_correct INTEGER, time_taken REAL, answered_at REAL,
+    PRIMARY KEY (session_id, round, question_num)
+);
+CREATE TABLE IF NOT EXISTS analyses (
+    session_id TEXT NOT NULL, round INTEGER NOT NULL, topic TEXT, score REAL, analyzed_at REAL,
+    PRIMARY KEY (session_id, round)
+);
+CREATE INDEX IF NOT EXISTS idx_answers_topic_time ON answers (topic, time_taken);
+CREATE INDEX IF NOT EXISTS idx_answers_difficulty_time ON answers (difficulty, time_taken);
+CREATE INDEX IF NOT EXISTS idx_answers_topic_difficulty ON answers (topic, difficulty, time_taken);
+CREATE INDEX IF NOT EXISTS idx_answers_answered_at ON answers (answered_at);
+CREATE INDEX IF NOT EXISTS idx_analyses_topic ON analyses (topic);
+CREATE INDEX IF NOT EXISTS idx_sessions_started_at ON sessions (started_at);
+"""
+
+UNKNOWN_TOPIC = "(未知主题)"
+PERCENTILES = (50, 90, 99)
+
+
+def session_started_at(session_id):
+    """ session_2025-07-08_09-40-40 (可带 _<随机后缀>) -> 时间戳；无法解析时返回 None """
+    try:
+        return datetime.strptime("_".join(session_id.split("_")[:3]), "session_%Y-%m-%d_%H-%M-%S").timestamp()
+    except ValueError:
+        return None
+
+
+class LogAnalytics(object):
+
+    def __init__(self, db_path, logs_dir):
+        self.db_path = db_path
+        self.logs_dir = logs_dir
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        # 多个 worker 进程共用一个库: WAL 下读写互不阻塞，写锁被占用时最多等待 10 秒
+        self._conn = sqlite3.connect(db_path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self.last_ingest = None
+        self._ingest_thread = None
+
+    # ------------------------------------------------------------------ 导入
+
+    def start_background_ingest(self, interval=None):
+        """ 启动后台导入线程 (每个实例只启动一次)，立即导入一次，之后每 interval 秒导入一次 """
+        interval = interval or config.ANALYTICS_INGEST_INTERVAL
+        with self._lock:
+            if self._ingest_thread is not None:
+                return
+            self._ingest_thread = threading.Thread(target=self._ingest_loop, args=(interval,),
+                                                   name="log-analytics-ingest", daemon=True)
+        self._ingest_thread.start()
+
+    def _ingest_loop(self, interval):
+        while True:
+            try:
+                self.ingest()
+            except Exception as e:
+                logger.error("后台导入日志失败: %s", e)
+            time.sleep(interval)
+
+    def ingest(self):
+        """
+        增量导入 logs_dir，返回 {"scanned", "ingested", "skipped", "seconds", "finished_at"}。
+        每个文件单独提交；库被其它进程锁住超时 (sqlite3.OperationalError) 时放弃本轮，
+        已提交的文件保留，其余文件下一轮再导入，返回值中带 "error"。
+        """
+        started = time.perf_counter()
+        stats = {"scanned": 0, "ingested": 0, "skipped": 0}
+        names = [n for n in os.listdir(self.logs_dir) if n.startswith("session_")]
+        streamed = {os.path.splitext(n)[0] for n in names if n.endswith(".jsonl")}
+        with self._lock:
+            try:
+                self._ingest_names(names, streamed, stats)
+            except sqlite3.OperationalError as e:
+                self._conn.rollback()
+                logger.warning("导入日志时索引库不可用，本轮导入中止: %s", e)
+                stats["error"] = str(e)
+        stats["seconds"] = round(time.perf_counter() - started, 3)
+        stats["finished_at"] = time.time()
+        self.last_ingest = stats
+        return stats
+
+    def _ingest_names(self, names, streamed, stats):
+        state = {row[0]: row[1:] for row in
+                 self._conn.execute("SELECT path, mtime, size, offset, round FROM ingest_state")}
+        for name in sorted(names):
+            session_id, ext = os.path.splitext(name)
+            if ext not in (".json", ".jsonl") or (ext == ".json" and session_id in streamed):
+                continue
+            stats["scanned"] += 1
+            path = os.path.join(self.logs_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            previous = state.get(name)
+            if previous and previous[0] == stat.st_mtime and previous[1] == stat.st_size:
+                stats["skipped"] += 1
+                continue
+            try:
+                if ext == ".json":
+                    self._ingest_view(name, session_id, path, stat)
+                else:
+                    self._ingest_events(name, session_id, path, stat, previous)
+                self._conn.commit()
+                stats["ingested"] += 1
+            except (OSError, ValueError) as e:
+                self._conn.rollback()
+                logger.error("导入日志 %s 失败: %s", path, e)
+
+    def _ingest_view(self, name, session_id, path, stat):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        # 早期的日志只有 session_log 列表，没有主题与量子分析
+        if isinstance(data, list):
+            data = {"topic": None, "session_log": data, "quantum_analysis": None}
+        topic = data.get("topic") or UNKNOWN_TOPIC
+        started_at = session_started_at(session_id)
+        for table in ("answers", "analyses", "sessions"):
+            self._conn.execute(f"DELETE FROM {table} WHERE session_id = ?", (session_id,))
+        self._conn.execute("INSERT INTO sessions VALUES (?, ?, ?)", (session_id, topic, started_at))
+        for entry in data.get("session_log") or []:
+            self._insert_answer(session_id, 0, topic, entry, started_at)
+        analysis = data.get("quantum_analysis")
+        if analysis:
+            self._conn.execute("INSERT INTO analyses VALUES (?, ?, ?, ?, ?)",
+                               (session_id, 0, topic, analysis.get("score"), stat.st_mtime))
+        self._save_state(name, stat, stat.st_size, 0)
+
+    def _ingest_events(self, name, session_id, path, stat, previous):
+        offset, round_no = (previous[2], previous[3]) if previous else (0, 0)
+        if stat.st_size < offset:
+            # 文件被截断或替换，从头重建
+            offset, round_no = 0, 0
+            for table in ("answers", "analyses", "sessions"):
+                self._conn.execute(f"DELETE FROM {table} WHERE session_id = ?", (session_id,))
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            chunk = f.read()
+        # 只处理以换行结尾的完整行，最后一行可能还在写入中
+        complete = chunk[:chunk.rfind(b"\n") + 1]
+        row = self._conn.execute("SELECT topic FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        topic = row[0] if row else UNKNOWN_TOPIC
+        for line in complete.decode('utf-8').splitlines():
+            if not line.strip():
+                continue
+            event = json.loads(line)
+            event_type = event.get("type")
+            if event_type == "session_started":
+                topic = event.get("topic") or UNKNOWN_TOPIC
+                self._conn.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)",
+                                   (session_id, topic, event.get("ts") or session_started_at(session_id)))
+            elif event_type == "session_reset":
+                round_no += 1
+            elif event_type == "answer":
+                entry = dict(event.get("update") or {}, question_num=event.get("question_num"))
+                self._insert_answer(session_id, round_no, topic, entry, event.get("ts"))
+            elif event_type == "quantum_analysis":
+                self._conn.execute("INSERT OR REPLACE INTO analyses VALUES (?, ?, ?, ?, ?)",
+                                   (session_id, round_no, topic, (event.get("result") or {}).get("score"),
+                                    event.get("ts")))
+        self._save_state(name, stat, offset + len(complete), round_no)
+
+    def _insert_answer(self, session_id, round_no, topic, entry, answered_at):
+        if entry.get("is_correct") is None:
+            return  # 未作答的题目
+        feature = entry.get("feature_3d") or {}
+        self._conn.execute("INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                           (session_id, round_no, entry.get("question_num"), topic,
+                            entry.get("difficulty", feature.get("difficulty")), int(bool(entry["is_correct"])),
+                            entry.get("time_taken"), answered_at))
+
+    def _save_state(self, name, stat, offset, round_no):
+        self._conn.execute("INSERT OR REPLACE INTO ingest_state VALUES (?, ?, ?, ?, ?)",
+                           (name, stat.st_mtime, stat.st_size, offset, round_no))
+
+    # ------------------------------------------------------------------ 查询
+
+    def topic_summary(self):
+        """ 各主题: 会话数、答题数、正确率、平均掌握度、用时 p50/p90/p99 """
+        with self._lock:
+            answers = self._conn.execute(
+                "SELECT topic, COUNT(DISTINCT session_id), COUNT(*), AVG(is_correct), COUNT(time_taken) "
+                "FROM answers GROUP BY topic").fetchall()
+            scores = dict(self._conn.execute("SELECT topic, AVG(score) FROM analyses GROUP BY topic").fetchall())
+            summary = []
+            for topic, sessions, count, accuracy, timed in answers:
+                row = {"topic": topic, "sessions": sessions, "answers": count, "accuracy": accuracy,
+                       "mean_quantum_score": scores.get(topic)}
+                row.update(self._percentiles("topic IS ?", (topic,), timed))
+                summary.append(row)
+        return summary
+
+    def difficulty_summary(self, topic=None):
+        """ 各难度: 答题数、正确率、用时 p50/p90/p99，可按主题过滤 """
+        where, params = ("WHERE topic = ?", (topic,)) if topic else ("", ())
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT difficulty, COUNT(*), AVG(is_correct), COUNT(time_taken) FROM answers {where} "
+                f"GROUP BY difficulty ORDER BY difficulty", params).fetchall()
+            summary = []
+            for difficulty, count, accuracy, timed in rows:
+                row = {"difficulty": difficulty, "answers": count, "accuracy": accuracy}
+                condition = "topic = ? AND difficulty IS ?" if topic else "difficulty IS ?"
+                row.update(self._percentiles(condition, params + (difficulty,), timed))
+                summary.append(row)
+        return summary
+
+    def _percentiles(self, condition, params, count):
+        """
+        一组答题 (condition 选出) 用时的分位数，与 numpy.percentile 的线性插值相同。
+        每个分位数只按索引顺序读取相邻的两行 (ORDER BY time_taken LIMIT 2 OFFSET k)，count 为组内有用时的行数。
+        """
+        if not count:
+            return {f"time_p{p}": None for p in PERCENTILES}
+        result = {}
+        for p in PERCENTILES:
+            position = p / 100 * (count - 1)
+            lower = int(position)
+            values = [row[0] for row in self._conn.execute(
+                f"SELECT time_taken FROM answers WHERE {condition} AND time_taken IS NOT NULL "
+                f"ORDER BY time_taken LIMIT 2 OFFSET ?", params + (lower,))]
+            upper = values[1] if len(values) > 1 else values[0]
+            result[f"time_p{p}"] = values[0] + (upper - values[0]) * (position - lower)
+        return result
+
+
+def default_paths():
+    base = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    return os.path.join(base, config.ANALYTICS_DB_FILE), os.path.join(base, "logs")
+
+
+def main(argv=None):
+    db_path, logs_dir = default_paths()
+    parser = argparse.ArgumentParser(description="Q-ITS 会话日志统计")
+    parser.add_argument("--db", default=db_path, help="索引库路径")
+    parser.add_argument("--logs", default=logs_dir, help="日志目录")
+    parser.add_argument("--no-ingest", action="store_true", help="查询前不做增量导入")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("ingest", help="增量导入新的/变化的日志")
+    sub.add_parser("topics", help="各主题统计")
+    difficulty = sub.add_parser("difficulty", help="各难度统计")
+    difficulty.add_argument("--topic")
+    args = parser.parse_args(argv)
+
+    analytics = LogAnalytics(args.db, args.logs)
+    if args.command == "ingest" or not args.no_ingest:
+        print(json.dumps(analytics.ingest(), ensure_ascii=False))
+    if args.command == "topics":
+        print(json.dumps(analytics.topic_summary(), ensure_ascii=False, indent=2))
+    elif args.command == "difficulty":
+        print(json.dumps(analytics.difficulty_summary(args.topic), ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
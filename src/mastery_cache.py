@@ -0,0 +1,125 @@
+# 文件: src/mastery_cache.py
+#
+# 掌握度结果缓存。量子电路的输出只取决于有序的综合分序列 (每题 0~15) 以及后端/机器/shots，
+# 相同的短会话在学生之间反复出现，命中时可以跳过电路构建和云端往返。
+# 两级结构: 进程内 LRU (容量 + TTL 淘汰) 与可选的 SQLite 磁盘层 (重启后仍然有效)。
+# 只缓存分数本身，反馈文案在读取时由 get_mastery_feedback 重新生成，调整分档无需清缓存。
+# 本地后端的分数是精确值 (shots 为 None)；云端采样的分数同时记录累计的 shots，
+# 命中时按 (分数 x shots, shots) 还原为采样证据、重新计算置信区间，而不是当作精确值。
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import config
+except ImportError:
+    class MockConfig:
+        MASTERY_CACHE_SIZE = 4096
+        MASTERY_CACHE_TTL = 86400
+        MASTERY_CACHE_DB = None
+
+
+    config = MockConfig()
+
+
+def make_cache_key(classic_scores, backend_tag):
+    """ 规范化的缓存键，例如 'cloud:tianyan_sw:2048|5,5,7' """
+    return f"{backend_tag}|{','.join(str(s) for s in classic_scores)}"
+
+
+class MasteryCache(object):
+
+    def __init__(self, max_size=None, ttl=None, db_path=None):
+        self.max_size = max_size or config.MASTERY_CACHE_SIZE
+        self.ttl = ttl or config.MASTERY_CACHE_TTL
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        self._db = None
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS mastery_cache (cache_key TEXT PRIMARY KEY, "
+                             "score REAL NOT NULL, created_at REAL NOT NULL, shots INTEGER)")
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(mastery_cache)")]
+            if "shots" not in columns:
+                # 旧版本的库没有 shots 列，无法区分精确值与采样值: 清空后按新格式重新缓存
+                self._db.execute("DELETE FROM mastery_cache")
+                self._db.execute("ALTER TABLE mastery_cache ADD COLUMN shots INTEGER")
+            self._db.commit()
+
+    def _expired(self, created_at):
+        return time.time() - created_at > self.ttl
+
+    def get(self, key):
+        """ 命中时返回分数，否则返回 None """
+        entry = self.get_entry(key)
+        return entry[0] if entry else None
+
+    def get_entry(self, key):
+        """ 命中时返回 (分数, shots)，精确值的 shots 为 None；未命中返回 None """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and not self._expired(entry[2]):
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry[0], entry[1]
+            if entry:
+                del self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute("SELECT score, shots, created_at FROM mastery_cache WHERE cache_key = ?",
+                                       (key,)).fetchone()
+                if row and not self._expired(row[2]):
+                    self._store_memory(key, row[0], row[1], row[2])
+                    self._stats["disk_hits"] += 1
+                    return row[0], row[1]
+
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, key, score, shots=None):
+        """ shots 为得到该分数所用的累计 shots；精确值 (本地后端) 为 None """
+        now = time.time()
+        with self._lock:
+            self._store_memory(key, score, shots, now)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO mastery_cache (cache_key, score, created_at, shots) "
+                                 "VALUES (?, ?, ?, ?)", (key, score, now, shots))
+                self._db.execute("DELETE FROM mastery_cache WHERE created_at < ?", (now - self.ttl,))
+                self._db.commit()
+
+    def _store_memory(self, key, score, shots, created_at):
+        self._entries[key] = (score, shots, created_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, size=len(self._entries), max_size=self.max_size,
+                        disk=self._db is not None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM mastery_cache")
+                self._db.commit()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_mastery_cache():
+    """ 进程内共享的缓存实例，按 config 创建 """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = MasteryCache(db_path=config.MASTERY_CACHE_DB)
+        return _cache
@@ -0,0 +1,226 @@
+# 文件: src/observability.py
+#
+# 日志与耗时指标。
+# - 日志: 用标准库 logging，级别由 config.LOG_LEVEL 控制。请求线程只把记录放进队列，
+#   由后台线程攒批格式化并写到 sys.stdout (以及可选的 config.LOG_FILE)，每批 flush 一次，
+#   取代原来散落各处的 print 与 desktop.py 中每次写入都 flush 的做法。
+# - 指标: span(name) 计时一段代码，按 (name, 其它标签, outcome) 聚合进直方图，
+#   render_metrics() 输出 Prometheus 文本格式，由 app.py 的 /metrics 暴露。
+#   指标保存在进程内存中，gunicorn 多 worker 部署时每个 worker 各自统计，由 Prometheus 按实例汇总。
+#
+# 主要的 span:
+#   http_request (endpoint, status)   每个 Flask 请求
+#   dify_call (mode)                  调用 Dify 生成题目
+#   json_extract                      从 LLM 回复中提取题目 JSON
+#   log_write / log_materialize       会话日志落盘 / 重放为 .json 视图
+#   mastery_compute (backend)         本地后端计算掌握度
+#   circuit_build                     构建 cqlib 电路
+#   cloud_submit / cloud_poll         提交云端任务 / 单次查询结果
+#   cloud_wait                        云端任务从提交到拿到结果的总时长 (排队 + 执行)
+
+import atexit
+import bisect
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import config
+except ImportError:
+    class MockConfig:
+        LOG_LEVEL = "INFO"
+        LOG_FILE = None
+        LOG_FLUSH_INTERVAL = 0.5
+        LOG_BATCH_SIZE = 256
+
+
+    config = MockConfig()
+
+# 覆盖从毫秒级的本地计算到分钟级的云端排队
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0,
+                   300.0, 600.0)
+
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(name)s] %(message)s"
+
+
+class BufferedLogHandler(logging.Handler):
+    """ emit 只入队；后台线程每 flush_interval 秒或攒满 batch_size 条写一次并 flush 一次 """
+
+    def __init__(self, log_file=None, flush_interval=None, batch_size=None):
+        super().__init__()
+        self.log_file = log_file
+        self.flush_interval = flush_interval or config.LOG_FLUSH_INTERVAL
+        self.batch_size = batch_size or config.LOG_BATCH_SIZE
+        self._file = open(log_file, 'a', encoding='utf-8') if log_file else None
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        atexit.register(self.close)
+
+    def emit(self, record):
+        try:
+            line = self.format(record) + "\n"
+            if self._pid != os.getpid():
+                self._start()
+            self._queue.put(line)
+        except Exception:
+            self.handleError(record)
+
+    def _start(self):
+        # 首次写日志时启动写线程；gunicorn --preload 在 fork 之后线程不会被继承，需要在子进程中重新启动
+        with self.lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._thread = threading.Thread(target=self._loop, name="log-writer", daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def _loop(self):
+        stopping = False
+        while not stopping:
+            lines = []
+            try:
+                lines.append(self._queue.get(timeout=self.flush_interval))
+                while len(lines) < self.batch_size:
+                    lines.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            if None in lines:
+                stopping = True
+                lines = [line for line in lines if line is not None]
+            if lines:
+                self._write("".join(lines))
+
+    def _write(self, text):
+        # 每批重新取 sys.stdout，兼容 desktop.py 对 stdout 的重定向
+        for stream in (sys.stdout, self._file):
+            if stream is None:
+                continue
+            try:
+                stream.write(text)
+                stream.flush()
+            except (OSError, ValueError):
+                pass
+
+    def close(self):
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(5)
+        if self._file:
+            self._file.close()
+            self._file = None
+        super().close()
+
+
+_logging_lock = threading.Lock()
+_logging_configured = False
+
+
+def setup_logging(level=None, log_file=None):
+    """ 配置根日志记录器 (只生效一次)；level 与 log_file 默认取自 config """
+    global _logging_configured
+    with _logging_lock:
+        if _logging_configured:
+            return
+        handler = BufferedLogHandler(log_file or config.LOG_FILE)
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        root = logging.getLogger()
+        root.addHandler(handler)
+        root.setLevel(str(level or config.LOG_LEVEL).upper())
+        _logging_configured = True
+
+
+def get_logger(name):
+    setup_logging()
+    return logging.getLogger(name)
+
+
+class Histogram(object):
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一格为 +Inf
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+
+
+class MetricsRegistry(object):
+    """ {(span 名, 排序后的标签)} -> 直方图，线程安全 """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    @contextmanager
+    def span(self, name, **labels):
+        """ 计时 with 块；块内抛出异常时 outcome="error" """
+        started = time.perf_counter()
+        outcome = "ok"
+        try:
+            yield labels
+        except BaseException:
+            outcome = "error"
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - started, outcome=outcome, **labels)
+
+    def snapshot(self):
+        with self._lock:
+            return {key: (list(h.counts), h.total) for key, h in self._histograms.items()}
+
+    def render(self):
+        """ Prometheus 文本格式 (text/plain; version=0.0.4) """
+        metric = "q_its_span_duration_seconds"
+        lines = [f"# HELP {metric} Duration of instrumented spans in seconds.", f"# TYPE {metric} histogram"]
+        for (name, labels), (counts, total) in sorted(self.snapshot().items()):
+            label_text = ",".join([f'span="{name}"'] + [f'{k}="{escape_label(v)}"' for k, v in labels])
+            cumulative = 0
+            for bound, count in zip(list(self.buckets) + ["+Inf"], counts):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f"{metric}_sum{{{label_text}}} {total}")
+            lines.append(f"{metric}_count{{{label_text}}} {cumulative}")
+        lines.append("# HELP q_its_process_start_time_seconds Start time of the process since unix epoch.")
+        lines.append("# TYPE q_its_process_start_time_seconds gauge")
+        lines.append(f'q_its_process_start_time_seconds{{pid="{os.getpid()}"}} {self.started_at}')
+        return "\n".join(lines) + "\n"
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+METRICS = MetricsRegistry()
+span = METRICS.span
+observe = METRICS.observe
+render_metrics = METRICS.render
+
+
+if __name__ == '__main__':
+    log = get_logger("observability")
+    for delay in (0.002, 0.02, 0.2):
+        with span("demo_sleep", kind="sleep"):
+            time.sleep(delay)
+    try:
+        with span("demo_error"):
+            raise ValueError("注入的错误")
+    except ValueError as e:
+        log.warning("span 记录了失败: %s", e)
+    print(render_metrics())
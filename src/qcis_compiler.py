@@ -0,0 +1,125 @@
+# 文件: src/qcis_compiler.py
+#
+# 掌握度电路的 QCIS 编译器。
+# 以前每次分析都要构造完整机器宽度的 cqlib Circuit (还要先导入 cqlib 及其依赖)，再逐个门生成 QCIS。
+# 电路结构只取决于各条链的长度与起始比特，角度才是唯一变化的部分，因此:
+#   - 按布局 ((长度, 起始比特), ...) 缓存 QCIS 模板，RY 的角度位置留作 {} 占位符;
+#   - 每次只把舍入后的角度格式化 (定点小数，去掉末尾的 0) 后填入模板;
+#   - 只输出活动比特上的门与测量;
+#   - 结果超出平台字符上限 (config.TIANYAN_QCIS_MAX_CHARS) 时逐位降低角度精度重试，
+#     低于 config.TIANYAN_MIN_ANGLE_PRECISION 仍超限则抛出 QCISTooLongError。
+# 门序列与本地模拟共用 quantum_backends.mastery_gate_list，保证云端电路与本地后端的定义一致。
+
+from functools import lru_cache
+
+try:
+    import config
+except ImportError:
+    class MockConfig:
+        TIANYAN_MACHINE_QUBITS = 16
+        TIANYAN_ANGLE_PRECISION = 12
+        TIANYAN_MIN_ANGLE_PRECISION = 6
+        TIANYAN_QCIS_MAX_CHARS = 8000
+
+
+    config = MockConfig()
+
+from observability import get_logger, span
+from quantum_backends import mastery_gate_list
+
+logger = get_logger(__name__)
+
+
+class QCISTooLongError(ValueError):
+    pass
+
+
+@lru_cache(maxsize=4096)
+def format_angle(theta, precision):
+    """ 定点格式，不会出现科学计数法: 2.0 -> "2"，0.1 -> "0.1" """
+    text = f"{theta:.{precision}f}".rstrip("0").rstrip(".")
+    return "0" if text in ("", "-0") else text
+
+
+@lru_cache(maxsize=1024)
+def qcis_template(layout):
+    """ layout: ((长度, 起始比特), ...)，返回带 {} 占位符的 QCIS 模板，占位符按链的先后、链内比特顺序排列 """
+    lines, measured = [], []
+    for length, offset in layout:
+        for gate, qubits, _ in mastery_gate_list([None] * length, offset=offset):
+            lines.append(" ".join([gate] + [f"Q{q}" for q in qubits] + (["{}"] if gate == "RY" else [])))
+        measured.extend(range(offset, offset + length))
+    # 按比特编号从小到大测量，结果比特串的第 i 位即第 i 个测量的比特 (见 quantum_batching.marginal_all_ones)
+    lines.extend(f"M Q{q}" for q in sorted(measured))
+    return "\n".join(lines)
+
+
+def compile_qcis(chains):
+    """
+    chains: [(thetas, offset), ...]，各链占用互不相交的比特区间。
+    返回满足字符上限的 QCIS 文本。
+    """
+    layout = tuple((len(thetas), offset) for thetas, offset in chains)
+    angles = [theta for thetas, _ in chains for theta in thetas]
+    with span("circuit_build"):
+        template = qcis_template(layout)
+        for precision in range(config.TIANYAN_ANGLE_PRECISION, config.TIANYAN_MIN_ANGLE_PRECISION - 1, -1):
+            qcis = template.format(*(format_angle(theta, precision) for theta in angles))
+            if len(qcis) <= config.TIANYAN_QCIS_MAX_CHARS:
+                if precision < config.TIANYAN_ANGLE_PRECISION:
+                    logger.warning("QCIS 超出 %s 字符上限，角度精度降为 %s 位小数", config.TIANYAN_QCIS_MAX_CHARS,
+                                   precision)
+                return qcis
+    raise QCISTooLongError(f"{len(angles)} 个比特的电路在 {config.TIANYAN_MIN_ANGLE_PRECISION} 位角度精度下"
+                           f"仍有 {len(qcis)} 个字符，超过平台上限 {config.TIANYAN_QCIS_MAX_CHARS}。")
+
+
+@lru_cache(maxsize=64)
+def max_submittable_qubits(machine_qubits=None):
+    """
+    单次提交最多能容纳的比特数: 不超过机器比特数，且最坏情况 (单条链、每个角度都取最长的
+    "d.ddd..." 形式、最低精度) 的 QCIS 不超过字符上限。多条链打包时 CZ 更少，长度只会更短。
+    """
+    machine_qubits = machine_qubits or config.TIANYAN_MACHINE_QUBITS
+    for n in range(machine_qubits, 0, -1):
+        worst = len(qcis_template(((n, 0),))) - 2 * n + n * (config.TIANYAN_MIN_ANGLE_PRECISION + 2)
+        if worst <= config.TIANYAN_QCIS_MAX_CHARS:
+            return n
+    return 0
+
+
+if __name__ == '__main__':
+    import math
+    import time
+
+    def cqlib_qcis(thetas):
+        """ 原来的做法: 构造完整机器宽度的 cqlib 电路 """
+        from cqlib import Circuit
+        circuit = Circuit(list(range(config.TIANYAN_MACHINE_QUBITS)))
+        for gate, qubits, param in mastery_gate_list(thetas):
+            if gate == "RY":
+                circuit.ry(qubits[0], param)
+            elif gate == "H":
+                circuit.h(qubits[0])
+            else:
+                circuit.cz(qubits[0], qubits[1])
+        for i in range(len(thetas)):
+            circuit.measure(i)
+        return circuit.qcis
+
+    # 编译结果与闭式解、与 cqlib 的一致性校验见 tests/test_qcis_compiler.py，这里只比较构建耗时
+    thetas = [round(s / 15.0 * math.pi, config.TIANYAN_ANGLE_PRECISION) for s in (11, 6, 1, 4, 15, 0)]
+    print(compile_qcis([(thetas, 0)]))
+    print(f"--- 模板 {len(compile_qcis([(thetas, 0)]))} 字符，cqlib {len(cqlib_qcis(thetas))} 字符 ---")
+
+    # 每次构建的耗时
+    started = time.perf_counter()
+    for _ in range(200):
+        cqlib_qcis(thetas)
+    cqlib_ms = (time.perf_counter() - started) / 200 * 1000
+    started = time.perf_counter()
+    for _ in range(200):
+        compile_qcis([(thetas, 0)])
+    compiled_ms = (time.perf_counter() - started) / 200 * 1000
+    print(f"--- 每次构建: cqlib {cqlib_ms:.3f} ms，模板 {compiled_ms:.3f} ms ---")
+    print(f"--- 字符上限 {config.TIANYAN_QCIS_MAX_CHARS} 下单次最多 {max_submittable_qubits()} 个比特 ---")
@@ -1,38 +1,20 @@
 # C:\Files\Workbench\PythonProjects\Q_ITS\src\Quantum\quantum.py
 
-import os
 import math
-import json
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
-try:
-    import cqlib
-    from cqlib import TianYanPlatform, Circuit
-    print("--- [quantum.py] cqlib 导入成功 ---")
-except ImportError:
-    print("!!! [quantum.py] 致命错误: cqlib 库未能导入。")
-    # 定义一个假的 Circuit 类以防止程序立即因 NameError 崩溃
-    class Circuit:
-        def __init__(self, *args, **kwargs): pass
-        def h(self, *args, **kwargs): pass
-        def ry(self, *args, **kwargs): pass
-        def cz(self, *args, **kwargs): pass
-        def measure(self, *args, **kwargs): pass
-        def execute(self, *args, **kwargs): return type('obj', (object,), {'result': [[]]})()
+from observability import get_logger, span
+
+logger = get_logger(__name__)
+
+# cqlib 依赖 sympy/networkx/rustworkx/matplotlib 等，导入需要约 1 秒；
+# 只有云端后端真正提交电路时才会在 quantum_backends.CloudBackend 中按需导入。
 
 try:
     import config
-    print("--- [quantum.py] config.py 导入成功 ---")
+    logger.debug("config.py 导入成功")
 except ImportError:
-    print("!!! [quantum.py] 致命错误: config.py 未能导入。")
-
-
-    class TianYanPlatform:
-        pass
-
-
-    class Circuit:
-        pass
+    logger.critical("config.py 未能导入。")
 
 
     class MockConfig:
@@ -41,10 +23,25 @@ except ImportError:
         TIANYAN_MACHINE_NAME = "tianyan_swn"
         TIANYAN_MACHINE_QUBITS = 16
         TIANYAN_ANGLE_PRECISION = 12
+        QUANTUM_BACKEND = "cloud"
+        STATEVECTOR_MAX_QUBITS = 24
+        QUANTUM_CHUNK_SIZE = None
+        QUANTUM_CHUNK_STRIDE = None
+        QUANTUM_CHUNK_WORKERS = 4
 
 
     config = MockConfig()
 
+from quantum_backends import get_backend, CloudBackend
+from qcis_compiler import max_submittable_qubits
+from mastery_cache import get_mastery_cache, make_cache_key
+from shot_allocation import ShotEstimate
+
+
+# 难度 -> 2 比特难度编码 (难度 4 与 5 共用最高档)
+DIFFICULTY_CODES = {1: 0b00, 2: 0b01, 3: 0b10, 4: 0b11, 5: 0b11}
+
+
 def get_mastery_feedback(score):
     if score >= 0.85: return {"level": "大师精通", "comment": "表现卓越！您已完全掌握了这部分知识。",
                               "suggestion": "太棒了！试试挑战一些更深或更广的难题吧！"}
@@ -55,86 +52,194 @@ def get_mastery_feedback(score):
     return {"level": "知识萌芽", "comment": "看起来您已经掌握了部分知识。",
             "suggestion": "再接再励，先仔细学习相关的知识点，弄懂概念后再来尝试。"}
 
-def calculate_mastery_from_log(session_data):
-    print(f"\n--- [{datetime.now()}] Quantum Analyzer: 开始处理会话数据 ---")
-    if not session_data:
-        return {"score": 0.0, "feedback": get_mastery_feedback(0.0)}
 
+def extract_classic_scores(session_data):
+    """ 把每道题的 feature_3d 编码为 4 比特综合分 (难度 2 位 + 表现 2 位)，范围 0~15 """
     classic_scores = []
-    for item in session_data:
+    for item in session_data or []:
         feature = item.get('feature_3d')
         if not feature: continue
-        d_map = {1: 0b00, 2: 0b01, 3: 0b10, 4: 0b11, 5: 0b11}
-        d_code = d_map.get(feature['difficulty'], 0b00)
+        d_code = DIFFICULTY_CODES.get(feature['difficulty'], 0b00)
         p_code = int(feature['performance_code'], 2)
         score = (d_code << 2) | p_code
         classic_scores.append(score)
-        print(
-            f"  - 题目 {item.get('question_num')}: 难度={feature['difficulty']}, 表现='{feature['performance_code']}' -> 综合分 = {score}/15")
-
-    if not classic_scores:
-        return {"score": 0.0, "feedback": get_mastery_feedback(0.0)}
+        logger.debug("题目 %s: 难度=%s, 表现='%s' -> 综合分 = %s/15",
+                     item.get('question_num'), feature['difficulty'], feature['performance_code'], score)
+    return classic_scores
+
+
+def scores_to_thetas(classic_scores):
+    logger.debug("正在将角度参数四舍五入到 %s 位小数...", config.TIANYAN_ANGLE_PRECISION)
+    return [round((s / 15.0) * math.pi, config.TIANYAN_ANGLE_PRECISION) for s in classic_scores]
+
+
+def chunk_size(backend=None):
+    """
+    窗口大小: config.QUANTUM_CHUNK_SIZE，默认且最多为单次云端提交的容量 (机器比特数与 QCIS 字符上限中较小者)；
+    给出 backend 时还不超过该后端能模拟的比特数 (StatevectorBackend.max_qubits)。
+    """
+    capacity = max_submittable_qubits()
+    if getattr(backend, 'max_qubits', None):
+        capacity = min(capacity, backend.max_qubits)
+    return min(config.QUANTUM_CHUNK_SIZE or capacity, capacity)
+
+
+def chunk_stride(size):
+    return config.QUANTUM_CHUNK_STRIDE or max(1, size // 2)
+
+
+def window_ends(num_scores, size, stride):
+    """
+    各窗口的结束位置 (不含)。答题数不超过窗口大小时只有一个覆盖整个会话的窗口 (与原来的单条链相同)；
+    否则窗口结束于 size, size + stride, size + 2 * stride, ...，最后一个窗口总是结束于最新的答案。
+    """
+    if num_scores <= size:
+        return [num_scores]
+    ends = list(range(size, num_scores + 1, stride))
+    if ends[-1] != num_scores:
+        ends.append(num_scores)
+    return ends
+
+
+def split_windows(classic_scores, size=None, stride=None):
+    """
+    把综合分序列切成相互重叠、每个不超过 size 个比特的窗口。
+    每个窗口是一条独立的 RY + CX 链，窗口的第一个答案充当链首 (贡献 sin^2)，其余答案贡献 cos^2。
+    """
+    size = size or chunk_size()
+    stride = stride or chunk_stride(size)
+    return [classic_scores[max(0, end - size):end] for end in window_ends(len(classic_scores), size, stride)]
+
+
+def aggregate_window_scores(window_scores):
+    """
+    长会话的掌握度 = 各窗口全 1 概率的算术平均。
+    整条链的全 1 概率随答题数按乘积衰减，长会话几乎总是趋近于 0；取窗口平均后，掌握度反映的是
+    任意 size 道连续题目上的表现，与短会话的分数处在同一量级，也能直接套用 get_mastery_feedback 的分档。
+    重叠使每个答案 (除会话开头与结尾外) 被 size / stride 个窗口覆盖，最后一个窗口总是包含最新的答案。
+    """
+    return sum(window_scores) / len(window_scores)
+
+
+def feedback_band(score):
+    return get_mastery_feedback(score)['level']
+
+
+def new_window_estimate(windows, backend):
+    """
+    返回 (ShotEstimate, 各窗口的缓存键)。命中结果缓存的窗口: 精确值直接预填，
+    云端采样值按缓存的累计 shots 还原 (仍带置信区间，结论未定时继续采样)。
+    """
+    keys = [make_cache_key(window, backend.cache_tag()) for window in windows]
+    increment, max_shots = backend.shot_plan() if backend.name == CloudBackend.name else (0, 0)
+    estimate = ShotEstimate(len(windows), feedback_band, increment, max_shots)
+    for index, key in enumerate(keys):
+        cached = get_mastery_cache().get_entry(key)
+        if cached is None:
+            continue
+        score, shots = cached
+        if shots:
+            estimate.restore(index, score, shots)
+        else:
+            estimate.set_exact(index, score)
+    return estimate, keys
+
+
+def cache_window_results(estimate, keys, indices):
+    """ 把窗口结果写回缓存；采样值连同累计 shots 一起保存 """
+    for index in indices:
+        shots = estimate.shots[index] if estimate.exact[index] is None else None
+        get_mastery_cache().put(keys[index], estimate.window_score(index), shots)
+
+
+def evaluate_windows(windows, backend):
+    """
+    逐窗口查结果缓存，未命中的窗口计算后写回缓存，返回 ShotEstimate。
+    本地后端的结果是精确值；云端后端按 backend.shot_plan() 逐轮采样 (自适应 shots)，同一轮的多个窗口并发提交。
+    """
+    estimate, keys = new_window_estimate(windows, backend)
+    increment = estimate.increment
+    missing = estimate.pending()
+    if len(missing) < len(windows):
+        logger.info("命中结果缓存 %s/%s 个窗口，跳过这些窗口的电路构建。", len(windows) - len(missing), len(windows))
+
+    if backend.name != CloudBackend.name:
+        for index in missing:
+            with span("mastery_compute", backend=backend.name):
+                estimate.set_exact(index, backend.all_ones_probability(scores_to_thetas(windows[index])))
+        cache_window_results(estimate, keys, missing)
+    elif missing:
+        sampler = backend.with_shots(increment)
+
+        def sample(index):
+            with span("mastery_compute", backend=backend.name):
+                return sampler.all_ones_probability(scores_to_thetas(windows[index]))
+
+        pending = missing
+        with ThreadPoolExecutor(max_workers=min(len(missing), config.QUANTUM_CHUNK_WORKERS)) as pool:
+            while pending:
+                for index, probability in zip(pending, pool.map(sample, pending)):
+                    estimate.add(index, probability, increment)
+                pending = estimate.pending()
+        logger.info("采样结束: 共 %s shots，掌握度区间 [%.4f, %.4f]", estimate.total_shots(), *estimate.interval())
+        cache_window_results(estimate, keys, estimate.updated())
+    return estimate
+
+
+def mastery_result(mastery_score, num_active_qubits, num_windows=1, estimate=None):
+    feedback = get_mastery_feedback(mastery_score)
+    if num_windows > 1:
+        logger.info("最终掌握度 (%s 个答案、%s 个窗口的全 1 概率平均) = %.4f，评估等级: %s",
+                    num_active_qubits, num_windows, mastery_score, feedback['level'])
+        result = {"score": mastery_score, "feedback": feedback, "windows": num_windows}
+    else:
+        all_ones_state = '1' * num_active_qubits
+        logger.info("最终掌握度 (测量到 '%s' 的概率) = %.4f，评估等级: %s", all_ones_state, mastery_score,
+                    feedback['level'])
+        result = {"score": mastery_score, "feedback": feedback}
+    if estimate is not None and estimate.sampled():
+        # 云端采样的结果附带置信区间与累计的 shots (含缓存中的采样结果)
+        result["interval"] = list(estimate.interval())
+        result["shots"] = estimate.total_shots()
+    return result
 
-    num_active_qubits = len(classic_scores)
 
-    # <<< MODIFIED: 使用 config 中的变量
-    if num_active_qubits > config.TIANYAN_MACHINE_QUBITS:
-        error_msg = f"用户答题数({num_active_qubits})超过了所选机器 '{config.TIANYAN_MACHINE_NAME}' 的容量({config.TIANYAN_MACHINE_QUBITS})。"
-        print(f"--- Quantum Analyzer: 严重错误: {error_msg}")
-        return {"score": 0.0,
-                "feedback": {"level": "系统错误", "comment": error_msg, "suggestion": "请减少答题数量或联系管理员。"}}
+def error_result(e):
+    logger.error("量子计算过程中发生严重错误: %s", e)
+    return {"score": 0.0, "feedback": {"level": "计算错误", "comment": "在与量子平台通信时发生错误。",
+                                       "suggestion": f"请检查后台日志。错误摘要: {str(e)}"}}
 
-    print(
-        f"--- Quantum Analyzer: 已生成 {num_active_qubits} 个经典分数。将构建一个 {config.TIANYAN_MACHINE_QUBITS} 比特的电路以适配 '{config.TIANYAN_MACHINE_NAME}'。")
-    print(f"--- Quantum Analyzer: 正在将角度参数四舍五入到 {config.TIANYAN_ANGLE_PRECISION} 位小数...")
-    thetas = [round((s / 15.0) * math.pi, config.TIANYAN_ANGLE_PRECISION) for s in classic_scores]
 
-    print("--- Quantum Analyzer: 正在构建量子电路...")
-    q_circuit = Circuit(list(range(config.TIANYAN_MACHINE_QUBITS)))
+def calculate_mastery_from_log(session_data, backend=None):
+    logger.info("开始处理会话数据")
+    if not session_data:
+        return {"score": 0.0, "feedback": get_mastery_feedback(0.0)}
 
-    for i, theta in enumerate(thetas):
-        q_circuit.ry(i, theta)
+    classic_scores = extract_classic_scores(session_data)
+    if not classic_scores:
+        return {"score": 0.0, "feedback": get_mastery_feedback(0.0)}
 
-    if num_active_qubits > 1:
-        print("--- Quantum Analyzer: 正在应用纠缠门 (手动分解 CX 为 H-CZ-H)...")
-        for i in range(num_active_qubits - 1):
-            q_circuit.h(i + 1)
-            q_circuit.cz(i, i + 1)
-            q_circuit.h(i + 1)
+    num_active_qubits = len(classic_scores)
 
-    print(f"--- Quantum Analyzer: 只精确测量 {num_active_qubits} 个活动量子比特...")
-    for i in range(num_active_qubits):
-        q_circuit.measure(i)
+    backend = get_backend(backend)
 
-    print("--- Quantum Analyzer: 电路构建完成。")
+    # <<< MODIFIED: 答题数超过窗口大小 (默认为单次云端提交的容量) 时分窗计算，不再直接拒绝
+    windows = split_windows(classic_scores, size=chunk_size(backend))
+    if len(windows) > 1:
+        logger.info("答题数 %s 超过窗口大小 %s，分为 %s 个重叠窗口计算。", num_active_qubits, len(windows[0]), len(windows))
+    logger.info("已生成 %s 个经典分数，使用后端 '%s'。", num_active_qubits, backend.name)
 
     try:
-        print(f"--- Quantum Analyzer: 正在连接天衍平台并提交任务至模拟器 '{config.TIANYAN_MACHINE_NAME}'...")
-        platform = TianYanPlatform(login_key=config.TIANYAN_LOGIN_KEY, machine_name=config.TIANYAN_MACHINE_NAME)
-        query_id = platform.submit_experiment(q_circuit.qcis, num_shots=config.TIANYAN_NUM_SHOTS)
-        print(f"  - 任务提交成功, Query ID: {query_id}")
-        data = platform.query_experiment(query_id)
-        # print(f"--- Quantum Analyzer: 从平台接收到的原始数据:\n{json.dumps(data, indent=2, ensure_ascii=False)}")
-
-        if not data or 'probability' not in data[0]:
-            raise ValueError("从平台查询到的任务结果为空或格式不正确。")
-
-        results = json.loads(data[0]['probability'])
-        all_ones_state = '1' * num_active_qubits
-        mastery_score = results.get(all_ones_state, 0.0)
-
-        print(f"--- Quantum Analyzer: 最终掌握度 (测量到 '{all_ones_state}' 的概率) = {mastery_score:.4f} ---")
-        feedback = get_mastery_feedback(mastery_score)
-        print(f"--- Quantum Analyzer: 评估等级: {feedback['level']} ---")
-        return {"score": mastery_score, "feedback": feedback}
-
+        estimate = evaluate_windows(windows, backend)
     except Exception as e:
-        print(f"--- Quantum Analyzer: 量子计算过程中发生严重错误: {e}")
-        return {"score": 0.0, "feedback": {"level": "计算错误", "comment": "在与量子平台通信时发生错误。",
-                                           "suggestion": f"请检查后台日志。错误摘要: {str(e)}"}}
+        return error_result(e)
+    return mastery_result(aggregate_window_scores(estimate.window_scores()), num_active_qubits, len(windows),
+                          estimate)
 
 
 if __name__ == '__main__':
+    import sys
+
     print("--- 正在以独立模式运行 quantum.py 进行测试 ---")
     test_log_data = [
         {"correct_answer": "A", "difficulty": 3, "explanation": "...",
@@ -151,8 +256,9 @@ if __name__ == '__main__':
          "question_num": 4, "question_text": "...", "time_taken": 2.91, "user_answer": "C"}
     ]
 
-    final_score = calculate_mastery_from_log(test_log_data)
+    # 默认使用闭式解，不连接天衍；analytic / statevector / 云端 QCIS 三者的交叉校验见 tests/test_quantum_backends.py
+    backend_name = sys.argv[1] if len(sys.argv) > 1 else "analytic"
+    final_score = calculate_mastery_from_log(test_log_data, backend=backend_name)
 
     print("\n--- 测试完成 ---")
-    print(f"最终计算出的掌握度分数为: {final_score}")
-    pass
\ No newline at end of file
+    print(f"后端 '{backend_name}' 计算出的掌握度分数为: {final_score}")
@@ -0,0 +1,289 @@
+# 文件: src/quantum_backends.py
+#
+# 量子计算后端层。掌握度电路的结构是固定的:
+#   每个活动比特先做 RY(theta_i)，然后沿链依次施加 CX(i, i+1) (手动分解为 H-CZ-H)，
+#   最后只测量活动比特，读取全 1 比特串的概率。
+# 本模块提供三种可互相替换的后端:
+#   - "cloud":       提交到天衍云平台 (原有路径)
+#   - "statevector": 本地 NumPy 向量化态矢量模拟, O(n * 2^n)
+#   - "analytic":    针对 RY + CX 链拓扑的闭式解, O(n)
+
+# numpy 只在本地态矢量模拟中用到，cqlib 只在云端后端提交任务时用到，均在首次使用时导入，以缩短应用启动时间。
+
+import json
+import math
+import time
+
+from observability import get_logger, span
+from device_manager import DeviceManager, get_device_manager
+from rate_limit import get_upstream_limiter
+
+logger = get_logger(__name__)
+
+try:
+    import config
+except ImportError:
+    class MockConfig:
+        TIANYAN_LOGIN_KEY = ""
+        TIANYAN_NUM_SHOTS = 2048
+        TIANYAN_MACHINE_NAME = "tianyan_swn"
+        TIANYAN_MACHINE_QUBITS = 16
+        TIANYAN_PLATFORM = "cqlib"
+        TIANYAN_ADAPTIVE_SHOTS = False
+        TIANYAN_SHOT_INCREMENT = 1024
+        TIANYAN_MAX_SHOTS = 8192
+        TIANYAN_MAX_SHOT_ROUNDS = 4
+        QUANTUM_BACKEND = "cloud"
+        STATEVECTOR_MAX_QUBITS = 24
+        QUANTUM_JOB_POLL_INITIAL = 1.0
+        QUANTUM_JOB_POLL_MAX = 15.0
+        QUANTUM_JOB_POLL_BACKOFF = 2.0
+        QUANTUM_JOB_TIMEOUT = 600
+
+
+    config = MockConfig()
+
+
+def mastery_gate_list(thetas, offset=0):
+    """
+    生成掌握度电路的门序列 [(门名, 比特元组, 参数)]，云端电路与本地模拟共用同一份定义。
+    offset 把整条链平移到从第 offset 个比特开始，用于把多个会话打包进同一个电路。
+    """
+    gates = [("RY", (offset + i,), theta) for i, theta in enumerate(thetas)]
+    for i in range(offset, offset + len(thetas) - 1):
+        gates.append(("H", (i + 1,), None))
+        gates.append(("CZ", (i, i + 1), None))
+        gates.append(("H", (i + 1,), None))
+    return gates
+
+
+class QuantumBackend(object):
+    """ 后端基类: 给定 RY 角度列表，返回测量到全 1 比特串的概率 """
+    name = "base"
+
+    def cache_tag(self):
+        """ 结果缓存键中标识后端的部分；本地后端的结果是精确值，只需后端名 """
+        return self.name
+
+    def all_ones_probability(self, thetas):
+        raise NotImplementedError
+
+
+class AnalyticBackend(QuantumBackend):
+    """
+    RY + CX 链的闭式解。CX 链把计算基 x 映射为前缀奇偶 y_k = x_0 ^ ... ^ x_k，
+    是一个置换，因此输出全 1 只对应输入 x = 100...0:
+        P(1...1) = sin^2(theta_0 / 2) * prod_{k>=1} cos^2(theta_k / 2)
+    """
+    name = "analytic"
+
+    def all_ones_probability(self, thetas):
+        if not thetas:
+            return 0.0
+        # 会话最多几十道题，纯 Python 比构造 NumPy 数组更快
+        return math.sin(thetas[0] / 2) ** 2 * math.prod(math.cos(t / 2) ** 2 for t in thetas[1:])
+
+
+class StatevectorBackend(QuantumBackend):
+    """ 通用的 NumPy 态矢量模拟器，按门序列逐个作用，比特 0 对应最高位 """
+    name = "statevector"
+
+    def __init__(self, max_qubits=None):
+        import numpy as np
+        self.np = np
+        self.max_qubits = max_qubits or getattr(config, 'STATEVECTOR_MAX_QUBITS', 24)
+        self._H = np.array([[1, 1], [1, -1]], dtype=complex) / math.sqrt(2)
+
+    def _ry(self, theta):
+        c, s = math.cos(theta / 2), math.sin(theta / 2)
+        return self.np.array([[c, -s], [s, c]], dtype=complex)
+
+    def _apply_1q(self, state, n, qubit, matrix):
+        view = state.reshape(2 ** qubit, 2, 2 ** (n - qubit - 1))
+        return self.np.einsum('ij,ajb->aib', matrix, view).reshape(-1)
+
+    @staticmethod
+    def _apply_cz(state, n, q1, q2):
+        view = state.reshape((2,) * n)
+        index = [slice(None)] * n
+        index[q1] = 1
+        index[q2] = 1
+        view[tuple(index)] *= -1
+        return state
+
+    def run_gates(self, num_qubits, gates):
+        """ 执行门序列，返回末态振幅 (长度 2^n) """
+        if num_qubits > self.max_qubits:
+            raise ValueError(f"态矢量模拟最多支持 {self.max_qubits} 个比特，请求了 {num_qubits} 个。")
+        state = self.np.zeros(2 ** num_qubits, dtype=complex)
+        state[0] = 1.0
+        for gate, qubits, param in gates:
+            if gate == "RY":
+                state = self._apply_1q(state, num_qubits, qubits[0], self._ry(param))
+            elif gate == "H":
+                state = self._apply_1q(state, num_qubits, qubits[0], self._H)
+            elif gate == "CZ":
+                state = self._apply_cz(state, num_qubits, qubits[0], qubits[1])
+            else:
+                raise ValueError(f"不支持的门: {gate}")
+        return state
+
+    def run_qcis(self, qcis, num_qubits):
+        """ 解析并执行 QCIS 文本 (忽略测量指令)，用于在本地校验提交到云端的电路 """
+        gates = []
+        for line in qcis.strip().splitlines():
+            parts = line.split()
+            if not parts or parts[0] == "M":
+                continue
+            qubits = tuple(int(p[1:]) for p in parts[1:] if p.startswith("Q"))
+            param = float(parts[-1]) if parts[0] == "RY" else None
+            gates.append((parts[0], qubits, param))
+        return self.run_gates(num_qubits, gates)
+
+    def all_ones_probability(self, thetas):
+        if not thetas:
+            return 0.0
+        state = self.run_gates(len(thetas), mastery_gate_list(thetas))
+        return float(abs(state[-1]) ** 2)
+
+
+def default_platform_factory(machine_name):
+    if config.TIANYAN_PLATFORM == "fake":
+        from fake_tianyan import FakeTianYanPlatform
+        return FakeTianYanPlatform(machine_name=machine_name)
+    from cqlib import TianYanPlatform
+    return TianYanPlatform(login_key=config.TIANYAN_LOGIN_KEY, machine_name=machine_name)
+
+
+class CloudBackend(QuantumBackend):
+    """
+    原有的天衍云平台路径: 由 qcis_compiler 生成只含活动比特的 QCIS 文本并提交。
+    提交 (submit) 与取结果 (fetch) 分开暴露，供后台任务系统做非阻塞轮询；
+    platform_factory 可替换为本地假平台。
+    machine_name 为空时由 device_manager 按策略在多台设备间路由并故障转移，
+    submit / fetch 只能在 on_device 得到的指定设备实例上调用。
+    每次调用平台接口 (提交、查询) 时占用一个天衍并发名额，等待结果的间隔中不占用。
+    """
+    name = "cloud"
+
+    def __init__(self, machine_name=None, num_shots=None, platform_factory=None, device_manager=None, adaptive=None):
+        self.machine_name = machine_name
+        self.num_shots = num_shots or config.TIANYAN_NUM_SHOTS
+        self.platform_factory = platform_factory or default_platform_factory
+        self._device_manager = device_manager
+        self.adaptive = config.TIANYAN_ADAPTIVE_SHOTS if adaptive is None else adaptive
+
+    def cache_tag(self):
+        return f"{self.name}:{self.machine_name or 'routed'}:{'adaptive' if self.adaptive else self.num_shots}"
+
+    def shot_plan(self):
+        """ (每轮 shots, 每个窗口的 shots 上限)；自适应时上限同时受轮数限制，固定 shots 时只提交一轮 """
+        if self.adaptive:
+            increment = config.TIANYAN_SHOT_INCREMENT
+            return increment, min(config.TIANYAN_MAX_SHOTS, increment * config.TIANYAN_MAX_SHOT_ROUNDS)
+        return self.num_shots, self.num_shots
+
+    def with_shots(self, num_shots):
+        """ 每次提交固定 num_shots 次测量的副本，供自适应采样逐轮提交 """
+        return CloudBackend(self.machine_name, num_shots, self.platform_factory, self.device_manager, adaptive=False)
+
+    @property
+    def device_manager(self):
+        if self._device_manager is None:
+            if self.platform_factory is default_platform_factory:
+                self._device_manager = get_device_manager()
+            else:
+                self._device_manager = DeviceManager(self.platform_factory)
+        return self._device_manager
+
+    def on_device(self, machine_name):
+        return CloudBackend(machine_name, self.num_shots, self.platform_factory, self._device_manager, self.adaptive)
+
+    @staticmethod
+    def build_circuit(thetas):
+        """ 单个会话的 QCIS 文本 """
+        # qcis_compiler 依赖本模块的 mastery_gate_list，在这里导入以避免循环导入
+        from qcis_compiler import compile_qcis
+        return compile_qcis([(thetas, 0)])
+
+    def submit_circuit(self, qcis):
+        """ 提交 QCIS 文本，返回 (platform, query_id) """
+        if not self.machine_name:
+            raise ValueError("未指定设备: 请先用 on_device 选择设备，或调用 all_ones_probability 自动路由。")
+        logger.info("正在连接天衍平台并提交任务至 '%s' (%s 字符)...", self.machine_name, len(qcis))
+        with span("cloud_submit", machine=self.machine_name):
+            platform = self.platform_factory(self.machine_name)
+            with get_upstream_limiter("tianyan").slot():
+                query_id = platform.submit_experiment(qcis, num_shots=self.num_shots)
+        logger.info("任务提交成功, Query ID: %s", query_id)
+        return platform, query_id
+
+    def submit(self, thetas):
+        return self.submit_circuit(self.build_circuit(thetas))
+
+    @staticmethod
+    def parse_probabilities(data):
+        """ 把平台返回的结果解析为 {比特串: 概率} """
+        if not data or 'probability' not in data[0]:
+            raise ValueError("从平台查询到的任务结果为空或格式不正确。")
+        results = data[0]['probability']
+        if isinstance(results, str):
+            results = json.loads(results)
+        return results
+
+    def fetch_probabilities(self, platform, query_id):
+        """ 只查询一次任务结果: 已完成时返回 {比特串: 概率}，尚未完成 (或并发名额已满) 时返回 None """
+        with span("cloud_poll", machine=self.machine_name) as labels:
+            try:
+                # cqlib 的 query_experiment 内部自带阻塞重试；极短的 max_wait_time 让它只发一次请求
+                with get_upstream_limiter("tianyan").slot():
+                    data = platform.query_experiment(query_id, max_wait_time=0.001, sleep_time=0)
+            except Exception as e:
+                labels["result"] = "pending"
+                logger.debug("任务 %s 尚未完成: %s", query_id, e)
+                return None
+            labels["result"] = "ready"
+        if not data:
+            return None
+        return self.parse_probabilities(data)
+
+    def wait_probabilities(self, platform, query_id, timeout=None, poll_initial=None, poll_max=None,
+                           poll_backoff=None):
+        """ 按指数退避调用 fetch_probabilities，直到拿到 {比特串: 概率} 或超时；等待间隔中不占用天衍并发名额 """
+        timeout = timeout or config.QUANTUM_JOB_TIMEOUT
+        delay = poll_initial or config.QUANTUM_JOB_POLL_INITIAL
+        poll_max = poll_max or config.QUANTUM_JOB_POLL_MAX
+        poll_backoff = poll_backoff or config.QUANTUM_JOB_POLL_BACKOFF
+        deadline = time.time() + timeout
+        while True:
+            probabilities = self.fetch_probabilities(platform, query_id)
+            if probabilities is not None:
+                return probabilities
+            if time.time() + delay > deadline:
+                raise TimeoutError(f"任务 {query_id} 在 {timeout} 秒内未返回结果。")
+            time.sleep(delay)
+            delay = min(delay * poll_backoff, poll_max)
+
+    def all_ones_probability(self, thetas):
+        if not self.machine_name:
+            return self.device_manager.run_with_failover(
+                len(thetas), lambda machine_name: self.on_device(machine_name).all_ones_probability(thetas))
+        platform, query_id = self.submit(thetas)
+        with span("cloud_wait", machine=self.machine_name):
+            probabilities = self.wait_probabilities(platform, query_id)
+        return probabilities.get('1' * len(thetas), 0.0)
+
+
+BACKENDS = {
+    AnalyticBackend.name: AnalyticBackend,
+    StatevectorBackend.name: StatevectorBackend,
+    CloudBackend.name: CloudBackend,
+}
+
+
+def get_backend(name=None):
+    """ 按名称获取后端实例；name 为空时使用 config.QUANTUM_BACKEND """
+    name = name or getattr(config, 'QUANTUM_BACKEND', 'cloud')
+    if name not in BACKENDS:
+        raise ValueError(f"未知的量子后端: '{name}'，可选: {', '.join(BACKENDS)}")
+    return BACKENDS[name]()
@@ -0,0 +1,106 @@
+# 文件: src/quantum_batching.py
+#
+# 把多个会话的掌握度电路打包到同一次天衍提交中。
+# 每个会话的 RY + CX 链只占用 len(thetas) 个比特，且各条链之间没有纠缠，
+# 因此可以把它们放到同一个电路中互不相交的比特区间上，提交一次，
+# 再从联合概率分布中对每个区间求边缘概率，得到各自"全 1"的概率。
+
+import threading
+import time
+
+try:
+    import config
+except ImportError:
+    class MockConfig:
+        TIANYAN_MACHINE_QUBITS = 16
+        QUANTUM_BATCH_WINDOW = 0.5
+        QUANTUM_BATCH_MAX_SESSIONS = 8
+
+
+    config = MockConfig()
+
+from observability import get_logger
+from qcis_compiler import max_submittable_qubits
+
+logger = get_logger(__name__)
+
+
+def pack_sessions(pending, capacity, max_sessions=None):
+    """
+    按先来先服务从 pending [(key, thetas)] 中挑出能放进 capacity 个比特的一批，
+    返回 (batch, rest)，batch 为 [(key, thetas, offset)]。
+    较长的会话放不下时跳过它继续尝试后面的会话，但队首会话一定会被放入，保证不会饿死。
+    """
+    batch, rest = [], []
+    offset = 0
+    for key, thetas in pending:
+        fits = offset + len(thetas) <= capacity
+        if fits and (max_sessions is None or len(batch) < max_sessions):
+            batch.append((key, thetas, offset))
+            offset += len(thetas)
+        else:
+            rest.append((key, thetas))
+    return batch, rest
+
+
+def marginal_all_ones(probabilities, offset, length):
+    """
+    从联合分布 {比特串: 概率} 中求区间 [offset, offset + length) 全为 1 的边缘概率。
+    天衍返回的比特串按测量指令顺序排列，而我们按比特编号从小到大依次测量，所以第 i 位即比特 i。
+    """
+    target = '1' * length
+    return sum(p for bits, p in probabilities.items() if bits[offset:offset + length] == target)
+
+
+class CloudBatchScheduler(object):
+    """
+    收集一个时间窗口内的云端任务，打包提交。
+    run_batch(batch) 由调用方提供，负责提交与轮询并对每个 key 回调结果；
+    它在调用方的线程池中执行，调度线程本身只负责攒批。
+    """
+
+    def __init__(self, run_batch, executor, capacity=None, window=None, max_sessions=None):
+        self.run_batch = run_batch
+        self.executor = executor
+        self.capacity = capacity or max_submittable_qubits()
+        self.window = config.QUANTUM_BATCH_WINDOW if window is None else window
+        self.max_sessions = max_sessions or config.QUANTUM_BATCH_MAX_SESSIONS
+        self._pending = []
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._loop, name="quantum-batcher", daemon=True)
+        self._thread.start()
+
+    def enqueue(self, key, thetas):
+        if len(thetas) > self.capacity:
+            raise ValueError(f"会话需要 {len(thetas)} 个比特，超过了单次提交的容量 {self.capacity}。")
+        with self._cond:
+            self._pending.append((key, thetas))
+            self._cond.notify()
+
+    def _pending_qubits(self):
+        return sum(len(thetas) for _, thetas in self._pending)
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopped:
+                    self._cond.wait()
+                if self._stopped and not self._pending:
+                    return
+                # 第一个任务到达后再等待一个窗口，除非比特或会话数已经攒满
+                deadline = time.time() + self.window
+                while (not self._stopped and time.time() < deadline
+                       and self._pending_qubits() < self.capacity
+                       and len(self._pending) < self.max_sessions):
+                    self._cond.wait(deadline - time.time())
+                batch, self._pending = pack_sessions(self._pending, self.capacity, self.max_sessions)
+            logger.info("打包 %s 个会话, 共 %s/%s 个比特", len(batch),
+                        sum(len(thetas) for _, thetas, _ in batch), self.capacity)
+            self.executor.submit(self.run_batch, batch)
+
+    def shutdown(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._thread.join()
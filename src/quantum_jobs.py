@@ -0,0 +1,446 @@
+# 文件: src/quantum_jobs.py
+#
+# 量子分析的后台任务系统。
+# /get-quantum-analysis 只负责把电路放入队列并立即返回 job_id，
+# 由线程池中的工作线程提交到天衍平台并按指数退避轮询结果，
+# 前端再通过 /quantum-jobs/<job_id> 查询状态，不再让 gunicorn 的同步 worker 被远端排队时间占住。
+# 云端任务先进入 CloudBatchScheduler 攒批，同一窗口内的多个会话合并为一次提交。
+# 电路相同 (结果缓存键相同) 的任务在执行中时，新任务跟随已有任务、一起结束，不重复提交；
+# 未完成的云端任务超过 config.QUANTUM_JOB_MAX_PENDING 时，submit 抛出 UpstreamBusyError 供调用方回 429。
+# 执行中的状态 (采样进度、攒批、合并) 只在提交任务的进程里；每次状态变化时把任务快照写入共享的
+# SQLite 文件 (config.QUANTUM_JOB_DB_FILE)，gunicorn 多 worker 部署时轮询落到任何一个 worker 都能读到。
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from observability import get_logger, span
+
+try:
+    import config
+except ImportError:
+    class MockConfig:
+        QUANTUM_JOB_WORKERS = 8
+        QUANTUM_JOB_POLL_INITIAL = 1.0
+        QUANTUM_JOB_POLL_MAX = 15.0
+        QUANTUM_JOB_POLL_BACKOFF = 2.0
+        QUANTUM_JOB_TIMEOUT = 600
+        QUANTUM_JOB_TTL = 3600
+        QUANTUM_JOB_MAX_PENDING = 200
+        QUANTUM_JOB_DB_FILE = None
+        QUANTUM_BATCH_WINDOW = 0.5
+        QUANTUM_BATCH_MAX_SESSIONS = 8
+
+
+    config = MockConfig()
+
+import quantum
+from quantum_backends import get_backend, CloudBackend
+from quantum_batching import CloudBatchScheduler, marginal_all_ones
+from qcis_compiler import compile_qcis
+from device_manager import DeviceManager, get_device_manager
+from rate_limit import UpstreamBusyError
+
+logger = get_logger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+# 任务快照的公开字段: get() 只返回这些字段，也只把它们写入共享存储 (其余字段是提交进程内的执行状态)
+SHARED_FIELDS = ("job_id", "status", "backend", "owner", "session_key", "query_id", "device", "num_answers",
+                 "result", "error", "created_at", "finished_at")
+
+
+class SQLiteJobStore(object):
+    """
+    任务快照的共享存储，与 session_store.SQLiteSessionStore 相同: 每个线程一个连接，WAL 模式。
+    每个快照带递增的版本号，写入顺序被线程调度打乱时旧快照不会覆盖新快照。
+    """
+
+    PURGE_EVERY = 200
+
+    def __init__(self, db_path, ttl):
+        self.db_path = db_path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._saves = 0
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS quantum_jobs (job_id TEXT PRIMARY KEY, version INTEGER NOT NULL, "
+                     "data TEXT NOT NULL, created_at REAL NOT NULL, finished_at REAL)")
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.db_path, timeout=10)
+        return conn
+
+    def save(self, snapshot, version):
+        conn = self._conn()
+        conn.execute("INSERT INTO quantum_jobs (job_id, version, data, created_at, finished_at) VALUES (?, ?, ?, ?, ?) "
+                     "ON CONFLICT(job_id) DO UPDATE SET version = excluded.version, data = excluded.data, "
+                     "finished_at = excluded.finished_at WHERE excluded.version > quantum_jobs.version",
+                     (snapshot["job_id"], version, json.dumps(snapshot, ensure_ascii=False),
+                      snapshot["created_at"], snapshot["finished_at"]))
+        self._saves += 1
+        if self._saves % self.PURGE_EVERY == 0:
+            # 未结束的快照 (例如提交它的进程已退出) 按创建时间清理
+            expired = time.time() - self.ttl
+            conn.execute("DELETE FROM quantum_jobs WHERE COALESCE(finished_at, created_at) < ?", (expired,))
+        conn.commit()
+
+    def load(self, job_id):
+        row = self._conn().execute("SELECT data FROM quantum_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+
+class QuantumJobManager(object):
+    """
+    线程池 + 内存任务表，快照同步写入共享存储 (db_path 为 None 时只用内存，适合单进程的桌面版)。
+    本地后端直接在 submit 中完成，只有云端后端进入后台队列。
+    """
+
+    def __init__(self, max_workers=None, poll_initial=None, poll_max=None, poll_backoff=None,
+                 timeout=None, ttl=None, platform_factory=None, batch_window=None, batch_max_sessions=None,
+                 max_pending=None, db_path=None):
+        self.max_workers = max_workers or config.QUANTUM_JOB_WORKERS
+        self.poll_initial = poll_initial or config.QUANTUM_JOB_POLL_INITIAL
+        self.poll_max = poll_max or config.QUANTUM_JOB_POLL_MAX
+        self.poll_backoff = poll_backoff or config.QUANTUM_JOB_POLL_BACKOFF
+        self.timeout = timeout or config.QUANTUM_JOB_TIMEOUT
+        self.ttl = ttl or config.QUANTUM_JOB_TTL
+        self.max_pending = max_pending or config.QUANTUM_JOB_MAX_PENDING
+        self.platform_factory = platform_factory
+        self.devices = DeviceManager(platform_factory) if platform_factory else get_device_manager()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="quantum-job")
+        self._jobs = {}
+        self._store = SQLiteJobStore(db_path, self.ttl) if db_path else None
+        # 结果缓存键 (各窗口键的元组) -> 正在执行的任务 id，用于合并相同的任务
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._batcher = CloudBatchScheduler(self._run_batch, self._executor, window=batch_window,
+                                            max_sessions=batch_max_sessions)
+
+    def _new_job(self, backend_name, owner, session_key):
+        job = {"job_id": uuid.uuid4().hex, "status": JOB_QUEUED, "backend": backend_name, "owner": owner,
+               "session_key": session_key,
+               "query_id": None, "device": None, "window_keys": None, "window_thetas": None,
+               "estimate": None, "outstanding": None, "num_answers": 0,
+               "coalesce_key": None, "leader": None, "followers": [],
+               "result": None, "error": None, "created_at": time.time(), "finished_at": None, "version": 0}
+        with self._lock:
+            self._purge_expired()
+            self._jobs[job["job_id"]] = job
+        return job
+
+    def _snapshot(self, job):
+        """ 在 self._lock 内调用: 版本号加一，返回要写入共享存储的 (快照, 版本号) """
+        job["version"] += 1
+        return {field: job[field] for field in SHARED_FIELDS}, job["version"]
+
+    def _publish(self, snapshots):
+        """ 在锁外写入共享存储；写入失败 (例如数据库被锁超时) 只记录日志，不影响任务本身 """
+        if self._store is None:
+            return
+        for snapshot, version in snapshots:
+            try:
+                self._store.save(snapshot, version)
+            except sqlite3.Error as e:
+                logger.warning("Quantum Job %s: 写入共享任务表失败: %s", snapshot["job_id"], e)
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs[job_id]
+            job.update(fields)
+            snapshot = self._snapshot(job)
+        self._publish([snapshot])
+
+    def _finish(self, job_id, **fields):
+        """ 结束任务，同时结束跟随它的任务，之后相同的请求重新提交 """
+        fields["finished_at"] = time.time()
+        with self._lock:
+            job = self._jobs[job_id]
+            job.update(fields)
+            snapshots = [self._snapshot(job)]
+            if self._inflight.get(job["coalesce_key"]) == job_id:
+                del self._inflight[job["coalesce_key"]]
+            for follower_id in job["followers"]:
+                if follower_id in self._jobs:
+                    follower = self._jobs[follower_id]
+                    follower.update(fields, query_id=job["query_id"], device=job["device"])
+                    snapshots.append(self._snapshot(follower))
+        self._publish(snapshots)
+        logger.info("Quantum Job %s: 结束，状态 %s (跟随任务 %s 个)", job_id, fields["status"], len(job["followers"]))
+
+    def _purge_expired(self):
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job["finished_at"] and now - job["finished_at"] > self.ttl]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def submit(self, session_data, backend=None, owner=None, session_key=None):
+        """
+        创建一个分析任务并返回任务快照；owner 用于限制只有发起者能读取结果，
+        session_key 标识发起任务的答题会话 (例如日志文件名)，供调用方只把结果记入同一个会话
+        """
+        backend = get_backend(backend)
+        job = self._new_job(backend.name, owner, session_key)
+
+        if backend.name != CloudBackend.name:
+            # 本地后端只需微秒级计算，直接完成，无需占用线程池
+            result = quantum.calculate_mastery_from_log(session_data, backend=backend.name)
+            self._update(job["job_id"], status=JOB_DONE, result=result, finished_at=time.time())
+            return self.get(job["job_id"])
+
+        logger.info("Quantum Job %s: 开始处理", job['job_id'])
+        classic_scores = quantum.extract_classic_scores(session_data)
+        if not classic_scores:
+            self._update(job["job_id"], status=JOB_DONE, finished_at=time.time(),
+                         result={"score": 0.0, "feedback": quantum.get_mastery_feedback(0.0)})
+            return self.get(job["job_id"])
+
+        # 长会话按窗口拆分，每个窗口作为一条独立的链进入攒批队列，与其它会话的链一起打包提交；
+        # 每轮结果回来后由 ShotEstimate 判断掌握度档位是否已确定，未确定的窗口再入队采样一轮
+        windows = quantum.split_windows(classic_scores)
+        estimate, window_keys = quantum.new_window_estimate(windows, backend)
+        pending = estimate.pending()
+        if not pending:
+            logger.info("Quantum Job %s: 命中结果缓存 (%s 个窗口)", job['job_id'], len(windows))
+            self._update(job["job_id"], status=JOB_DONE, finished_at=time.time(),
+                         result=quantum.mastery_result(quantum.aggregate_window_scores(estimate.window_scores()),
+                                                       len(classic_scores), len(windows), estimate))
+            return self.get(job["job_id"])
+
+        window_thetas = [quantum.scores_to_thetas(window) for window in windows]
+        coalesce_key = tuple(window_keys)
+        with self._lock:
+            leader_id = self._inflight.get(coalesce_key)
+            if leader_id is not None:
+                self._jobs[leader_id]["followers"].append(job["job_id"])
+                job["leader"] = leader_id
+            elif sum(1 for other in self._jobs.values()
+                     if other["coalesce_key"] and not other["finished_at"]) >= self.max_pending:
+                del self._jobs[job["job_id"]]
+                raise UpstreamBusyError("tianyan", f"已有 {self.max_pending} 个云端任务未完成",
+                                        round(self.poll_max))
+            else:
+                self._inflight[coalesce_key] = job["job_id"]
+                job.update(coalesce_key=coalesce_key, window_keys=window_keys, window_thetas=window_thetas,
+                           estimate=estimate, outstanding=set(pending), num_answers=len(classic_scores))
+            snapshot = self._snapshot(job)
+        self._publish([snapshot])
+        if leader_id is not None:
+            logger.info("Quantum Job %s: 与执行中的任务 %s 相同，合并等待结果", job['job_id'], leader_id)
+            return self.get(job["job_id"])
+        for index in pending:
+            self._batcher.enqueue((job["job_id"], index), window_thetas[index])
+        return self.get(job["job_id"])
+
+    def _run_batch(self, batch):
+        job_ids = list(dict.fromkeys(job_id for (job_id, _), _, _ in batch))
+        for job_id in job_ids:
+            self._update(job_id, status=JOB_RUNNING)
+        chains = [(thetas, offset) for _, thetas, offset in batch]
+        backend = CloudBackend(platform_factory=self.platform_factory, device_manager=self.devices)
+        # 每次提交都按一轮的 shots (自适应时为 TIANYAN_SHOT_INCREMENT，否则为 TIANYAN_NUM_SHOTS)
+        shots = backend.shot_plan()[0]
+        sampler = backend.with_shots(shots)
+
+        def attempt(machine_name):
+            device_backend = sampler.on_device(machine_name)
+            platform, query_id = device_backend.submit_circuit(qcis)
+            for job_id in job_ids:
+                self._update(job_id, query_id=query_id, device=machine_name)
+            # 从提交到拿到结果的总时长 (云端排队 + 执行 + 轮询间隔)
+            with span("cloud_wait", machine=machine_name):
+                return device_backend.wait_probabilities(platform, query_id, self.timeout, self.poll_initial,
+                                                         self.poll_max, self.poll_backoff)
+
+        try:
+            qcis = compile_qcis(chains)
+            # 提交或轮询出错 (含超时) 时换一台设备重新提交，全部失败才把任务标记为失败
+            num_qubits = max(offset + len(thetas) for thetas, offset in chains)
+            probabilities = self._run_with_backoff(num_qubits, attempt, job_ids)
+        except Exception as e:
+            for job_id in job_ids:
+                if self.get(job_id)["status"] == JOB_FAILED:
+                    continue
+                logger.warning("Quantum Job %s: 云端执行失败: %s", job_id, e)
+                self._finish(job_id, status=JOB_FAILED, error=str(e), result=quantum.error_result(e))
+            return
+
+        for (job_id, index), thetas, offset in batch:
+            self._complete_window(job_id, index, marginal_all_ones(probabilities, offset, len(thetas)), shots)
+
+    def _complete_window(self, job_id, index, probability, shots):
+        """ 记录一个窗口一轮的结果；本轮所有窗口都返回后，决定再采样一轮还是汇总为掌握度 """
+        with self._lock:
+            job = self._jobs[job_id]
+            if job["status"] == JOB_FAILED:
+                return
+            estimate = job["estimate"]
+            estimate.add(index, probability, shots)
+            job["outstanding"].discard(index)
+            if job["outstanding"]:
+                return
+            pending = estimate.pending()
+            job["outstanding"] = set(pending)
+        if pending:
+            for index in pending:
+                self._batcher.enqueue((job_id, index), job["window_thetas"][index])
+            return
+
+        quantum.cache_window_results(estimate, job["window_keys"], estimate.updated())
+        result = quantum.mastery_result(quantum.aggregate_window_scores(estimate.window_scores()),
+                                        job["num_answers"], len(job["window_keys"]), estimate)
+        logger.info("Quantum Job %s: 共用 %s shots", job_id, estimate.total_shots())
+        self._finish(job_id, status=JOB_DONE, result=result)
+
+    def _run_with_backoff(self, num_qubits, attempt, job_ids):
+        """
+        天衍并发名额已满 (UpstreamBusyError) 不是计算错误: 按指数退避重新提交整批，
+        直到任务超时才抛出，交给调用方标记为失败
+        """
+        delay = self.poll_initial
+        deadline = time.time() + self.timeout
+        while True:
+            try:
+                return self.devices.run_with_failover(num_qubits, attempt)
+            except UpstreamBusyError as e:
+                if time.time() + delay > deadline:
+                    raise
+                logger.info("Quantum Job %s: %s，%.1f 秒后重新提交", ", ".join(job_ids), e, delay)
+                time.sleep(delay)
+                delay = min(delay * self.poll_backoff, self.poll_max)
+
+    def get(self, job_id):
+        """
+        返回任务快照 (只含 SHARED_FIELDS 的副本)；不存在时返回 None。跟随中的任务显示所跟随任务的状态。
+        不是本进程提交的任务从共享存储读取。
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                snapshot = {field: job[field] for field in SHARED_FIELDS}
+                leader = self._jobs.get(job["leader"]) if job["leader"] and not job["finished_at"] else None
+                if leader:
+                    snapshot.update(status=leader["status"], query_id=leader["query_id"], device=leader["device"])
+                return snapshot
+        if self._store is None:
+            return None
+        try:
+            snapshot = self._store.load(job_id)
+        except sqlite3.Error as e:
+            logger.warning("Quantum Job %s: 读取共享任务表失败: %s", job_id, e)
+            return None
+        if snapshot and snapshot["finished_at"] and time.time() - snapshot["finished_at"] > self.ttl:
+            return None
+        return snapshot
+
+    def shutdown(self, wait=True):
+        self._batcher.shutdown()
+        self._executor.shutdown(wait=wait)
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager(db_path=None):
+    """
+    进程内共享的任务管理器，首次使用时创建 (gunicorn fork 之后才会启动线程池)；
+    db_path 为共享任务表的路径，只在首次创建时生效。
+    """
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = QuantumJobManager(db_path=db_path)
+        return _manager
+
+
+if __name__ == '__main__':
+    print("--- 正在使用本地假天衍平台演示异步任务 ---")
+
+    from fake_tianyan import FakeTianYanPlatform
+
+    # 精确分布下不存在采样噪声，先用固定 shots (每个会话只提交一轮) 与闭式解逐位比较
+    config.TIANYAN_ADAPTIVE_SHOTS = False
+
+    def platform_factory(machine_name):
+        # exact=True: 返回本地态矢量模拟的完整分布，便于与闭式解逐位比较
+        return FakeTianYanPlatform(machine_name=machine_name, latency=0.15, exact=True)
+
+    sessions = [[(3, "11"), (2, "10"), (1, "01"), (2, "00")], [(1, "11"), (1, "01")], [(2, "01"), (1, "00"), (3, "00")]]
+    logs = [[{"question_num": i + 1, "feature_3d": {"difficulty": d, "performance_code": code}}
+             for i, (d, code) in enumerate(items)] for items in sessions]
+    manager = QuantumJobManager(poll_initial=0.05, poll_max=0.2, platform_factory=platform_factory)
+    snapshots = [manager.submit(log, backend="cloud") for log in logs]
+    print(f"立即返回: {[(snapshot['job_id'], snapshot['status']) for snapshot in snapshots]}")
+    for snapshot, log in zip(snapshots, logs):
+        while manager.get(snapshot['job_id'])['status'] in (JOB_QUEUED, JOB_RUNNING):
+            time.sleep(0.05)
+        job = manager.get(snapshot['job_id'])
+        local_result = manager.submit(log, backend="analytic")['result']
+        print(f"Query {job['query_id']}: 假平台结果 {job['result']['score']:.6f}，闭式解 {local_result['score']:.6f}")
+        assert abs(job['result']['score'] - local_result['score']) < 1e-9
+    assert len({manager.get(snapshot['job_id'])['query_id'] for snapshot in snapshots}) == 1
+
+    # 超过窗口大小的长会话: 各窗口作为独立的链打包进同一次提交，汇总结果与本地后端一致
+    config.QUANTUM_CHUNK_SIZE = 4
+    long_log = [{"question_num": i + 1, "feature_3d": {"difficulty": 1 + i % 3, "performance_code": "11"}}
+                for i in range(8)]
+    job_id = manager.submit(long_log, backend="cloud")['job_id']
+    while manager.get(job_id)['status'] in (JOB_QUEUED, JOB_RUNNING):
+        time.sleep(0.05)
+    job, local_result = manager.get(job_id), manager.submit(long_log, backend="analytic")['result']
+    print(f"长会话 ({job['result']['windows']} 个窗口): 假平台结果 {job['result']['score']:.6f}，"
+          f"闭式解 {local_result['score']:.6f}")
+    assert abs(job['result']['score'] - local_result['score']) < 1e-9
+
+    # 同一份答题记录在执行中被重复提交 (例如学生连点): 只有第一个任务真正提交，其余跟随它一起结束
+    repeated_log = [{"question_num": 1, "feature_3d": {"difficulty": 5, "performance_code": "10"}}]
+    job_ids = [manager.submit(repeated_log, backend="cloud", owner=f"student-{i}")['job_id'] for i in range(4)]
+    while any(manager.get(job_id)['status'] in (JOB_QUEUED, JOB_RUNNING) for job_id in job_ids):
+        time.sleep(0.05)
+    jobs = [manager.get(job_id) for job_id in job_ids]
+    print(f"重复提交 {len(jobs)} 次: 云端提交 {len({job['query_id'] for job in jobs})} 次，"
+          f"结果一致 {len({job['result']['score'] for job in jobs}) == 1}")
+    manager.shutdown()
+
+    # 多 worker: 两个管理器 (相当于两个 gunicorn worker 进程) 共用一个任务表，另一个 worker 也能轮询到结果
+    import tempfile
+    db_path = os.path.join(tempfile.mkdtemp(prefix="q-its-jobs-"), "quantum_jobs.sqlite3")
+    worker_a = QuantumJobManager(poll_initial=0.05, poll_max=0.2, platform_factory=platform_factory, db_path=db_path)
+    worker_b = QuantumJobManager(platform_factory=platform_factory, db_path=db_path)
+    fresh_log = [{"question_num": 1, "feature_3d": {"difficulty": 4, "performance_code": "01"}}]
+    job_id = worker_a.submit(fresh_log, backend="cloud", owner="student-1")['job_id']
+    print(f"另一个 worker 看到的状态: {worker_b.get(job_id)['status']}")
+    while worker_b.get(job_id)['status'] in (JOB_QUEUED, JOB_RUNNING):
+        time.sleep(0.05)
+    shared = worker_b.get(job_id)
+    print(f"另一个 worker 读到结果: {shared['status']} {shared['result']['score']:.6f} (owner {shared['owner']})")
+    assert shared['result'] == worker_a.get(job_id)['result'] and shared['owner'] == "student-1"
+    worker_a.shutdown()
+    worker_b.shutdown()
+
+    # 自适应 shots: 假平台按 shots 采样，结论明显的会话一轮 (TIANYAN_SHOT_INCREMENT 次) 即可停止
+    config.TIANYAN_ADAPTIVE_SHOTS = True
+    manager = QuantumJobManager(poll_initial=0.05, poll_max=0.2, platform_factory=lambda machine_name:
+                                FakeTianYanPlatform(machine_name=machine_name, latency=0.05))
+    for log in logs + [long_log]:
+        job_id = manager.submit(log, backend="cloud")['job_id']
+        while manager.get(job_id)['status'] in (JOB_QUEUED, JOB_RUNNING):
+            time.sleep(0.05)
+        result, local_result = manager.get(job_id)['result'], manager.submit(log, backend="analytic")['result']
+        print(f"自适应采样: {result['score']:.4f} 区间 [{result['interval'][0]:.4f}, {result['interval'][1]:.4f}]，"
+              f"{result['shots']} shots，闭式解 {local_result['score']:.4f} ({local_result['feedback']['level']})")
+    manager.shutdown()
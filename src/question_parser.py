@@ -0,0 +1,225 @@
+# 文件: src/question_parser.py
+#
+# 从 LLM 的回复中提取并校验题目 JSON。
+# 以前用贪婪的 re.search(r'\{.*\}', ..., re.DOTALL) 截取第一个 { 到最后一个 } 之间的全部文字，
+# 回复里只要多出一个花括号 (例如结尾的说明文字) 就解析失败，失败后学生只能再触发一次完整的 Dify 生成。
+# 这里:
+#   - JsonObjectScanner 一遍扫描找出顶层括号配平的 {...}，可以逐块喂入流式回复，不必每来一块就从头扫描;
+#   - parse_question_package 依次尝试每个完整对象，按题目结构校验并做几种廉价的本地修复
+#     (字符串中的裸换行、多余的尾逗号、Python 字面量写法、被截断的结尾、选项/答案/难度的常见写法)，
+#     仍然失败时抛出 QuestionParseError，由调用方决定是否重新生成 (见 config.QUESTION_PARSE_RETRIES)。
+
+import ast
+import json
+import re
+
+OPTION_KEYS = "ABCDEFGH"
+MIN_DIFFICULTY, MAX_DIFFICULTY = 1, 5
+REQUIRED_FIELDS = ("question", "options", "correct_answer", "difficulty")
+
+_CLOSERS = {'{': '}', '[': ']'}
+_TRAILING_COMMA = re.compile(r',\s*([}\]])')
+# "A"、"A."、"A、"、"(A)"、"A) 选项内容"、"选项A" 等写法中的选项字母
+_ANSWER_KEY = re.compile(r'^(?:选项|答案|option)?\s*[(（]?\s*([A-Za-z])\s*(?:[)）.．、:：]|$|\s)', re.IGNORECASE)
+_OPTION_PREFIX = re.compile(r'^\s*[(（]?[A-Za-z][)）.．、:：]\s*')
+
+
+class QuestionParseError(ValueError):
+    pass
+
+
+class JsonObjectScanner(object):
+    """
+    增量查找顶层括号配平的 {...}: feed() 每次只扫描新到的文字，返回这次新完成的对象文本；
+    objects 为至今完成的全部对象，first_end 为第一个对象之后的下标 (尚无时为 None)。
+    跳过字符串字面量中的括号与转义字符；与栈顶不匹配的右括号视为多余字符忽略。
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.objects = []
+        self.first_end = None
+        self._position = 0
+        self._begin = None
+        self._stack = []
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, chunk):
+        self.text += chunk
+        completed = []
+        text, index = self.text, self._position
+        while index < len(text):
+            char = text[index]
+            if self._begin is None:
+                if char == '{':
+                    self._begin, self._stack = index, ['}']
+            elif self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in _CLOSERS:
+                self._stack.append(_CLOSERS[char])
+            elif self._stack and char == self._stack[-1]:
+                self._stack.pop()
+                if not self._stack:
+                    completed.append(text[self._begin:index + 1])
+                    if self.first_end is None:
+                        self.first_end = index + 1
+                    self._begin = None
+            index += 1
+        self._position = index
+        self.objects.extend(completed)
+        return completed
+
+    def unfinished(self):
+        """ 末尾尚未配平的对象补齐引号与括号后的文本 (回复被截断时使用)，没有时返回 None """
+        if self._begin is None:
+            return None
+        tail = self.text[self._begin:]
+        if self._escaped:
+            tail = tail[:-1]
+        if self._in_string:
+            tail += '"'
+        return _TRAILING_COMMA.sub(r'\1', tail.rstrip().rstrip(',') + "".join(reversed(self._stack)))
+
+
+def load_json_object(candidate):
+    """ 严格解析失败时依次尝试本地修复；返回 (对象, 所用修复) 或 (None, None) """
+    attempts = (
+        ("none", lambda text: json.loads(text)),
+        # 字符串中的裸换行/制表符
+        ("control_chars", lambda text: json.loads(text, strict=False)),
+        ("trailing_comma", lambda text: json.loads(_TRAILING_COMMA.sub(r'\1', text), strict=False)),
+        # 单引号、True/False/None 等 Python 字面量写法
+        ("python_literal", lambda text: ast.literal_eval(_TRAILING_COMMA.sub(r'\1', text))),
+    )
+    for repair, load in attempts:
+        try:
+            value = load(candidate)
+        except (ValueError, SyntaxError, MemoryError, RecursionError):
+            continue
+        if isinstance(value, dict):
+            return value, repair
+    return None, None
+
+
+def normalize_options(options):
+    """ 选项统一为 {"A": "...", ...}；列表按顺序编号并去掉 "A. " 之类的前缀 """
+    if isinstance(options, list):
+        if len(options) > len(OPTION_KEYS):
+            raise QuestionParseError(f"选项过多: {len(options)}")
+        options = {key: _OPTION_PREFIX.sub("", str(value), count=1) for key, value in zip(OPTION_KEYS, options)}
+    if not isinstance(options, dict):
+        raise QuestionParseError("options 不是对象或列表")
+    normalized = {}
+    for key, value in options.items():
+        match = _ANSWER_KEY.match(str(key).strip())
+        if not match or value is None or not str(value).strip():
+            raise QuestionParseError(f"无效的选项: {key!r}")
+        normalized[match.group(1).upper()] = str(value).strip()
+    if len(normalized) < 2:
+        raise QuestionParseError("选项少于 2 个")
+    return normalized
+
+
+def normalize_answer(answer, options):
+    """ 答案统一为选项字母；也接受 "A."、"(A)"、"A) 内容" 或与某个选项内容相同的写法 """
+    text = str(answer if answer is not None else "").strip()
+    match = _ANSWER_KEY.match(text)
+    if match and match.group(1).upper() in options:
+        return match.group(1).upper()
+    for key, value in options.items():
+        if text and text == value:
+            return key
+    raise QuestionParseError(f"correct_answer {answer!r} 不在选项 {sorted(options)} 中")
+
+
+def normalize_difficulty(difficulty):
+    """ 难度统一为 1–5 的整数；接受 "3"、3.0，超出范围的视为不合格 (交给调用方重新生成) """
+    if isinstance(difficulty, bool):
+        raise QuestionParseError(f"无效的难度: {difficulty!r}")
+    try:
+        value = round(float(str(difficulty).strip()))
+    except (TypeError, ValueError, OverflowError):
+        raise QuestionParseError(f"无效的难度: {difficulty!r}")
+    if not MIN_DIFFICULTY <= value <= MAX_DIFFICULTY:
+        raise QuestionParseError(f"难度 {difficulty!r} 超出 {MIN_DIFFICULTY}–{MAX_DIFFICULTY} 的范围")
+    return value
+
+
+def validate_question_package(package):
+    """ 按题目结构校验并规范化，返回新的 dict；不合格时抛出 QuestionParseError """
+    missing = [field for field in REQUIRED_FIELDS if field not in package]
+    if missing:
+        raise QuestionParseError(f"缺少字段: {', '.join(missing)}")
+    question = package["question"]
+    if not isinstance(question, str) or not question.strip():
+        raise QuestionParseError("question 为空")
+    options = normalize_options(package["options"])
+    explanation = package.get("explanation")
+    return dict(package, question=question.strip(), options=options,
+                correct_answer=normalize_answer(package["correct_answer"], options),
+                difficulty=normalize_difficulty(package["difficulty"]),
+                explanation="" if explanation is None else str(explanation))
+
+
+def is_question_package(candidate):
+    """ 一个完整对象的文本能否解析并通过校验；流式读取 Dify 回复时据此决定何时停止 """
+    package, _ = load_json_object(candidate)
+    if package is None:
+        return False
+    try:
+        validate_question_package(package)
+    except QuestionParseError:
+        return False
+    return True
+
+
+def parse_question_package(raw):
+    """
+    返回 (题目, 所用修复)。依次尝试 raw 中每个完整的 {...} 与末尾被截断的对象，
+    取第一个能通过校验的；全部失败时抛出 QuestionParseError (带最后一个失败原因)。
+    """
+    if not isinstance(raw, str):
+        raise QuestionParseError("回复不是字符串")
+    scanner = JsonObjectScanner()
+    candidates = scanner.feed(raw)
+    truncated = scanner.unfinished()
+    reason = "回复中没有 JSON 对象"
+    for candidate, repair in [(c, None) for c in candidates] + ([(truncated, "truncated")] if truncated else []):
+        package, load_repair = load_json_object(candidate)
+        if package is None:
+            reason = "JSON 无法解析"
+            continue
+        try:
+            return validate_question_package(package), repair or load_repair
+        except QuestionParseError as e:
+            reason = str(e)
+    raise QuestionParseError(reason)
+
+
+if __name__ == '__main__':
+    # 演示几种常见的模型输出及修复方式；完整的校验用例见 tests/test_question_parser.py
+    good = {"question": "自由落体的加速度约为?", "options": {"A": "9.8 m/s²", "B": "1 m/s²"},
+            "correct_answer": "A", "difficulty": 2, "explanation": "g ≈ 9.8 m/s²"}
+    text = json.dumps(good, ensure_ascii=False)
+    cases = [
+        ("原样", text + "\n\n希望对你有帮助 {如有疑问请追问}"),
+        ("代码块 + 尾逗号", "```json\n" + text[:-1] + ",\n}\n```"),
+        ("裸换行", text.replace("g ≈", "g\n≈")),
+        ("单引号", str(good)),
+        ("被截断", text[:text.index('"explanation"') + 20]),
+        ("答案不在选项中", json.dumps(dict(good, correct_answer="E"))),
+    ]
+    for name, raw in cases:
+        try:
+            package, repair = parse_question_package(raw)
+            print(f"{name:<12} -> 答案 {package['correct_answer']}, 修复: {repair}")
+        except QuestionParseError as e:
+            print(f"{name:<12} -> 拒绝: {e}")
@@ -0,0 +1,140 @@
+# 文件: src/question_prefetch.py
+#
+# 按主题预取题目。同一主题的下一道题是可预测的，因此在后台为每个主题维护一个小容量的题目池，
+# 池中只放已经通过解析与校验的题目包，按难度分桶；/generate-question 命中时直接出题，
+# 同时异步补充，把出题延迟从 LLM 的数秒降到毫秒级。
+# 每个题目包只会被取出一次；超过有效期的题目包会被丢弃，主题数超过上限时淘汰最久未用的主题。
+# 预取的题目在独立的 Dify 会话中生成，看不到学生自己的对话历史，因此取题时跳过该学生本次会话已经做过的题目，
+# 池中也不保留重复的题干。补充按需进行: 每个主题的目标容量从 0 开始，每次未命中加一 (最多 per_topic)，
+# 池中题目 (含正在生成的) 低于目标时才补充，只被访问一次的主题最多多花一次 Dify 调用。
+
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import config
+except ImportError:
+    class MockConfig:
+        QUESTION_PREFETCH_PER_TOPIC = 3
+        QUESTION_PREFETCH_MAX_TOPICS = 50
+        QUESTION_PREFETCH_TTL = 1800
+        QUESTION_PREFETCH_WORKERS = 4
+
+
+    config = MockConfig()
+
+from observability import get_logger
+
+logger = get_logger(__name__)
+
+
+class QuestionPrefetcher(object):
+    """
+    fetch_question(topic) 由调用方提供: 生成并校验一道题，成功返回题目包 (含 difficulty)，失败返回 None。
+    """
+
+    def __init__(self, fetch_question, per_topic=None, max_topics=None, ttl=None, workers=None):
+        self.fetch_question = fetch_question
+        self.per_topic = per_topic or config.QUESTION_PREFETCH_PER_TOPIC
+        self.max_topics = max_topics or config.QUESTION_PREFETCH_MAX_TOPICS
+        self.ttl = ttl or config.QUESTION_PREFETCH_TTL
+        self._executor = ThreadPoolExecutor(max_workers=workers or config.QUESTION_PREFETCH_WORKERS,
+                                            thread_name_prefix="question-prefetch")
+        # topic -> {"buckets": {difficulty: deque[(created_at, package)]}, "inflight": int, "target": int}
+        self._pools = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "fetched": 0, "failed": 0, "expired": 0, "duplicates": 0}
+
+    def _pool(self, topic):
+        pool = self._pools.get(topic)
+        if pool is None:
+            pool = self._pools[topic] = {"buckets": {}, "inflight": 0, "target": 0}
+            while len(self._pools) > self.max_topics:
+                self._pools.popitem(last=False)
+        self._pools.move_to_end(topic)
+        return pool
+
+    def _drop_expired(self, pool):
+        cutoff = time.time() - self.ttl
+        for bucket in pool["buckets"].values():
+            while bucket and bucket[0][0] < cutoff:
+                bucket.popleft()
+                self._stats["expired"] += 1
+
+    @staticmethod
+    def _size(pool):
+        return sum(len(bucket) for bucket in pool["buckets"].values())
+
+    @staticmethod
+    def question_key(package):
+        """ 判断两道题是否重复的键 (去掉首尾空白的题干) """
+        return str(package.get("question") or "").strip()
+
+    def take(self, topic, difficulty=None, exclude=()):
+        """
+        取出一道预取好的题目；difficulty 为空时取最早生成的一道，题干在 exclude 中的题目 (学生已经做过的)
+        留给其他学生。未命中返回 None，并把该主题的目标容量加一；之后题目池低于目标容量时补充。
+        """
+        package = None
+        with self._lock:
+            pool = self._pool(topic)
+            self._drop_expired(pool)
+            if difficulty is not None:
+                candidates = [pool["buckets"].get(difficulty)]
+            else:
+                candidates = sorted((b for b in pool["buckets"].values() if b), key=lambda b: b[0][0])
+            for bucket in candidates:
+                for entry in bucket or ():
+                    if self.question_key(entry[1]) not in exclude:
+                        bucket.remove(entry)
+                        package = entry[1]
+                        break
+                if package:
+                    break
+            self._stats["hits" if package else "misses"] += 1
+            if not package:
+                pool["target"] = min(pool["target"] + 1, self.per_topic)
+        self.warm(topic)
+        return package
+
+    def warm(self, topic, target=None):
+        """ 把主题的题目池 (含正在生成的) 补到目标容量；target 为空时使用该主题按需增长的目标 """
+        with self._lock:
+            pool = self._pool(topic)
+            self._drop_expired(pool)
+            if target is not None:
+                pool["target"] = max(pool["target"], min(target, self.per_topic))
+            missing = pool["target"] - self._size(pool) - pool["inflight"]
+            pool["inflight"] += max(missing, 0)
+        for _ in range(missing):
+            self._executor.submit(self._refill_one, topic, pool)
+
+    def _refill_one(self, topic, pool):
+        try:
+            package = self.fetch_question(topic)
+        except Exception as e:
+            logger.warning("预取主题 '%s' 的题目失败: %s", topic, e)
+            package = None
+        with self._lock:
+            pool["inflight"] -= 1
+            if not package:
+                self._stats["failed"] += 1
+                return
+            self._stats["fetched"] += 1
+            if self._pools.get(topic) is not pool:
+                # 主题在生成期间被淘汰，丢弃结果
+                return
+            key = self.question_key(package)
+            if any(self.question_key(entry[1]) == key for bucket in pool["buckets"].values() for entry in bucket):
+                self._stats["duplicates"] += 1
+                return
+            pool["buckets"].setdefault(package.get("difficulty"), deque()).append((time.time(), package))
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, topics={topic: self._size(pool) for topic, pool in self._pools.items()})
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,230 @@
+# 文件: src/rate_limit.py
+#
+# 限流与上游并发控制。课堂上几十个学生同时点击时，以前所有请求一起打到 Dify 与天衍，
+# 触发上游配额后同时失败 (或各自等满 120 秒超时)。这里提供:
+#   - TokenBucketLimiter: 按用户 (会话的匿名 user_id) 的令牌桶，超出时返回需要等待的秒数，由调用方回 429;
+#   - ConcurrencyLimiter / AsyncConcurrencyLimiter: 每类上游一个并发上限，超出的调用排队等待，
+#     排队数已满或等待超时时立即抛出 UpstreamBusyError (快速 429)，而不是继续堆积直到上游超时。
+# 所有状态都在进程内存中: gunicorn / uvicorn 多进程部署时，上限按每个进程计算。
+
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+
+try:
+    import config
+except ImportError:
+    class MockConfig:
+        RATE_LIMIT_ENABLED = True
+        RATE_LIMIT_QUESTION_RATE = 0.5
+        RATE_LIMIT_QUESTION_BURST = 20
+        RATE_LIMIT_ANALYSIS_RATE = 0.1
+        RATE_LIMIT_ANALYSIS_BURST = 3
+        RATE_LIMIT_MAX_USERS = 10000
+        DIFY_MAX_CONCURRENT = 10
+        DIFY_MAX_QUEUE = 32
+        DIFY_QUEUE_TIMEOUT = 10
+        DIFY_PREFETCH_MAX_CONCURRENT = 2
+        DIFY_PREFETCH_MAX_QUEUE = 2
+        DIFY_PREFETCH_QUEUE_TIMEOUT = 5
+        TIANYAN_MAX_CONCURRENT = 4
+        TIANYAN_MAX_QUEUE = 64
+        TIANYAN_QUEUE_TIMEOUT = 30
+
+
+    config = MockConfig()
+
+from observability import get_logger, observe
+
+logger = get_logger(__name__)
+
+
+class UpstreamBusyError(RuntimeError):
+    """ 上游并发已满且排队已满 (或排队超时)；retry_after 为建议客户端等待的秒数 """
+
+    def __init__(self, upstream, reason, retry_after):
+        super().__init__(f"{upstream} 繁忙: {reason}")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class TokenBucketLimiter(object):
+    """
+    每个键一个容量为 burst、每秒补充 rate 个令牌的桶；最近最少使用的键超过 max_keys 个时被淘汰
+    (被淘汰的键下次出现时桶是满的，相当于放宽而不是误伤)。
+    """
+
+    def __init__(self, rate, burst, max_keys=None):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys or config.RATE_LIMIT_MAX_USERS
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, key, tokens=1):
+        """ 取走 tokens 个令牌并返回 0；令牌不足时不扣减，返回还需等待的秒数 """
+        now = time.monotonic()
+        with self._lock:
+            available, updated = self._buckets.pop(key, (self.burst, now))
+            available = min(self.burst, available + (now - updated) * self.rate)
+            wait = 0.0 if available >= tokens else (tokens - available) / self.rate
+            self._buckets[key] = (available - tokens if not wait else available, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class ConcurrencyLimiter(object):
+    """ 线程版: 最多 max_concurrent 个调用同时进行，最多 max_queue 个调用排队，排队最长 queue_timeout 秒 """
+
+    def __init__(self, name, max_concurrent, max_queue, queue_timeout):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def slot(self):
+        started = time.perf_counter()
+        with self._condition:
+            if self.active >= self.max_concurrent:
+                if self.waiting >= self.max_queue:
+                    self._reject(started, "排队已满")
+                self.waiting += 1
+                try:
+                    acquired = self._condition.wait_for(lambda: self.active < self.max_concurrent,
+                                                        self.queue_timeout)
+                finally:
+                    self.waiting -= 1
+                if not acquired:
+                    self._reject(started, "排队超时")
+            self.active += 1
+        observe("upstream_queue_wait", time.perf_counter() - started, upstream=self.name, outcome="ok")
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.active -= 1
+                self._condition.notify()
+
+    def _reject(self, started, reason):
+        observe("upstream_queue_wait", time.perf_counter() - started, upstream=self.name, outcome="rejected")
+        logger.warning("%s 并发已满 (%s 个进行中，%s 个排队)，拒绝新的调用: %s",
+                       self.name, self.active, self.waiting, reason)
+        raise UpstreamBusyError(self.name, reason, math.ceil(self.queue_timeout))
+
+
+class AsyncConcurrencyLimiter(object):
+    """ 事件循环版 (ASGI 部署)，语义与 ConcurrencyLimiter 相同；须在同一个事件循环中使用 """
+
+    def __init__(self, name, max_concurrent, max_queue, queue_timeout):
+        self.name = name
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+
+    @asynccontextmanager
+    async def slot(self):
+        started = time.perf_counter()
+        if self._semaphore.locked():
+            if self.waiting >= self.max_queue:
+                self._reject(started, "排队已满")
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self._reject(started, "排队超时")
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        observe("upstream_queue_wait", time.perf_counter() - started, upstream=self.name, outcome="ok")
+        try:
+            yield
+        finally:
+            self._semaphore.release()
+
+    def _reject(self, started, reason):
+        observe("upstream_queue_wait", time.perf_counter() - started, upstream=self.name, outcome="rejected")
+        logger.warning("%s 排队 %s 个，拒绝新的调用: %s", self.name, self.waiting, reason)
+        raise UpstreamBusyError(self.name, reason, math.ceil(self.queue_timeout))
+
+
+_rate_limiters = {}
+_upstream_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(kind):
+    """ "question" (出题) 或 "analysis" (量子分析) 的按用户令牌桶；未启用限流时返回 None """
+    if not config.RATE_LIMIT_ENABLED:
+        return None
+    with _limiters_lock:
+        if kind not in _rate_limiters:
+            if kind == "question":
+                limiter = TokenBucketLimiter(config.RATE_LIMIT_QUESTION_RATE, config.RATE_LIMIT_QUESTION_BURST)
+            elif kind == "analysis":
+                limiter = TokenBucketLimiter(config.RATE_LIMIT_ANALYSIS_RATE, config.RATE_LIMIT_ANALYSIS_BURST)
+            else:
+                raise ValueError(f"未知的限流类别: '{kind}'")
+            _rate_limiters[kind] = limiter
+        return _rate_limiters[kind]
+
+
+def get_upstream_limiter(name):
+    """ "dify" (在线出题)、"dify_prefetch" (预取池后台生成) 或 "tianyan" 的进程内并发上限 """
+    with _limiters_lock:
+        if name not in _upstream_limiters:
+            if name == "dify":
+                limiter = ConcurrencyLimiter(name, config.DIFY_MAX_CONCURRENT, config.DIFY_MAX_QUEUE,
+                                             config.DIFY_QUEUE_TIMEOUT)
+            elif name == "dify_prefetch":
+                limiter = ConcurrencyLimiter(name, config.DIFY_PREFETCH_MAX_CONCURRENT, config.DIFY_PREFETCH_MAX_QUEUE,
+                                             config.DIFY_PREFETCH_QUEUE_TIMEOUT)
+            elif name == "tianyan":
+                limiter = ConcurrencyLimiter(name, config.TIANYAN_MAX_CONCURRENT, config.TIANYAN_MAX_QUEUE,
+                                             config.TIANYAN_QUEUE_TIMEOUT)
+            else:
+                raise ValueError(f"未知的上游: '{name}'")
+            _upstream_limiters[name] = limiter
+        return _upstream_limiters[name]
+
+
+if __name__ == '__main__':
+    from concurrent.futures import ThreadPoolExecutor
+
+    # 行为校验见 tests/test_rate_limit.py，这里只演示
+    # 令牌桶: 连续 5 次放行，第 6 次需要等待约 1/rate 秒；不同用户互不影响
+    bucket = TokenBucketLimiter(rate=1.0, burst=5)
+    waits = [bucket.acquire("student-1") for _ in range(6)]
+    print(f"第 6 次请求需等待 {waits[5]:.2f} 秒，另一个用户需等待 {bucket.acquire('student-2'):.2f} 秒")
+
+    # 并发上限 2、排队 3: 同时到达的 10 个调用中 5 个完成，其余 5 个立即被拒绝
+    limiter = ConcurrencyLimiter("demo", max_concurrent=2, max_queue=3, queue_timeout=5)
+    peak, lock = [0, 0], threading.Lock()
+
+    def call(_):
+        try:
+            with limiter.slot():
+                with lock:
+                    peak[0] += 1
+                    peak[1] = max(peak)
+                time.sleep(0.1)
+                with lock:
+                    peak[0] -= 1
+            return "ok"
+        except UpstreamBusyError as e:
+            return f"429 (Retry-After {e.retry_after})"
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(10) as pool:
+        outcomes = list(pool.map(call, range(10)))
+    print(f"{outcomes.count('ok')} 个完成、{len(outcomes) - outcomes.count('ok')} 个被拒绝，"
+          f"最大并发 {peak[1]}，用时 {time.perf_counter() - started:.2f} 秒")
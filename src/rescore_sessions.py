@@ -0,0 +1,202 @@
+# 文件: src/rescore_sessions.py
+#
+# 历史会话批量重新评分。
+# 修改 config.TIME_THRESHOLDS、quantum.DIFFICULTY_CODES 或 get_mastery_feedback 的分档后，
+# 用它对 logs/ 中的所有会话重新计算 feature_3d 与掌握度，而不是逐个回放或重新提交云端任务:
+#   - feature_3d 与综合分用 NumPy 对整批答题记录一次性计算;
+#   - 掌握度使用 AnalyticBackend 的闭式解，对补零后的 (会话数 x 最大题数) 角度矩阵按行求积;
+#     长会话与在线评分一样按 quantum.split_windows 分窗 (窗口大小与步长相同)，取各窗口全 1 概率的平均;
+#   - 文件按块分给进程池并行处理;
+#   - 结果写入 rescored/<version>/results.jsonl，并在 manifest.json 中记录所用的参数。
+#
+# 用法:
+#   python src/rescore_sessions.py [--logs logs] [--out rescored] [--version v2] [--workers 4]
+
+import argparse
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import partial
+
+import numpy as np
+
+import config
+import quantum
+from session_log import read_events, replay_events
+
+# 与 app.calculate_3d_feature 一致: 未配置阈值的难度按 30 秒计
+DEFAULT_TIME_THRESHOLD = 30
+
+
+def load_session(path):
+    """ 读取 .json 视图 (含早期的纯列表格式) 或 .jsonl 事件日志，返回统一的会话 dict """
+    if path.endswith(".jsonl"):
+        return replay_events(read_events(path))
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        data = {"topic": None, "session_log": data, "quantum_analysis": None}
+    return data
+
+
+def vectorized_3d_features(difficulty, is_correct, time_taken):
+    """ app.calculate_3d_feature 的向量化版本，返回 2 比特表现编码数组 (0b11 快且对 ... 0b00 慢且错) """
+    thresholds = np.array([config.TIME_THRESHOLDS.get(d, DEFAULT_TIME_THRESHOLD) for d in range(6)], dtype=float)
+    clipped = np.clip(difficulty, 0, 5)
+    limit = np.where((difficulty >= 0) & (difficulty <= 5), thresholds[clipped], DEFAULT_TIME_THRESHOLD)
+    fast = time_taken <= limit
+    return (is_correct.astype(np.int64) << 1) | fast.astype(np.int64)
+
+
+def vectorized_classic_scores(difficulty, performance_codes):
+    lookup = np.zeros(6, dtype=np.int64)
+    for d, code in quantum.DIFFICULTY_CODES.items():
+        lookup[d] = code
+    d_codes = np.where((difficulty >= 0) & (difficulty <= 5), lookup[np.clip(difficulty, 0, 5)], 0)
+    return (d_codes << 2) | performance_codes
+
+
+def vectorized_mastery(scores, lengths, size, stride):
+    """
+    scores: (会话数, 最大题数) 的综合分矩阵，超出 lengths 的位置为填充值。
+    闭式解 P = sin^2(theta_0 / 2) * prod_{k>=1} cos^2(theta_k / 2)；填充位置取 theta = 0 (因子为 1)。
+    答题数超过 size 的会话与 quantum.split_windows / aggregate_window_scores 相同: 窗口起点为 0, stride, 2 * stride, ...
+    外加结束于最后一个答案的窗口，掌握度为这些窗口全 1 概率的平均。返回 (掌握度, 窗口数)。
+    """
+    if scores.size == 0:
+        return np.zeros(len(lengths)), np.zeros(len(lengths), dtype=np.int64)
+    thetas = np.round(scores / 15.0 * math.pi, config.TIANYAN_ANGLE_PRECISION)
+    mask = np.arange(scores.shape[1])[None, :] < lengths[:, None]
+    half = np.where(mask, thetas, 0.0) / 2.0
+    heads, factors = np.sin(half) ** 2, np.cos(half) ** 2
+    single = np.where(lengths > 0, heads[:, 0] * np.prod(factors[:, 1:], axis=1), 0.0)
+    num_starts = scores.shape[1] - size + 1
+    if num_starts <= 1:
+        return single, np.minimum(lengths, 1)
+
+    # 以第 s 个答案开头的窗口: heads[:, s] * factors[:, s+1] * ... * factors[:, s+size-1]，逐列累乘避免三维中间数组
+    windows = heads[:, :num_starts].copy()
+    for offset in range(1, size):
+        windows *= factors[:, offset:offset + num_starts]
+    starts = np.arange(num_starts)[None, :]
+    last_start = (lengths - size)[:, None]
+    counted = (starts <= last_start) & ((starts % stride == 0) | (starts == last_start))
+    num_windows = counted.sum(axis=1)
+    windowed = (windows * counted).sum(axis=1) / np.maximum(num_windows, 1)
+    long_session = lengths > size
+    return np.where(long_session, windowed, single), np.where(long_session, num_windows, np.minimum(lengths, 1))
+
+
+def rescore_files(paths, size, stride):
+    """ 进程池中的工作函数: 处理一批日志文件，返回结果记录列表；size / stride 为分窗参数 """
+    sessions = []
+    for path in paths:
+        try:
+            data = load_session(path)
+        except (OSError, ValueError) as e:
+            print(f"!!! 读取 {path} 失败: {e}")
+            continue
+        answered = [e for e in data.get("session_log") or [] if e.get("is_correct") is not None]
+        sessions.append((path, data, answered))
+    if not sessions:
+        return []
+
+    flat = [entry for _, _, answered in sessions for entry in answered]
+    lengths = np.array([len(answered) for _, _, answered in sessions], dtype=np.int64)
+    difficulty = np.array([int(e.get("difficulty") or (e.get("feature_3d") or {}).get("difficulty") or 0)
+                           for e in flat], dtype=np.int64)
+    is_correct = np.array([bool(e["is_correct"]) for e in flat], dtype=bool)
+    time_taken = np.array([float(e.get("time_taken") or 0.0) for e in flat], dtype=float)
+
+    performance = vectorized_3d_features(difficulty, is_correct, time_taken)
+    flat_scores = vectorized_classic_scores(difficulty, performance)
+
+    # 展开的一维分数 -> 补零的二维矩阵
+    max_len = int(lengths.max()) if len(lengths) else 0
+    matrix = np.zeros((len(sessions), max(max_len, 1)), dtype=np.int64)
+    rows = np.repeat(np.arange(len(sessions)), lengths)
+    cols = np.arange(len(flat)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    matrix[rows, cols] = flat_scores
+    mastery, num_windows = vectorized_mastery(matrix, lengths, size, stride)
+
+    results, start = [], 0
+    for index, (path, data, answered) in enumerate(sessions):
+        end = start + lengths[index]
+        score = float(mastery[index])
+        previous = (data.get("quantum_analysis") or {}).get("score")
+        results.append({
+            "session_id": os.path.splitext(os.path.basename(path))[0],
+            "topic": data.get("topic"),
+            "answers": int(lengths[index]),
+            "windows": int(num_windows[index]),
+            "performance_codes": [format(int(p), "02b") for p in performance[start:end]],
+            "classic_scores": [int(s) for s in flat_scores[start:end]],
+            "previous_score": previous,
+            "score": score,
+            "level": quantum.get_mastery_feedback(score)["level"],
+        })
+        start = end
+    return results
+
+
+def collect_log_files(logs_dir):
+    names = [n for n in os.listdir(logs_dir) if n.startswith("session_")]
+    streamed = {os.path.splitext(n)[0] for n in names if n.endswith(".jsonl")}
+    return sorted(os.path.join(logs_dir, n) for n in names
+                  if n.endswith(".jsonl") or (n.endswith(".json") and os.path.splitext(n)[0] not in streamed))
+
+
+def write_results(f, batches):
+    count = 0
+    for batch in batches:
+        for record in batch:
+            f.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n")
+        count += len(batch)
+    return count
+
+
+def main(argv=None):
+    base = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    parser = argparse.ArgumentParser(description="批量重新计算历史会话的 feature_3d 与掌握度")
+    parser.add_argument("--logs", default=os.path.join(base, "logs"))
+    parser.add_argument("--out", default=os.path.join(base, "rescored"))
+    parser.add_argument("--version", default=datetime.now().strftime("%Y-%m-%d_%H-%M-%S"))
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunk-size", type=int, default=2000, help="每个进程任务处理的文件数")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    # 与在线评分相同的窗口 (见 config.QUANTUM_CHUNK_SIZE / QUANTUM_CHUNK_STRIDE)
+    size = quantum.chunk_size()
+    stride = quantum.chunk_stride(size)
+    worker = partial(rescore_files, size=size, stride=stride)
+    files = collect_log_files(args.logs)
+    chunks = [files[i:i + args.chunk_size] for i in range(0, len(files), args.chunk_size)]
+    out_dir = os.path.join(args.out, args.version)
+    if os.path.exists(os.path.join(out_dir, "manifest.json")):
+        parser.error(f"版本 '{args.version}' 已存在: {out_dir}，请换一个 --version")
+    os.makedirs(out_dir, exist_ok=True)
+
+    with open(os.path.join(out_dir, "results.jsonl"), 'w', encoding='utf-8') as f:
+        if len(chunks) <= 1 or args.workers <= 1:
+            count = write_results(f, map(worker, chunks))
+        else:
+            with ProcessPoolExecutor(max_workers=args.workers) as executor:
+                count = write_results(f, executor.map(worker, chunks))
+
+    manifest = {"version": args.version, "created_at": datetime.now().isoformat(timespec="seconds"),
+                "sessions": count, "files": len(files), "backend": "analytic",
+                "time_thresholds": config.TIME_THRESHOLDS,
+                "difficulty_codes": quantum.DIFFICULTY_CODES,
+                "angle_precision": config.TIANYAN_ANGLE_PRECISION,
+                "window_size": size, "window_stride": stride}
+    with open(os.path.join(out_dir, "manifest.json"), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    print(f"已重新评分 {count} 个会话 -> {out_dir} ({time.perf_counter() - started:.2f} 秒)")
+
+
+if __name__ == '__main__':
+    main()
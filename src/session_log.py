@@ -0,0 +1,193 @@
+# 文件: src/session_log.py
+#
+# 追加写入的会话日志。
+# 以前每个请求都用 indent=2 把整个会话 JSON 重写一遍，写入量随会话长度线性增长 (整个会话是平方级)，
+# 而且是在请求线程里同步落盘。现在每个请求只追加一行紧凑的 JSON 事件到 session_{timestamp}.jsonl，
+# 由后台线程攒批写入，可选 fsync 策略；需要时再把事件重放成原来的 session_{timestamp}.json 视图。
+#
+# 事件类型:
+#   session_started  {"topic"}                    新主题会话
+#   session_reset    {}                           "继续强化": 清空答题记录与量子分析
+#   question         {"entry"}                    新题目 (session_log 中的一项)
+#   answer           {"question_num", "update"}   作答结果，合并到对应题目
+#   quantum_analysis {"result"}                   量子分析结果
+
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+
+try:
+    import config
+except ImportError:
+    class MockConfig:
+        LOG_FLUSH_INTERVAL = 0.5
+        LOG_BATCH_SIZE = 256
+        LOG_FSYNC = "batch"
+
+
+    config = MockConfig()
+
+from observability import get_logger, span
+
+logger = get_logger(__name__)
+
+FSYNC_POLICIES = ("never", "batch", "always")
+
+
+def events_filename(log_filename):
+    """ session_2025-07-08_09-40-40.json -> session_2025-07-08_09-40-40.jsonl """
+    return os.path.splitext(log_filename)[0] + ".jsonl"
+
+
+def replay_events(events):
+    """ 把事件序列重放成 {"topic", "session_log", "quantum_analysis"} 视图 """
+    data = {"topic": None, "session_log": [], "quantum_analysis": None}
+    for event in events:
+        event_type = event.get("type")
+        if event_type == "session_started":
+            data = {"topic": event.get("topic"), "session_log": [], "quantum_analysis": None}
+        elif event_type == "session_reset":
+            data["session_log"] = []
+            data["quantum_analysis"] = None
+        elif event_type == "question":
+            data["session_log"].append(event["entry"])
+        elif event_type == "answer":
+            for entry in reversed(data["session_log"]):
+                if entry.get("question_num") == event.get("question_num"):
+                    entry.update(event["update"])
+                    break
+        elif event_type == "quantum_analysis":
+            data["quantum_analysis"] = event.get("result")
+    return data
+
+
+def read_events(path):
+    events = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                events.append(json.loads(line))
+    return events
+
+
+class SessionLogWriter(object):
+    """ 后台写线程: 每 flush_interval 秒或攒满 batch_size 个事件写一次，按文件分组追加 """
+
+    def __init__(self, logs_dir, flush_interval=None, batch_size=None, fsync=None):
+        self.logs_dir = logs_dir
+        self.flush_interval = flush_interval or config.LOG_FLUSH_INTERVAL
+        self.batch_size = batch_size or config.LOG_BATCH_SIZE
+        self.fsync = fsync or config.LOG_FSYNC
+        if self.fsync not in FSYNC_POLICIES:
+            raise ValueError(f"未知的 fsync 策略: '{self.fsync}'，可选: {', '.join(FSYNC_POLICIES)}")
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="session-log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def append(self, log_filename, event_type, **fields):
+        """ 非阻塞: 只把事件放入队列 """
+        event = dict(fields, type=event_type, ts=round(time.time(), 3))
+        line = json.dumps(event, ensure_ascii=False, separators=(',', ':')) + "\n"
+        self._queue.put(("event", events_filename(log_filename), line))
+
+    def flush(self, timeout=None):
+        """ 阻塞直到此前入队的事件全部写入 """
+        done = threading.Event()
+        self._queue.put(("barrier", done, None))
+        return done.wait(timeout)
+
+    def materialize(self, log_filename, wait=False):
+        """ 在写线程中把 .jsonl 重放为 session_{timestamp}.json；wait=True 时等待完成 """
+        done = threading.Event()
+        self._queue.put(("materialize", log_filename, done))
+        if wait:
+            done.wait()
+
+    def _loop(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            try:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+                deadline = time.time() + self.flush_interval
+                while len(batch) < self.batch_size and batch[-1][0] == "event":
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                pass
+            if not batch:
+                continue
+
+            pending = {}
+            for kind, target, payload in batch:
+                if kind == "event":
+                    pending.setdefault(target, []).append(payload)
+                    continue
+                # 屏障类命令需要先把之前的事件落盘
+                self._write(pending)
+                pending = {}
+                if kind == "materialize":
+                    self._materialize(target)
+                    payload.set()
+                elif kind == "barrier":
+                    target.set()
+                elif kind == "stop":
+                    stopping = True
+                    target.set()
+            self._write(pending)
+
+    def _write(self, pending):
+        for filename, lines in pending.items():
+            path = os.path.join(self.logs_dir, filename)
+            try:
+                with span("log_write", fsync=self.fsync), open(path, 'a', encoding='utf-8') as f:
+                    if self.fsync == "always":
+                        for line in lines:
+                            f.write(line)
+                            f.flush()
+                            os.fsync(f.fileno())
+                    else:
+                        f.write("".join(lines))
+                        if self.fsync == "batch":
+                            f.flush()
+                            os.fsync(f.fileno())
+            except OSError as e:
+                logger.error("写入会话日志 %s 失败: %s", path, e)
+
+    def _materialize(self, log_filename):
+        source = os.path.join(self.logs_dir, events_filename(log_filename))
+        target = os.path.join(self.logs_dir, log_filename)
+        try:
+            with span("log_materialize"):
+                data = replay_events(read_events(source))
+                tmp_path = target + ".tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False, indent=2)
+                os.replace(tmp_path, target)
+        except (OSError, ValueError) as e:
+            logger.error("生成会话日志视图 %s 失败: %s", target, e)
+
+    def close(self):
+        if self._thread.is_alive():
+            done = threading.Event()
+            self._queue.put(("stop", done, None))
+            done.wait(5)
+
+
+if __name__ == '__main__':
+    # 用法: python src/session_log.py logs/session_2025-07-08_09-40-40.jsonl [...]
+    # 把指定的事件日志重放为对应的 session_{timestamp}.json 视图
+    import sys
+
+    for events_path in sys.argv[1:]:
+        view_path = os.path.splitext(events_path)[0] + ".json"
+        with open(view_path, 'w', encoding='utf-8') as f:
+            json.dump(replay_events(read_events(events_path)), f, ensure_ascii=False, indent=2)
+        print(f"{events_path} -> {view_path}")
@@ -0,0 +1,162 @@
+# 文件: src/session_store.py
+#
+# 服务端会话存储。Flask 默认把整个 session 签名后放进 cookie，
+# 而 session_log 会随着每道题 (题干、选项、解析) 不断变大，每次响应都要重新序列化和签名，
+# 最终超过浏览器 4 KB 的 cookie 上限。这里把会话数据保存在服务端，cookie 中只保留一个随机 id。
+# 提供两种存储:
+#   - MemorySessionStore: 进程内字典，LRU + 过期时间淘汰，适合单进程 (桌面版 / 单 worker)
+#   - SQLiteSessionStore: SQLite 文件，多个 gunicorn worker 进程共享
+
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+try:
+    import config
+except ImportError:
+    class MockConfig:
+        SESSION_MAX_ENTRIES = 10000
+        SESSION_LIFETIME = 86400
+
+
+    config = MockConfig()
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+
+
+class MemorySessionStore(object):
+
+    def __init__(self, max_entries=None, lifetime=None):
+        self.max_entries = max_entries or config.SESSION_MAX_ENTRIES
+        self.lifetime = lifetime or config.SESSION_LIFETIME
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        with self._lock:
+            entry = self._entries.get(sid)
+            if entry is None:
+                return None
+            if entry[1] < time.time():
+                del self._entries[sid]
+                return None
+            self._entries.move_to_end(sid)
+            return entry[0]
+
+    def save(self, sid, data):
+        with self._lock:
+            self._entries[sid] = (data, time.time() + self.lifetime)
+            self._entries.move_to_end(sid)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, sid):
+        with self._lock:
+            self._entries.pop(sid, None)
+
+
+class SQLiteSessionStore(object):
+    """ 每个线程一个连接；WAL 模式下多个进程可以并发读、串行写 """
+
+    PURGE_EVERY = 200
+
+    def __init__(self, db_path, lifetime=None):
+        self.db_path = db_path
+        self.lifetime = lifetime or config.SESSION_LIFETIME
+        self._local = threading.local()
+        self._saves = 0
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS sessions "
+                     "(sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)")
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.db_path, timeout=10)
+        return conn
+
+    def get(self, sid):
+        row = self._conn().execute("SELECT data FROM sessions WHERE sid = ? AND expires_at >= ?",
+                                   (sid, time.time())).fetchone()
+        return row[0] if row else None
+
+    def save(self, sid, data):
+        conn = self._conn()
+        now = time.time()
+        conn.execute("INSERT OR REPLACE INTO sessions (sid, data, expires_at) VALUES (?, ?, ?)",
+                     (sid, data, now + self.lifetime))
+        self._saves += 1
+        if self._saves % self.PURGE_EVERY == 0:
+            conn.execute("DELETE FROM sessions WHERE expires_at < ?", (now,))
+        conn.commit()
+
+    def delete(self, sid):
+        conn = self._conn()
+        conn.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+        conn.commit()
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """ cookie 只保存会话 id；数据用 Flask 自带的 TaggedJSONSerializer 序列化后交给 store """
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            raw = self.store.get(sid)
+            if raw is not None:
+                return ServerSideSession(self.serializer.loads(raw), sid=sid)
+        return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if session.modified or session.new:
+            self.store.save(session.sid, self.serializer.dumps(dict(session)))
+        if session.new or self.should_set_cookie(app, session):
+            response.set_cookie(name, session.sid, httponly=self.get_cookie_httponly(app),
+                                secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app),
+                                domain=domain, path=path)
+
+
+def create_session_interface(backend, db_path=None):
+    """ 按名称创建会话接口；"cookie" 返回 None，表示沿用 Flask 默认的签名 cookie """
+    if backend == "cookie":
+        return None
+    if backend == "memory":
+        return ServerSideSessionInterface(MemorySessionStore())
+    if backend == "sqlite":
+        return ServerSideSessionInterface(SQLiteSessionStore(db_path))
+    raise ValueError(f"未知的会话存储: '{backend}'，可选: cookie, memory, sqlite")
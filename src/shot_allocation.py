@@ -0,0 +1,141 @@
+# 文件: src/shot_allocation.py
+#
+# 云端掌握度估计的自适应 shots 分配。
+# 我们只读取全 1 比特串这一个结果的概率，固定 2048 shots 对结论明显的会话是浪费，
+# 对概率很小的长会话又未必够。ShotEstimate 按轮累计每个窗口的测量结果:
+#   - 每轮每个窗口提交 increment 次测量，按 Wilson 区间估计该窗口全 1 概率的置信区间;
+#   - 掌握度 (各窗口估计的平均) 的区间取各窗口下界/上界的平均，比按独立误差合成更保守;
+#   - 区间两端落在 get_mastery_feedback 的同一档内即停止，否则继续下一轮，直到每个窗口都用满 max_shots;
+#   - 命中结果缓存的本地结果按精确值处理；缓存的云端结果按 (分数, 累计 shots) 还原为采样证据 (restore)，
+#     结论仍未确定时在此基础上继续采样，结束后把更新的累计值写回缓存 (updated)。
+# increment == max_shots 时退化为原来的固定 shots (只提交一轮)。
+
+import math
+from statistics import NormalDist
+
+try:
+    import config
+except ImportError:
+    class MockConfig:
+        TIANYAN_SHOT_CONFIDENCE = 0.95
+
+
+    config = MockConfig()
+
+
+def wilson_interval(successes, shots, z):
+    """ 二项分布成功率的 Wilson 区间，在 successes 为 0 或 shots 时仍然有意义 """
+    if shots <= 0:
+        return 0.0, 1.0
+    p = successes / shots
+    denominator = 1 + z * z / shots
+    center = (p + z * z / (2 * shots)) / denominator
+    half = z / denominator * math.sqrt(p * (1 - p) / shots + z * z / (4 * shots * shots))
+    return max(0.0, center - half), min(1.0, center + half)
+
+
+class ShotEstimate(object):
+    """
+    band(score) 返回分数所属的档位 (如 get_mastery_feedback(score)['level'])，用来判断结论是否已确定。
+    """
+
+    def __init__(self, num_windows, band, increment, max_shots, confidence=None):
+        self.band = band
+        self.increment = increment
+        self.max_shots = max(max_shots, increment)
+        self.z = NormalDist().inv_cdf((1 + (confidence or config.TIANYAN_SHOT_CONFIDENCE)) / 2)
+        self.successes = [0.0] * num_windows
+        self.shots = [0] * num_windows
+        self.exact = [None] * num_windows
+        self.restored_shots = [0] * num_windows
+
+    def set_exact(self, index, probability):
+        self.exact[index] = probability
+
+    def restore(self, index, probability, shots):
+        """ 载入缓存中的采样结果 (频率与累计 shots) """
+        self.add(index, probability, shots)
+        self.restored_shots[index] = shots
+
+    def updated(self):
+        """ 本次新采样过的窗口 (需要写回缓存) """
+        return [i for i in range(len(self.exact)) if self.exact[i] is None and self.shots[i] > self.restored_shots[i]]
+
+    def add(self, index, probability, shots):
+        """ 累计一轮结果；平台返回的是频率，乘以 shots 还原为成功次数 """
+        self.successes[index] += probability * shots
+        self.shots[index] += shots
+
+    def window_score(self, index):
+        if self.exact[index] is not None:
+            return self.exact[index]
+        return self.successes[index] / self.shots[index] if self.shots[index] else 0.0
+
+    def window_interval(self, index):
+        if self.exact[index] is not None:
+            return self.exact[index], self.exact[index]
+        return wilson_interval(self.successes[index], self.shots[index], self.z)
+
+    def window_scores(self):
+        return [self.window_score(i) for i in range(len(self.exact))]
+
+    def score(self):
+        """ 与 quantum.aggregate_window_scores 相同: 各窗口估计的平均 """
+        return sum(self.window_scores()) / len(self.exact)
+
+    def interval(self):
+        bounds = [self.window_interval(i) for i in range(len(self.exact))]
+        return sum(lo for lo, _ in bounds) / len(bounds), sum(hi for _, hi in bounds) / len(bounds)
+
+    def total_shots(self):
+        return sum(self.shots)
+
+    def sampled(self):
+        return any(self.shots)
+
+    def decided(self):
+        lo, hi = self.interval()
+        return self.band(lo) == self.band(hi)
+
+    def pending(self):
+        """ 还需要再采样一轮的窗口；结论已确定或预算用尽时为空 """
+        unsampled = [i for i in range(len(self.exact)) if self.exact[i] is None and not self.shots[i]]
+        if unsampled:
+            return unsampled
+        if self.decided():
+            return []
+        return [i for i in range(len(self.exact)) if self.exact[i] is None and self.shots[i] < self.max_shots]
+
+
+if __name__ == '__main__':
+    import random
+
+    from fake_tianyan import FakeTianYanPlatform
+    from qcis_compiler import compile_qcis
+    from quantum_backends import AnalyticBackend, CloudBackend
+    import quantum
+
+    def band(score):
+        return quantum.get_mastery_feedback(score)['level']
+
+    platform = FakeTianYanPlatform(latency=0, seed=0)
+    rng = random.Random(0)
+    total_shots = 0
+    print(f"{'答题数':<6}{'精确值':>10}{'估计':>10}{'区间':>22}{'shots':>8}{'轮数':>5}  档位一致")
+    # 链首取高分、其余取低分，使全 1 概率分布在各档位之间 (包括靠近档位边界的情况)
+    for n in (1, 2, 3, 4, 5, 6, 8, 10, 12, 16):
+        thetas = quantum.scores_to_thetas([rng.randint(10, 15)] + [rng.randint(0, 4) for _ in range(n - 1)])
+        estimate = ShotEstimate(1, band, *CloudBackend(adaptive=True).shot_plan())
+        rounds = 0
+        while estimate.pending():
+            rounds += 1
+            query_id = platform.submit_experiment(compile_qcis([(thetas, 0)]), num_shots=estimate.increment)
+            probabilities = CloudBackend.parse_probabilities(platform.query_experiment(query_id))
+            estimate.add(0, probabilities.get('1' * n, 0.0), estimate.increment)
+        exact = AnalyticBackend().all_ones_probability(thetas)
+        lo, hi = estimate.interval()
+        print(f"{n:<9}{exact:>10.4f}{estimate.score():>10.4f}{f'[{lo:.4f}, {hi:.4f}]':>22}{estimate.total_shots():>8}"
+              f"{rounds:>7}  {band(estimate.score()) == band(exact)}")
+        assert rounds <= config.TIANYAN_MAX_SHOT_ROUNDS
+        total_shots += estimate.total_shots()
+    print(f"--- 共用 {total_shots} shots，固定 {config.TIANYAN_NUM_SHOTS} shots 需要 {10 * config.TIANYAN_NUM_SHOTS} ---")
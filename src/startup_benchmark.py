@@ -0,0 +1,69 @@
+# 文件: src/startup_benchmark.py
+#
+# 启动耗时基准与回归检查。
+# 在子进程中以 `python -X importtime -c "import app"` 冷启动导入应用模块，解析导入耗时报告，
+# 列出最慢的模块，并检查重量级依赖 (cqlib 及其 sympy/networkx/... 依赖树、numpy、requests)
+# 没有在启动阶段被导入、总耗时没有超出预算。发现回归时以非零状态码退出，可直接接入 CI。
+# tests/test_startup.py 在测试套件中做同样的检查。
+#
+# 用法:
+#   python src/startup_benchmark.py [--module app] [--budget-ms 1000] [--top 15] [--repeat 3]
+
+import argparse
+import os
+import subprocess
+import sys
+
+# 这些模块必须在首次使用时才导入
+LAZY_MODULES = ("cqlib", "sympy", "networkx", "rustworkx", "matplotlib", "openqasm3", "numpy", "requests", "urllib3")
+
+DEFAULT_BUDGET_MS = 1000
+
+
+def measure_imports(module):
+    """ 返回 (总耗时毫秒, {模块名: (自身微秒, 累计微秒)}) """
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                               cwd=src_dir, capture_output=True, text=True, encoding="utf-8", errors="replace")
+    if completed.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败:\n{completed.stderr[-2000:]}")
+    timings = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+    if module not in timings:
+        raise RuntimeError(f"导入耗时报告中没有找到模块 {module}")
+    return timings[module][1] / 1000.0, timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="应用冷启动导入耗时基准")
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--repeat", type=int, default=3, help="重复次数，取最小值以降低噪声")
+    args = parser.parse_args(argv)
+
+    runs = [measure_imports(args.module) for _ in range(args.repeat)]
+    total_ms, timings = min(runs, key=lambda run: run[0])
+
+    print(f"冷启动导入 {args.module}: {total_ms:.1f} ms (取 {args.repeat} 次中的最小值)，预算 {args.budget_ms:.0f} ms")
+    print(f"{'累计(ms)':>10}{'自身(ms)':>10}  模块")
+    for name, (self_us, cumulative_us) in sorted(timings.items(), key=lambda item: -item[1][1])[:args.top]:
+        print(f"{cumulative_us / 1000:>10.1f}{self_us / 1000:>10.1f}  {name}")
+
+    failures = []
+    eager = sorted(name for name in timings if name.split(".")[0] in LAZY_MODULES and "." not in name)
+    if eager:
+        failures.append(f"以下模块应按需导入，却在启动时被导入: {', '.join(eager)}")
+    if total_ms > args.budget_ms:
+        failures.append(f"启动耗时 {total_ms:.1f} ms 超出预算 {args.budget_ms:.0f} ms")
+    for failure in failures:
+        print(f"!!! 回归: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
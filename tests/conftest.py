@@ -0,0 +1,7 @@
+# 应用模块是 src/ 下的平铺模块 (与 gunicorn src.app:app 的导入方式相同)
+import os
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
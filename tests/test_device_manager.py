@@ -0,0 +1,94 @@
+# 天衍设备路由: 用脚本化的设备列表 (fake_tianyan) 检查筛选、负载均衡、冷却、故障转移与退回固定设备。
+
+import pytest
+
+import config
+from device_manager import DeviceManager, NoDeviceAvailableError
+from fake_tianyan import FakeTianYanPlatform
+from rate_limit import UpstreamBusyError
+
+# 一台模拟器在维护，另一台模拟器、一台真机与一台未登记比特数的设备在运行
+DEVICES = [[1, "free", "under maintenance", "tianyan_swn"], [2, "free", "running", "tianyan_sw"],
+           [3, "paid", "running", "tianyan176"], [4, "free", "running", "unknown_device"]]
+
+
+@pytest.fixture(autouse=True)
+def qubits_map(monkeypatch):
+    monkeypatch.setattr(config, "MACHINE_QUBITS_MAP", {"tianyan_swn": 16, "tianyan_sw": 36, "tianyan176": 176})
+    monkeypatch.setattr(config, "TIANYAN_MACHINE_NAME", "tianyan_swn")
+
+
+def make_manager(policy, devices=DEVICES, failure_rate=None, **kwargs):
+    def platform_factory(machine_name):
+        return FakeTianYanPlatform(machine_name=machine_name, latency=0, devices=devices,
+                                   failure_rate=failure_rate or {})
+    return DeviceManager(platform_factory, policy=policy, cooldown=60, **kwargs), platform_factory
+
+
+def submit_attempt(platform_factory):
+    def attempt(machine_name):
+        platform = platform_factory(machine_name)
+        platform.query_experiment(platform.submit_experiment("RY Q0 1\nM Q0", num_shots=16))
+        return machine_name
+    return attempt
+
+
+@pytest.mark.parametrize("policy, num_qubits, expected", [
+    ("simulator_first", 4, "tianyan_sw"),
+    ("simulator_first", 40, "tianyan176"),  # 模拟器比特数不够
+    ("hardware_first", 4, "tianyan176"),
+    ("simulator_only", 40, None),
+    ("hardware_only", 200, None),
+    ("pinned", 4, "tianyan_swn"),
+])
+def test_choose_filters_by_status_qubits_and_policy(policy, num_qubits, expected):
+    manager, _ = make_manager(policy)
+    assert manager.choose(num_qubits) == expected
+
+
+def test_choose_prefers_least_loaded_device():
+    devices = [[1, "free", "running", "tianyan_swn"], [2, "free", "running", "tianyan_sw"]]
+    manager, _ = make_manager("simulator_first", devices=devices)
+    first = manager.choose(4)
+    manager._inflight[first] = 1
+    assert manager.choose(4) == ({"tianyan_sw", "tianyan_swn"} - {first}).pop()
+
+
+def test_failover_cools_down_failed_device():
+    manager, platform_factory = make_manager("hardware_first", failure_rate={"tianyan176": 1.0})
+    assert manager.run_with_failover(1, submit_attempt(platform_factory)) == "tianyan_sw"
+    assert manager.choose(1) == "tianyan_sw"  # 真机在冷却期
+    assert {device["name"]: device["cooling_down"] > 0 for device in manager.snapshot()}["tianyan176"]
+
+
+def test_all_devices_failing_raises_last_error():
+    manager, platform_factory = make_manager("simulator_only", failure_rate={"tianyan_sw": 1.0})
+    with pytest.raises(RuntimeError, match="注入的提交失败"):
+        manager.run_with_failover(1, submit_attempt(platform_factory))
+    with pytest.raises(NoDeviceAvailableError):
+        manager.run_with_failover(1, submit_attempt(platform_factory))
+
+
+def test_busy_upstream_does_not_cool_down_device():
+    # 天衍并发名额已满不是设备故障: 不换设备重试，也不把设备放入冷却期
+    manager, _ = make_manager("simulator_first")
+    tried = []
+
+    def attempt(machine_name):
+        tried.append(machine_name)
+        raise UpstreamBusyError("tianyan", "排队已满", 30)
+
+    with pytest.raises(UpstreamBusyError):
+        manager.run_with_failover(2, attempt)
+    assert tried == ["tianyan_sw"] and manager.choose(2) == "tianyan_sw"
+
+
+@pytest.mark.parametrize("devices", [[], [[1, "free", "running", "unknown_device"]],
+                                     [[1, "free", "calibration", "tianyan_sw"]]])
+def test_falls_back_to_configured_machine(devices):
+    # 拿不到设备列表，或列表中没有一台符合条件的设备时，都退回到 config.TIANYAN_MACHINE_NAME
+    manager, platform_factory = make_manager("simulator_first", devices=devices)
+    assert manager.choose(4) == "tianyan_swn"
+    assert manager.run_with_failover(4, submit_attempt(platform_factory)) == "tianyan_swn"
+    assert manager.choose(40) is None  # 已知比特数不够时不退回
+    assert manager.choose(4, exclude=("tianyan_swn",)) is None
@@ -0,0 +1,110 @@
+# 同步 (dify_api) 与异步 (dify_async) Dify 客户端，对本地假 Dify 服务 (fake_dify，支持 SSE) 发请求。
+
+import asyncio
+import time
+
+import pytest
+
+from dify_api import DifyClient, DifyError
+from dify_async import AsyncDifyClient
+from fake_dify import TRAILING_TEXT, start_fake_dify
+from question_parser import parse_question_package
+
+MODES = ("blocking", "streaming")
+
+
+@pytest.fixture
+def fake_dify():
+    servers = []
+
+    def start(**options):
+        server, api_url = start_fake_dify(**dict({"first_token_latency": 0.0, "chunk_delay": 0.0, "seed": 1},
+                                                 **options))
+        servers.append(server)
+        return server, api_url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def generate_async(api_url, *args, **kwargs):
+    async def call():
+        client = AsyncDifyClient(api_url=api_url, api_key="stub")
+        try:
+            return await client.generate_question(*args, **kwargs)
+        finally:
+            await client.aclose()
+    return asyncio.run(call())
+
+
+def generate_sync(api_url, *args, **kwargs):
+    return DifyClient(api_url=api_url, api_key="stub").generate_question(*args, **kwargs)
+
+
+CLIENTS = {"sync": generate_sync, "async": generate_async}
+
+
+def assert_question(result):
+    package, _ = parse_question_package(result["answer"])
+    assert package["correct_answer"] in package["options"]
+    assert result["conversation_id"]
+
+
+@pytest.mark.parametrize("client", CLIENTS)
+@pytest.mark.parametrize("mode", MODES)
+def test_both_modes_return_question(fake_dify, client, mode):
+    _, api_url = fake_dify()
+    result = CLIENTS[client](api_url, "自由落体", "user-1", response_mode=mode)
+    assert_question(result)
+    if mode == "blocking":
+        assert result["answer"].endswith(TRAILING_TEXT)
+
+
+@pytest.mark.parametrize("client", CLIENTS)
+def test_conversation_id_is_passed_through(fake_dify, client):
+    _, api_url = fake_dify()
+    result = CLIENTS[client](api_url, "自由落体", "user-1", conversation_id="conv-1", response_mode="streaming")
+    assert result["conversation_id"] == "conv-1"
+
+
+@pytest.mark.parametrize("client", CLIENTS)
+def test_streaming_returns_once_question_is_complete(fake_dify, client):
+    # 题目 JSON 与结尾的说明文字各一个分块，间隔 1 秒；题目 JSON 一完整就返回，不等这段文字
+    _, api_url = fake_dify(chunk_delay=1.0, chunk_size=1000)
+    started = time.perf_counter()
+    result = CLIENTS[client](api_url, "自由落体", "user-1", response_mode="streaming")
+    assert time.perf_counter() - started < 0.5
+    assert_question(result)
+    assert TRAILING_TEXT[:10] not in result["answer"]
+
+
+@pytest.mark.parametrize("client", CLIENTS)
+def test_sse_error_event_raises(fake_dify, client):
+    _, api_url = fake_dify(stream_error_rate=1.0, chunk_size=4)
+    with pytest.raises(DifyError, match="completion_request_error"):
+        CLIENTS[client](api_url, "自由落体", "user-1", response_mode="streaming")
+
+
+def test_sync_client_reuses_pooled_connection(fake_dify):
+    server, api_url = fake_dify()
+    client = DifyClient(api_url=api_url, api_key="stub")
+    for _ in range(3):
+        assert_question(client.generate_question("自由落体", "user-1", response_mode="blocking"))
+    assert server.connections == 1
+
+
+def test_async_client_reuses_pooled_connection(fake_dify):
+    server, api_url = fake_dify()
+
+    async def calls():
+        client = AsyncDifyClient(api_url=api_url, api_key="stub")
+        try:
+            for _ in range(3):
+                assert_question(await client.generate_question("自由落体", "user-1", response_mode="blocking"))
+        finally:
+            await client.aclose()
+
+    asyncio.run(calls())
+    assert server.connections == 1
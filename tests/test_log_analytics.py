@@ -0,0 +1,12 @@
+# 会话日志文件名 -> 开始时间: 新的文件名带随机后缀 (同一秒开始的会话各自一个文件)，旧文件名仍能解析。
+
+from datetime import datetime
+
+from log_analytics import session_started_at
+
+
+def test_session_started_at_accepts_unique_suffix():
+    expected = datetime(2025, 7, 8, 9, 40, 40).timestamp()
+    assert session_started_at("session_2025-07-08_09-40-40") == expected
+    assert session_started_at("session_2025-07-08_09-40-40_3f9a1c2b") == expected
+    assert session_started_at("session_unknown") is None
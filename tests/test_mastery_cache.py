@@ -0,0 +1,74 @@
+# 云端采样的窗口结果连同累计 shots 一起缓存，命中时还原为带置信区间的采样证据，而不是零宽度的精确值。
+
+import sqlite3
+
+import pytest
+
+import config
+import mastery_cache
+import quantum
+from mastery_cache import MasteryCache, make_cache_key
+from quantum_backends import CloudBackend
+
+
+@pytest.fixture
+def fresh_cache(monkeypatch):
+    cache = MasteryCache(max_size=16, ttl=3600)
+    monkeypatch.setattr(mastery_cache, "_cache", cache)
+    return cache
+
+
+def test_entries_keep_shots(tmp_path):
+    db_path = str(tmp_path / "cache.sqlite3")
+    cache = MasteryCache(max_size=16, ttl=3600, db_path=db_path)
+    cache.put("exact", 0.25)
+    cache.put("sampled", 0.5, shots=1024)
+    assert cache.get_entry("exact") == (0.25, None)
+    assert cache.get_entry("sampled") == (0.5, 1024)
+    assert cache.get("sampled") == 0.5
+    # 新实例只能从磁盘层读到
+    reopened = MasteryCache(max_size=16, ttl=3600, db_path=db_path)
+    assert reopened.get_entry("sampled") == (0.5, 1024)
+    assert reopened.stats()["disk_hits"] == 1
+
+
+def test_old_schema_is_cleared(tmp_path):
+    db_path = str(tmp_path / "cache.sqlite3")
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE mastery_cache (cache_key TEXT PRIMARY KEY, score REAL NOT NULL, created_at REAL NOT NULL)")
+    conn.execute("INSERT INTO mastery_cache VALUES ('old', 0.5, 1e12)")
+    conn.commit()
+    conn.close()
+    cache = MasteryCache(max_size=16, ttl=3600, db_path=db_path)
+    assert cache.get_entry("old") is None
+    cache.put("new", 0.5, shots=256)
+    assert cache.get_entry("new") == (0.5, 256)
+
+
+def test_cached_samples_restore_interval(fresh_cache, monkeypatch):
+    monkeypatch.setattr(config, "TIANYAN_SHOT_INCREMENT", 256)
+    monkeypatch.setattr(config, "TIANYAN_MAX_SHOT_ROUNDS", 4)
+    backend = CloudBackend(adaptive=True)
+    windows = [[12, 3, 2]]
+    key = make_cache_key(windows[0], backend.cache_tag())
+    fresh_cache.put(key, 0.5, shots=256)
+    estimate, keys = quantum.new_window_estimate(windows, backend)
+    assert keys == [key]
+    assert estimate.exact == [None] and estimate.shots == [256]
+    lo, hi = estimate.interval()
+    assert lo < 0.5 < hi
+    # 0.5 附近的区间跨过 "熟练应用" 的下界，结论未定，继续采样直到轮数上限
+    assert estimate.pending() == [0]
+    assert estimate.updated() == []
+    estimate.add(0, 0.5, 256)
+    assert estimate.updated() == [0]
+    quantum.cache_window_results(estimate, keys, estimate.updated())
+    assert fresh_cache.get_entry(key) == (0.5, 512)
+
+
+def test_round_cap_limits_shot_budget(monkeypatch):
+    monkeypatch.setattr(config, "TIANYAN_SHOT_INCREMENT", 256)
+    monkeypatch.setattr(config, "TIANYAN_MAX_SHOTS", 8192)
+    monkeypatch.setattr(config, "TIANYAN_MAX_SHOT_ROUNDS", 3)
+    assert CloudBackend(adaptive=True).shot_plan() == (256, 768)
+    assert CloudBackend(adaptive=False, num_shots=2048).shot_plan() == (2048, 2048)
@@ -0,0 +1,132 @@
+# QCIS 编译器与多会话打包: 本地执行编译结果 (单链与打包后的边缘概率) 必须与闭式解一致。
+
+import math
+import random
+
+import pytest
+
+import config
+from qcis_compiler import QCISTooLongError, compile_qcis, format_angle, max_submittable_qubits, qcis_template
+from quantum_backends import AnalyticBackend, StatevectorBackend, mastery_gate_list
+from quantum_batching import marginal_all_ones, pack_sessions
+
+TOLERANCE = 1e-9
+
+
+def random_thetas(rng, n):
+    return [round(rng.randint(0, 15) / 15.0 * math.pi, config.TIANYAN_ANGLE_PRECISION) for _ in range(n)]
+
+
+def joint_distribution(qcis, num_qubits):
+    """ 本地执行 QCIS，返回与天衍相同格式的 {比特串: 概率} (第 i 位即比特 i) """
+    probabilities = abs(StatevectorBackend().run_qcis(qcis, num_qubits)) ** 2
+    return {format(index, f'0{num_qubits}b'): float(p) for index, p in enumerate(probabilities)}
+
+
+@pytest.mark.parametrize("n", range(1, 11))
+def test_single_chain_matches_closed_form(n):
+    thetas = random_thetas(random.Random(n), n)
+    p_qcis = float(abs(StatevectorBackend().run_qcis(compile_qcis([(thetas, 0)]), n)[-1]) ** 2)
+    assert p_qcis == pytest.approx(AnalyticBackend().all_ones_probability(thetas), abs=TOLERANCE)
+
+
+@pytest.mark.parametrize("n", range(1, 9))
+def test_packed_chains_marginals_match_closed_form(n):
+    thetas = random_thetas(random.Random(n), n)
+    other = thetas[:2] + [math.pi / 3]
+    distribution = joint_distribution(compile_qcis([(thetas, 0), (other, n)]), n + 3)
+    for offset, chain in ((0, thetas), (n, other)):
+        assert marginal_all_ones(distribution, offset, len(chain)) == pytest.approx(
+            AnalyticBackend().all_ones_probability(chain), abs=TOLERANCE)
+
+
+def test_pack_then_compile_matches_closed_form():
+    rng = random.Random(0)
+    pending = [(f"s{i}", random_thetas(rng, length)) for i, length in enumerate((4, 7, 3, 2, 5))]
+    batch, rest = pack_sessions(pending, capacity=12)
+    distribution = joint_distribution(compile_qcis([(thetas, offset) for _, thetas, offset in batch]), 12)
+    for key, thetas, offset in batch:
+        assert marginal_all_ones(distribution, offset, len(thetas)) == pytest.approx(
+            AnalyticBackend().all_ones_probability(thetas), abs=TOLERANCE), key
+    assert [key for key, _, _ in batch] == ["s0", "s1"] and [key for key, _ in rest] == ["s2", "s3", "s4"]
+
+
+def test_pack_sessions_skips_sessions_that_do_not_fit():
+    pending = [("a", [0.1] * 5), ("b", [0.1] * 8), ("c", [0.1] * 3), ("d", [0.1] * 2)]
+    batch, rest = pack_sessions(pending, capacity=10)
+    assert [(key, offset) for key, _, offset in batch] == [("a", 0), ("c", 5), ("d", 8)]
+    assert [key for key, _ in rest] == ["b"]
+
+
+def test_pack_sessions_respects_max_sessions():
+    pending = [(key, [0.1]) for key in "abcd"]
+    batch, rest = pack_sessions(pending, capacity=10, max_sessions=2)
+    assert [key for key, _, _ in batch] == ["a", "b"] and [key for key, _ in rest] == ["c", "d"]
+
+
+def test_pack_sessions_empty_queue():
+    assert pack_sessions([], capacity=10) == ([], [])
+
+
+def test_marginal_all_ones():
+    distribution = {"110": 0.25, "111": 0.5, "011": 0.25}
+    assert marginal_all_ones(distribution, 0, 2) == pytest.approx(0.75)
+    assert marginal_all_ones(distribution, 1, 2) == pytest.approx(0.75)
+    assert marginal_all_ones(distribution, 0, 3) == pytest.approx(0.5)
+
+
+@pytest.mark.parametrize("theta, precision, text", [
+    (2.0, 12, "2"), (0.1, 12, "0.1"), (0.0, 6, "0"), (-1e-9, 6, "0"), (1e-7, 12, "0.0000001"),
+    (math.pi, 6, "3.141593"),
+])
+def test_format_angle_is_fixed_point(theta, precision, text):
+    assert format_angle(theta, precision) == text
+
+
+def test_template_measures_qubits_in_order():
+    lines = qcis_template(((2, 3), (1, 0))).splitlines()
+    assert [line for line in lines if line.startswith("M")] == ["M Q0", "M Q3", "M Q4"]
+    assert sum(line.count("{}") for line in lines) == 3
+
+
+def test_precision_is_lowered_to_fit_char_limit(monkeypatch):
+    thetas = [math.pi / 7] * 4
+    full = compile_qcis([(thetas, 0)])
+    monkeypatch.setattr(config, "TIANYAN_QCIS_MAX_CHARS", len(full) - 4)
+    shorter = compile_qcis([(thetas, 0)])
+    assert len(shorter) <= len(full) - 4
+    p_short = float(abs(StatevectorBackend().run_qcis(shorter, 4)[-1]) ** 2)
+    assert p_short == pytest.approx(AnalyticBackend().all_ones_probability(thetas), abs=1e-5)
+
+
+def test_too_long_circuit_raises(monkeypatch):
+    monkeypatch.setattr(config, "TIANYAN_QCIS_MAX_CHARS", 20)
+    with pytest.raises(QCISTooLongError):
+        compile_qcis([([math.pi / 7] * 4, 0)])
+
+
+def test_max_submittable_qubits_fits_worst_case():
+    n = max_submittable_qubits()
+    assert 0 < n <= config.TIANYAN_MACHINE_QUBITS
+    worst = [-(1 + 10 ** -config.TIANYAN_MIN_ANGLE_PRECISION) * 3] * n
+    assert len(compile_qcis([(worst, 0)])) <= config.TIANYAN_QCIS_MAX_CHARS
+
+
+def test_matches_cqlib_circuit():
+    cqlib = pytest.importorskip("cqlib")
+    thetas = [round(s / 15.0 * math.pi, config.TIANYAN_ANGLE_PRECISION) for s in (11, 6, 1, 4, 15, 0)]
+    circuit = cqlib.Circuit(list(range(config.TIANYAN_MACHINE_QUBITS)))
+    for gate, qubits, param in mastery_gate_list(thetas):
+        if gate == "RY":
+            circuit.ry(qubits[0], param)
+        elif gate == "H":
+            circuit.h(qubits[0])
+        else:
+            circuit.cz(qubits[0], qubits[1])
+    for i in range(len(thetas)):
+        circuit.measure(i)
+    # cqlib 会把角度折算到 (-pi, pi]，按模 2pi 比较
+    for ours, theirs in zip(compile_qcis([(thetas, 0)]).splitlines(), circuit.qcis.splitlines(), strict=True):
+        a, b = ours.split(), theirs.split()
+        assert a[:-1] == b[:-1]
+        assert a[-1] == b[-1] or abs(math.remainder(float(a[-1]) - float(b[-1]), 2 * math.pi)) < TOLERANCE
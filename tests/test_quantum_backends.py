@@ -0,0 +1,106 @@
+# analytic (闭式解)、statevector (本地态矢量模拟) 与云端电路的 QCIS 三者必须给出相同的全 1 概率。
+# 云端采样受 shot 噪声影响，这里在本地执行提交到云端的同一份 QCIS 文本。
+
+import math
+import random
+import time
+
+import pytest
+
+import config
+from quantum import calculate_mastery_from_log, extract_classic_scores, scores_to_thetas, split_windows
+from quantum_backends import AnalyticBackend, StatevectorBackend, CloudBackend
+
+TOLERANCE = 1e-9
+
+
+def random_scores(rng, n):
+    return [rng.randint(0, 15) for _ in range(n)]
+
+
+@pytest.mark.parametrize("n", range(1, 13))
+def test_backends_agree_on_all_ones_probability(n):
+    rng = random.Random(n)
+    statevector = StatevectorBackend()
+    for _ in range(5):
+        thetas = scores_to_thetas(random_scores(rng, n))
+        p_analytic = AnalyticBackend().all_ones_probability(thetas)
+        assert statevector.all_ones_probability(thetas) == pytest.approx(p_analytic, abs=TOLERANCE)
+        p_qcis = abs(statevector.run_qcis(CloudBackend.build_circuit(thetas), n)[-1]) ** 2
+        assert p_qcis == pytest.approx(p_analytic, abs=TOLERANCE)
+
+
+def test_extreme_angles():
+    # 综合分 0 (theta = 0) 让链首为 |0>，综合分 15 (theta = pi) 让链中任一比特的 cos^2 为 0
+    for scores in ([0], [15], [15, 15], [15, 0, 0], [8, 15, 3]):
+        thetas = scores_to_thetas(scores)
+        p_analytic = AnalyticBackend().all_ones_probability(thetas)
+        assert StatevectorBackend().all_ones_probability(thetas) == pytest.approx(p_analytic, abs=TOLERANCE)
+    assert AnalyticBackend().all_ones_probability(scores_to_thetas([15])) == pytest.approx(1.0)
+    assert AnalyticBackend().all_ones_probability([]) == StatevectorBackend().all_ones_probability([]) == 0.0
+
+
+def test_statevector_rejects_too_many_qubits():
+    with pytest.raises(ValueError):
+        StatevectorBackend(max_qubits=4).all_ones_probability([math.pi / 2] * 5)
+
+
+def test_windowed_sessions_agree(monkeypatch):
+    monkeypatch.setattr(config, "QUANTUM_CHUNK_SIZE", 6)
+    rng = random.Random(0)
+    session_log = [{"question_num": i + 1,
+                    "feature_3d": {"difficulty": rng.randint(1, 5),
+                                   "performance_code": rng.choice(["11", "10", "01", "00"])}}
+                   for i in range(20)]
+    analytic = calculate_mastery_from_log(session_log, backend="analytic")
+    statevector = calculate_mastery_from_log(session_log, backend="statevector")
+    assert analytic["windows"] == statevector["windows"] > 1
+    assert statevector["score"] == pytest.approx(analytic["score"], abs=TOLERANCE)
+
+
+def test_statevector_windows_fit_its_qubit_limit(monkeypatch):
+    # 默认窗口为单次云端提交的容量 (36 个比特)，超过态矢量模拟的上限时窗口按后端容量缩小
+    monkeypatch.setattr(config, "QUANTUM_CHUNK_SIZE", None)
+    monkeypatch.setattr(config, "STATEVECTOR_MAX_QUBITS", 8)
+    rng = random.Random(1)
+    session_log = [{"question_num": i + 1,
+                    "feature_3d": {"difficulty": rng.randint(1, 5),
+                                   "performance_code": rng.choice(["11", "10", "01", "00"])}}
+                   for i in range(12)]
+    result = calculate_mastery_from_log(session_log, backend="statevector")
+    windows = split_windows(extract_classic_scores(session_log), size=8)
+    expected = sum(AnalyticBackend().all_ones_probability(scores_to_thetas(w)) for w in windows) / len(windows)
+    assert result["windows"] == len(windows) == 2
+    assert result["score"] == pytest.approx(expected, abs=TOLERANCE)
+    assert "windows" not in calculate_mastery_from_log(session_log, backend="analytic")
+
+
+def test_tianyan_slot_only_held_during_platform_calls():
+    # 天衍并发名额只在提交与每次查询时占用，等待结果的间隔中释放给其他任务
+    from fake_tianyan import FakeTianYanPlatform
+    from rate_limit import get_upstream_limiter
+
+    limiter = get_upstream_limiter("tianyan")
+    platform = FakeTianYanPlatform(latency=60, seed=0)
+    backend = CloudBackend(machine_name="tianyan_swn", platform_factory=lambda name: platform)
+    _, query_id = backend.submit(scores_to_thetas([8, 3]))
+    assert limiter.active == 0
+    assert backend.fetch_probabilities(platform, query_id) is None
+    assert limiter.active == 0
+
+
+def test_blocking_cloud_call_releases_slot_while_waiting(monkeypatch):
+    from fake_tianyan import FakeTianYanPlatform
+    from rate_limit import get_upstream_limiter
+
+    monkeypatch.setattr(config, "QUANTUM_JOB_POLL_INITIAL", 0.05)
+    limiter = get_upstream_limiter("tianyan")
+    platform = FakeTianYanPlatform(latency=0.2, exact=True)
+    active_during_wait = []
+    sleep = time.sleep
+    monkeypatch.setattr(time, "sleep", lambda seconds: (active_during_wait.append(limiter.active), sleep(seconds)))
+    backend = CloudBackend(machine_name="tianyan_swn", platform_factory=lambda name: platform)
+    thetas = scores_to_thetas([8, 3])
+    probability = backend.all_ones_probability(thetas)
+    assert probability == pytest.approx(AnalyticBackend().all_ones_probability(thetas), abs=TOLERANCE)
+    assert active_during_wait and set(active_during_wait) == {0}
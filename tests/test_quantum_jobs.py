@@ -0,0 +1,120 @@
+# 云端量子任务: 用本地假天衍平台 (fake_tianyan) 代替真实平台，检查后台提交/轮询的行为。
+
+import time
+
+import pytest
+
+import config
+import mastery_cache
+from fake_tianyan import FakeTianYanPlatform
+from mastery_cache import MasteryCache
+from quantum_jobs import QuantumJobManager, SHARED_FIELDS, JOB_QUEUED, JOB_RUNNING, JOB_DONE
+from rate_limit import UpstreamBusyError
+
+
+@pytest.fixture(autouse=True)
+def fixed_shots(monkeypatch):
+    # 每个测试一个空的结果缓存；精确分布 + 固定 shots 时结果可与闭式解逐位比较
+    monkeypatch.setattr(mastery_cache, "_cache", MasteryCache(max_size=64, ttl=3600))
+    monkeypatch.setattr(config, "TIANYAN_ADAPTIVE_SHOTS", False)
+
+
+def make_log(*items):
+    return [{"question_num": i + 1, "feature_3d": {"difficulty": d, "performance_code": code}}
+            for i, (d, code) in enumerate(items)]
+
+
+def wait_for(manager, job_id, timeout=10):
+    deadline = time.time() + timeout
+    while manager.get(job_id)["status"] in (JOB_QUEUED, JOB_RUNNING):
+        assert time.time() < deadline, "任务没有在规定时间内结束"
+        time.sleep(0.02)
+    return manager.get(job_id)
+
+
+class BusyOncePlatform(FakeTianYanPlatform):
+    """ 第一次提交时天衍并发名额已满 """
+    busy = [True]
+
+    def submit_experiment(self, circuit, num_shots=2048, **kwargs):
+        if self.busy and self.busy.pop():
+            raise UpstreamBusyError("tianyan", "排队已满", 30)
+        return super().submit_experiment(circuit, num_shots, **kwargs)
+
+
+def test_busy_upstream_resubmits_instead_of_failing():
+    BusyOncePlatform.busy = [True]
+    manager = QuantumJobManager(poll_initial=0.02, poll_max=0.05, batch_window=0.01, platform_factory=lambda name:
+                                BusyOncePlatform(machine_name=name, latency=0, exact=True))
+    log = make_log((3, "11"), (2, "10"))
+    job = wait_for(manager, manager.submit(log, backend="cloud")["job_id"])
+    manager.shutdown()
+    assert BusyOncePlatform.busy == []
+    assert job["status"] == JOB_DONE
+    assert job["result"]["score"] == pytest.approx(manager.submit(log, backend="analytic")["result"]["score"])
+
+
+def exact_manager(**kwargs):
+    return QuantumJobManager(poll_initial=0.02, poll_max=0.05, batch_window=0.05, platform_factory=lambda name:
+                             FakeTianYanPlatform(machine_name=name, latency=0.1, exact=True), **kwargs)
+
+
+def test_cloud_jobs_return_immediately_and_match_closed_form():
+    manager = exact_manager()
+    logs = [make_log((3, "11"), (2, "10"), (1, "01")), make_log((1, "11"), (1, "01")), make_log((2, "00"))]
+    snapshots = [manager.submit(log, backend="cloud") for log in logs]
+    assert all(snapshot["status"] in (JOB_QUEUED, JOB_RUNNING) for snapshot in snapshots)
+    jobs = [wait_for(manager, snapshot["job_id"]) for snapshot in snapshots]
+    for job, log in zip(jobs, logs):
+        assert job["status"] == JOB_DONE
+        assert job["result"]["score"] == pytest.approx(manager.submit(log, backend="analytic")["result"]["score"])
+    # 同一攒批窗口内的三个会话合并为一次提交
+    assert len({job["query_id"] for job in jobs}) == 1
+    manager.shutdown()
+
+
+def test_snapshot_has_only_public_fields():
+    manager = exact_manager()
+    job_id = manager.submit(make_log((3, "11")), backend="cloud", owner="student-1", session_key="a.jsonl")["job_id"]
+    job = wait_for(manager, job_id)
+    manager.shutdown()
+    assert set(job) == set(SHARED_FIELDS)
+    assert job["owner"] == "student-1" and job["session_key"] == "a.jsonl"
+
+
+def test_identical_jobs_in_flight_are_coalesced():
+    manager = exact_manager()
+    log = make_log((5, "10"))
+    job_ids = [manager.submit(log, backend="cloud", owner=f"student-{i}")["job_id"] for i in range(4)]
+    jobs = [wait_for(manager, job_id) for job_id in job_ids]
+    manager.shutdown()
+    assert {job["status"] for job in jobs} == {JOB_DONE}
+    assert len({job["query_id"] for job in jobs}) == 1
+    assert len({job["result"]["score"] for job in jobs}) == 1
+    assert [job["owner"] for job in jobs] == [f"student-{i}" for i in range(4)]
+
+
+def test_too_many_pending_jobs_are_rejected():
+    manager = QuantumJobManager(max_pending=2, batch_window=0.05, poll_initial=0.02, poll_max=0.05,
+                                platform_factory=lambda name: FakeTianYanPlatform(machine_name=name, latency=60))
+    for difficulty in (1, 2):
+        manager.submit(make_log((difficulty, "11")), backend="cloud")
+    with pytest.raises(UpstreamBusyError):
+        manager.submit(make_log((3, "11")), backend="cloud")
+    # 与执行中的任务相同的请求跟随它，不占用新的名额
+    assert manager.submit(make_log((1, "11")), backend="cloud")["status"] in (JOB_QUEUED, JOB_RUNNING)
+    manager.shutdown(wait=False)
+
+
+def test_snapshots_are_shared_across_workers(tmp_path):
+    # 两个管理器 (相当于两个 gunicorn worker 进程) 共用一个任务表
+    db_path = str(tmp_path / "quantum_jobs.sqlite3")
+    worker_a, worker_b = exact_manager(db_path=db_path), exact_manager(db_path=db_path)
+    job_id = worker_a.submit(make_log((4, "01")), backend="cloud", owner="student-1")["job_id"]
+    assert worker_b.get(job_id)["status"] in (JOB_QUEUED, JOB_RUNNING)
+    shared = wait_for(worker_b, job_id)
+    assert shared == worker_a.get(job_id)
+    assert shared["status"] == JOB_DONE and shared["owner"] == "student-1"
+    assert worker_b.get("missing") is None
+    worker_a.shutdown()
+    worker_b.shutdown()
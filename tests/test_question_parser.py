@@ -0,0 +1,80 @@
+# 题目 JSON 的提取、校验与本地修复 (question_parser)。
+
+import json
+
+import pytest
+
+from question_parser import (JsonObjectScanner, QuestionParseError, normalize_difficulty, parse_question_package)
+
+GOOD = {"question": "自由落体的加速度约为?", "options": {"A": "9.8 m/s²", "B": "1 m/s²"},
+        "correct_answer": "A", "difficulty": 2, "explanation": "g ≈ 9.8 m/s²"}
+TEXT = json.dumps(GOOD, ensure_ascii=False)
+
+
+def dumps(**changes):
+    return json.dumps(dict(GOOD, **changes), ensure_ascii=False)
+
+
+@pytest.mark.parametrize("raw, repair", [
+    (TEXT + "\n\n希望对你有帮助 {如有疑问请追问}", "none"),
+    ("```json\n" + TEXT[:-1] + ",\n}\n```", "trailing_comma"),
+    (TEXT.replace("g ≈", "g\n≈"), "control_chars"),
+    (str(GOOD), "python_literal"),
+    ('格式示例: {"question": "..."}\n' + TEXT, "none"),
+    (TEXT[:TEXT.index('"explanation"') + 20], "truncated"),
+    (dumps(options=["A. 9.8 m/s²", "B. 1 m/s²"], correct_answer="A.", difficulty="2.0"), "none"),
+    (dumps(correct_answer="9.8 m/s²"), "none"),
+    (dumps(correct_answer="(A)"), "none"),
+], ids=["trailing_text", "code_block", "raw_newline", "single_quotes", "example_first", "truncated", "loose",
+        "answer_as_text", "answer_in_parens"])
+def test_repairs(raw, repair):
+    package, used = parse_question_package(raw)
+    assert used == repair
+    assert package["correct_answer"] == "A" and package["options"]["A"] == "9.8 m/s²"
+    assert package["difficulty"] == 2
+
+
+@pytest.mark.parametrize("raw, reason", [
+    ("抱歉，我暂时无法生成题目。", "没有 JSON"),
+    (dumps(correct_answer="E"), "不在选项"),
+    ('{"question": "?"}', "缺少字段"),
+    (dumps(difficulty=7), "超出"),
+    (dumps(difficulty=0), "超出"),
+    (dumps(options={"A": "唯一选项"}), "少于 2 个"),
+    (dumps(question="  "), "question 为空"),
+    (None, "不是字符串"),
+])
+def test_rejections(raw, reason):
+    with pytest.raises(QuestionParseError, match=reason):
+        parse_question_package(raw)
+
+
+@pytest.mark.parametrize("value, expected", [(3, 3), ("3", 3), (3.0, 3), (" 4.4 ", 4), (1, 1), (5, 5)])
+def test_normalize_difficulty(value, expected):
+    assert normalize_difficulty(value) == expected
+
+
+@pytest.mark.parametrize("value", [True, "难", None, 6, -1, "5.6"])
+def test_normalize_difficulty_rejects(value):
+    with pytest.raises(QuestionParseError):
+        normalize_difficulty(value)
+
+
+def test_scanner_incremental_matches_whole_text():
+    raw = TEXT + "\n\n希望对你有帮助 {如有疑问请追问}"
+    scanner = JsonObjectScanner()
+    pieces = [obj for char in raw for obj in scanner.feed(char)]
+    assert pieces == scanner.objects == [TEXT, "{如有疑问请追问}"]
+    assert scanner.first_end == len(TEXT)
+    assert scanner.unfinished() is None
+
+
+def test_scanner_ignores_braces_in_strings_and_stray_closers():
+    scanner = JsonObjectScanner()
+    assert scanner.feed('] } {"a": "x}{\\"y", "b": [1, {"c": 2}]} tail') == ['{"a": "x}{\\"y", "b": [1, {"c": 2}]}']
+
+
+def test_scanner_closes_truncated_object():
+    scanner = JsonObjectScanner()
+    scanner.feed('{"a": [1, 2,')
+    assert json.loads(scanner.unfinished()) == {"a": [1, 2]}
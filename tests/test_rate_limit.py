@@ -0,0 +1,159 @@
+# 按用户令牌桶与上游并发上限 (rate_limit)。
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import rate_limit
+from rate_limit import (AsyncConcurrencyLimiter, ConcurrencyLimiter, TokenBucketLimiter, UpstreamBusyError,
+                        get_upstream_limiter)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_token_bucket_allows_burst_then_waits(clock):
+    bucket = TokenBucketLimiter(rate=1.0, burst=5)
+    assert [bucket.acquire("student-1") for _ in range(5)] == [0.0] * 5
+    assert bucket.acquire("student-1") == pytest.approx(1.0)
+    # 被拒绝的请求不扣减令牌: 等够时间后立即放行
+    clock[0] += 1.0
+    assert bucket.acquire("student-1") == 0.0
+    assert bucket.acquire("student-1") == pytest.approx(1.0)
+
+
+def test_token_bucket_keys_are_independent(clock):
+    bucket = TokenBucketLimiter(rate=0.5, burst=2)
+    bucket.acquire("student-1")
+    bucket.acquire("student-1")
+    assert bucket.acquire("student-1") == pytest.approx(2.0)
+    assert bucket.acquire("student-2") == 0.0
+
+
+def test_token_bucket_refill_is_capped_at_burst(clock):
+    bucket = TokenBucketLimiter(rate=1.0, burst=2)
+    bucket.acquire("student-1")
+    clock[0] += 3600
+    assert [bucket.acquire("student-1") for _ in range(3)] == [0.0, 0.0, pytest.approx(1.0)]
+
+
+def test_token_bucket_evicts_least_recently_used_keys(clock):
+    bucket = TokenBucketLimiter(rate=1.0, burst=1, max_keys=2)
+    for key in ("a", "b", "c"):
+        bucket.acquire(key)
+    # "a" 被淘汰，再次出现时桶是满的
+    assert bucket.acquire("a") == 0.0
+    assert bucket.acquire("c") == pytest.approx(1.0)
+
+
+def run_concurrently(limiter, calls, hold):
+    """ 同时发起 calls 个调用，每个占用 slot hold 秒；返回 (结果列表, 最大并发数) """
+    active, peak, lock = [0], [0], threading.Lock()
+
+    def call(_):
+        try:
+            with limiter.slot():
+                with lock:
+                    active[0] += 1
+                    peak[0] = max(peak[0], active[0])
+                time.sleep(hold)
+                with lock:
+                    active[0] -= 1
+            return "ok"
+        except UpstreamBusyError as e:
+            return e
+
+    with ThreadPoolExecutor(calls) as pool:
+        return list(pool.map(call, range(calls))), peak[0]
+
+
+def test_concurrency_limiter_rejects_when_queue_is_full():
+    limiter = ConcurrencyLimiter("demo", max_concurrent=2, max_queue=3, queue_timeout=5)
+    outcomes, peak = run_concurrently(limiter, 10, hold=0.2)
+    rejected = [o for o in outcomes if o != "ok"]
+    assert outcomes.count("ok") == 5 and peak == 2
+    assert all(e.upstream == "demo" and e.retry_after == 5 for e in rejected)
+    assert limiter.active == limiter.waiting == 0
+
+
+def test_concurrency_limiter_rejects_after_queue_timeout():
+    limiter = ConcurrencyLimiter("demo", max_concurrent=1, max_queue=5, queue_timeout=0.1)
+    release = threading.Event()
+
+    def hold():
+        with limiter.slot():
+            release.wait(5)
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    while limiter.active == 0:
+        time.sleep(0.01)
+    started = time.perf_counter()
+    with pytest.raises(UpstreamBusyError, match="排队超时"):
+        with limiter.slot():
+            pass
+    assert time.perf_counter() - started < 1.0
+    release.set()
+    holder.join()
+    with limiter.slot():
+        assert limiter.active == 1
+
+
+def test_concurrency_limiter_releases_slot_on_error():
+    limiter = ConcurrencyLimiter("demo", max_concurrent=1, max_queue=0, queue_timeout=1)
+    with pytest.raises(KeyError):
+        with limiter.slot():
+            raise KeyError("boom")
+    with limiter.slot():
+        pass
+    assert limiter.active == 0
+
+
+def test_async_limiter_matches_threaded_semantics():
+    async def main():
+        limiter = AsyncConcurrencyLimiter("demo", max_concurrent=2, max_queue=3, queue_timeout=5)
+        active, peak = [0], [0]
+
+        async def call():
+            try:
+                async with limiter.slot():
+                    active[0] += 1
+                    peak[0] = max(peak[0], active[0])
+                    await asyncio.sleep(0.05)
+                    active[0] -= 1
+                return "ok"
+            except UpstreamBusyError:
+                return "busy"
+
+        outcomes = await asyncio.gather(*(call() for _ in range(10)))
+        return outcomes, peak[0], limiter.waiting
+
+    outcomes, peak, waiting = asyncio.run(main())
+    assert outcomes.count("ok") == 5 and peak == 2 and waiting == 0
+
+
+def test_async_limiter_rejects_after_queue_timeout():
+    async def main():
+        limiter = AsyncConcurrencyLimiter("demo", max_concurrent=1, max_queue=5, queue_timeout=0.05)
+        async with limiter.slot():
+            with pytest.raises(UpstreamBusyError, match="排队超时"):
+                async with limiter.slot():
+                    pass
+        async with limiter.slot():
+            return limiter.waiting
+
+    assert asyncio.run(main()) == 0
+
+
+def test_upstream_limiters_are_shared_singletons():
+    assert get_upstream_limiter("tianyan") is get_upstream_limiter("tianyan")
+    assert get_upstream_limiter("dify") is not get_upstream_limiter("dify_prefetch")
+    with pytest.raises(ValueError):
+        get_upstream_limiter("openai")
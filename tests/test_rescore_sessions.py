@@ -0,0 +1,39 @@
+# 批量重新评分的向量化掌握度必须与在线评分 (quantum.calculate_mastery_from_log) 的分窗结果一致。
+
+import random
+
+import numpy as np
+import pytest
+
+import config
+import quantum
+from rescore_sessions import vectorized_mastery
+
+
+def padded(sessions):
+    lengths = np.array([len(scores) for scores in sessions], dtype=np.int64)
+    matrix = np.zeros((len(sessions), max(int(lengths.max()), 1)), dtype=np.int64)
+    for row, scores in enumerate(sessions):
+        matrix[row, :len(scores)] = scores
+    return matrix, lengths
+
+
+@pytest.mark.parametrize("size, stride", [(6, 3), (6, 4), (5, 1), (8, 8), (12, 5), (1, 1)])
+def test_vectorized_mastery_matches_live_windows(monkeypatch, size, stride):
+    monkeypatch.setattr(config, "QUANTUM_CHUNK_SIZE", size)
+    monkeypatch.setattr(config, "QUANTUM_CHUNK_STRIDE", stride)
+    rng = random.Random(size * 100 + stride)
+    sessions = [[rng.randint(0, 15) for _ in range(rng.randint(0, 30))] for _ in range(40)]
+    matrix, lengths = padded(sessions)
+    mastery, num_windows = vectorized_mastery(matrix, lengths, size, stride)
+    for row, scores in enumerate(sessions):
+        if not scores:
+            assert mastery[row] == 0.0
+            continue
+        session_log = [{"question_num": i + 1,
+                        "feature_3d": {"difficulty": {0: 1, 1: 2, 2: 3, 3: 4}[s >> 2],
+                                       "performance_code": format(s & 0b11, "02b")}}
+                       for i, s in enumerate(scores)]
+        live = quantum.calculate_mastery_from_log(session_log, backend="analytic")
+        assert mastery[row] == pytest.approx(live["score"], abs=1e-12)
+        assert num_windows[row] == live.get("windows", 1)
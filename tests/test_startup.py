@@ -0,0 +1,11 @@
+# 启动回归检查 (见 src/startup_benchmark.py): 在子进程中冷启动导入 app，重量级依赖必须按需导入。
+
+from startup_benchmark import DEFAULT_BUDGET_MS, LAZY_MODULES, measure_imports
+
+
+def test_app_import_is_lazy_and_within_budget():
+    total_ms, timings = measure_imports("app")
+    eager = sorted(name for name in timings if name.split(".")[0] in LAZY_MODULES)
+    assert not eager, f"以下模块应按需导入，却在启动时被导入: {', '.join(eager)}"
+    # 测试机的负载不稳定，预算放宽到基准脚本默认值的 3 倍，只拦截明显的回归
+    assert total_ms < 3 * DEFAULT_BUDGET_MS